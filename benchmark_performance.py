@@ -89,5 +89,21 @@ def benchmark():
     print("-" * 40)
     print(f"Total Loop  : {np.mean(vst_times) + np.mean(bpg_times) + np.mean(inv_vst_times):.4f} ms")
 
+    # Encoder presets (bpgenc -m / -e): encode time vs stream size at the same Q
+    print("\nEncoder presets (encode only, q=30):")
+    print("-" * 40)
+    vst_img = vst.forward(image)
+    for name, settings in config.encoder.presets.items():
+        try:
+            codec = bpg.with_settings(**settings)
+            times, size = [], 0
+            for _ in range(10):
+                t0 = time.perf_counter()
+                size = codec.encode(vst_img, q=30).size_bytes
+                times.append((time.perf_counter() - t0) * 1000)
+            print(f"{name:<10}: {np.median(times):9.2f} ms  {size / 1024:8.2f} kB  {settings or '(bpgenc defaults)'}")
+        except RuntimeError as e: # e.g. 'jctvc' missing from the build
+            print(f"{name:<10}: unavailable ({str(e).strip()[:60]})")
+
 if __name__ == "__main__":
     benchmark()
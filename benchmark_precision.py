@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import numpy as np
+from src.config import AppConfig, VSTConfig
+
+# Precision check: the full analysis in float32 against the float64 reference on the
+# same input. Every curve point of PSNR, PSNR-HVS-M and SSIM must stay within the
+# tolerances below and both domains must pick the same OOP. Exits non-zero otherwise,
+# so it can guard changes to the loader, VST, codec restore and metric kernels.
+
+TOLERANCES = {'psnr': 1e-2, 'psnr_hvsm': 1e-2, 'ssim': 1e-4} # Max |float32 - float64| per point
+METRICS = ['psnr', 'psnr_hvsm', 'ssim', 'mse_codec']
+
+
+def synthetic_inputs(args) -> dict:
+    """One seeded float64 draw of the synthetic scene, fed unchanged to both precisions."""
+    from src.data_loader import SyntheticGenerator
+
+    clean, noised = SyntheticGenerator.get_data(args.noise, tuple(args.shape), rng=np.random.default_rng(args.seed))
+    return {'original': clean, 'noised': noised}
+
+
+def run(precision: str, args, arrays=None):
+    """Full analysis in `precision`, on the files or (arrays given) on the in-memory inputs."""
+    from src.app_logic import AnalysisController
+
+    controller = AnalysisController(args.bpg_path, precision=precision)
+    controller.runner.metrics_to_compute = list(METRICS)
+    if arrays is not None:
+        controller.arrays.update(arrays) # Each controller casts them to its own precision
+        source, noised, original = 'array', 'noised', 'original'
+    else:
+        source, noised, original = 'file', args.noised, args.original
+    q = args.q
+    return controller.run_analysis(source, args.noise, noised, original, args.vst_a, args.vst_b,
+                                   q[0], q[-1], q[1] - q[0] if len(q) > 1 else 1, oop_metric=args.oop_metric)
+
+
+def compare(ref, low) -> list:
+    """Failures of `low` against the reference result (empty = within tolerance)."""
+    failures = []
+    print(f"{'domain':<8} {'metric':<10} {'max |delta|':>12} {'tolerance':>10}")
+    for domain in ['linear', 'vst']:
+        a, b = ref.curves[domain], low.curves[domain]
+        if not np.array_equal(a['q'], b['q']):
+            failures.append(f"{domain}: swept Qs differ ({list(a['q'])} vs {list(b['q'])})")
+            continue
+        for metric, tol in TOLERANCES.items():
+            if metric not in a: continue
+            delta = float(np.max(np.abs(np.asarray(a[metric], dtype=np.float64) - np.asarray(b[metric], dtype=np.float64))))
+            print(f"{domain:<8} {metric:<10} {delta:>12.2e} {tol:>10.0e}")
+            if not delta <= tol:
+                failures.append(f"{domain} {metric}: max |delta| {delta:.3e} > {tol:.0e}")
+        q_ref, q_low = ref.oop_points[domain].get('q'), low.oop_points[domain].get('q')
+        print(f"{domain:<8} OOP Q: float64 {q_ref}, float32 {q_low}")
+        if q_ref != q_low:
+            failures.append(f"{domain}: OOP Q {q_low} (float32) != {q_ref} (float64)")
+    return failures
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="float32 vs float64 metric deltas and OOPs")
+    p.add_argument('--noised', default=os.path.join('data', 'NOISED_2.png'))
+    p.add_argument('--original', default=os.path.join('data', 'ORIGINAL_2.png'))
+    p.add_argument('--q', type=int, nargs='+', default=[20, 24, 28, 32, 36, 40, 44], help="Evenly spaced Q values to sweep")
+    p.add_argument('--oop-metric', default='psnr', choices=['psnr', 'psnr_hvsm'])
+    p.add_argument('--bpg-path', default=AppConfig().bpg_path)
+    p.add_argument('--noise', type=float, default=0.25, help="Noise level of the synthetic fallback")
+    p.add_argument('--shape', type=int, nargs=2, default=[400, 400], help="Size of the synthetic fallback")
+    p.add_argument('--seed', type=int, default=0, help="Speckle seed of the synthetic fallback")
+    p.add_argument('--vst-a', type=float, default=VSTConfig.a)
+    p.add_argument('--vst-b', type=float, default=VSTConfig.b)
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    arrays = None
+    if not os.path.exists(args.noised):
+        print(f"{args.noised} not found, using the synthetic scene")
+        arrays = synthetic_inputs(args)
+    ref, low = run('float64', args, arrays), run('float32', args, arrays)
+    failures = compare(ref, low)
+    print("-" * 46)
+    if failures:
+        for f in failures: print(f"FAIL {f}")
+        sys.exit(1)
+    print("float32 matches the float64 reference within tolerance")
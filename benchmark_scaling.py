@@ -0,0 +1,179 @@
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from src.config import AppConfig, VSTConfig
+
+# Scaling benchmark: the full analysis (both sweeps, OOP selection and images) on
+# synthetic scenes of growing size, under several thread counts. Each configuration
+# runs in a fresh interpreter, so the peak RSS is that run's own. Wall time, per-stage
+# time, peak memory and throughput are tabulated and plotted on log-log axes against
+# the pixel count; the fitted slopes should stay near 1 (the chain is O(N) in pixels),
+# a larger one points at a complexity regression.
+
+DEFAULT_SIZES = [256, 512, 1024, 2048, 4096]  # Up to 16384 (16k x 16k)
+DEFAULT_THREADS = sorted({1, os.cpu_count() or 1})
+SLOPE_WARN = 1.15
+
+
+def run_child(args) -> dict:
+    """One configuration in this process. Returns the measurements."""
+    from src.app_logic import AnalysisController
+    from src.memory import TRACKER, peak_rss
+    from src.psnr_hvsm import set_metric_threads
+
+    set_metric_threads(args.threads)
+    TRACKER.set_mode(args.memory)
+    controller = AnalysisController(args.bpg_path, precision=args.precision)
+    presets = AppConfig().encoder
+    controller.set_encoder(presets.settings(args.sweep_preset), presets.settings(args.final_preset))
+    filter_params = {'n_workers': args.threads} if args.filter != 'none' else None
+
+    q_rng = args.q
+    def run():
+        return controller.run_analysis('gen', args.noise, '', '', args.vst_a, args.vst_b,
+                                       q_rng[0], q_rng[-1], q_rng[1] - q_rng[0] if len(q_rng) > 1 else 1,
+                                       pre_filter=args.filter, filter_params=filter_params)
+
+    # Warm-up on a small scene: lazy imports and first-call costs stay out of the timing
+    controller.gen_shape = (64, 64)
+    run()
+    controller.gen_shape = (args.size, args.size)
+    t0 = time.perf_counter()
+    result = run()
+    wall = time.perf_counter() - t0
+    n_scored = sum(len(c.get('q', [])) for c in result.curves.values())
+    pixels = args.size * args.size
+    return {
+        'size': args.size, 'threads': args.threads, 'pixels': pixels, 'wall_s': wall,
+        'peak_rss_mb': peak_rss() / 1024 ** 2,
+        'mp_per_s': pixels * n_scored / wall / 1e6,  # Megapixels encoded + scored per second
+        'stages': {k: v for k, v in result.memory.items() if k != 'process'},
+    }
+
+
+def measure(size: int, threads: int, args) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', '--sizes', str(size), '--threads', str(threads),
+           '--q', *map(str, args.q), '--bpg-path', args.bpg_path, '--precision', args.precision,
+           '--filter', args.filter, '--memory', args.memory,
+           '--sweep-preset', args.sweep_preset, '--final-preset', args.final_preset, '--noise', str(args.noise),
+           '--vst-a', str(args.vst_a), '--vst-b', str(args.vst_b)]
+    res = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if res.returncode != 0:
+        raise RuntimeError(f"Run {size}x{size} / {threads} threads failed: {res.stderr.strip()}")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def loglog_slope(pixels, values) -> float:
+    """Exponent k of values ~ pixels^k (least squares on log-log)."""
+    if len(pixels) < 2: return float('nan')
+    return float(np.polyfit(np.log(pixels), np.log(values), 1)[0])
+
+
+def plot(rows, path: str):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4.5))
+    for threads in sorted({r['threads'] for r in rows}):
+        sel = sorted((r for r in rows if r['threads'] == threads), key=lambda r: r['pixels'])
+        px = np.array([r['pixels'] for r in sel], dtype=float)
+        for ax, col in zip(axes, ['wall_s', 'peak_rss_mb', 'mp_per_s']):
+            ax.plot(px, [r[col] for r in sel], 'o-', label=f'{threads} thread(s)')
+    for ax, col, title in zip(axes, ['wall_s', 'peak_rss_mb'], ['Wall time (s)', 'Peak RSS (MB)']):
+        # O(N) reference through the smallest measurement
+        ref = min(rows, key=lambda r: (r['pixels'], r[col]))
+        px = np.array(sorted({r['pixels'] for r in rows}), dtype=float)
+        ax.plot(px, ref[col] * px / ref['pixels'], 'k--', alpha=0.5, label='O(N)')
+        ax.set_title(title)
+    axes[2].set_title('Throughput (MP/s)')
+    for ax in axes:
+        ax.set_xscale('log')
+        ax.set_yscale('log' if ax is not axes[2] else 'linear')
+        ax.set_xlabel('Pixels')
+        ax.grid(True, which='both', alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def benchmark(args):
+    rows = []
+    print(f"Scaling benchmark: sizes {args.sizes}, threads {args.threads}, Q {args.q}, {args.precision}, "
+          f"encoder {args.sweep_preset} / {args.final_preset}")
+    print("-" * 78)
+    print(f"{'size':>7} {'threads':>7} {'wall (s)':>10} {'peak (MB)':>10} {'MP/s':>8}  slowest stages")
+    for size in args.sizes:
+        for threads in args.threads:
+            r = measure(size, threads, args)
+            rows.append(r)
+            slow = sorted(r['stages'].items(), key=lambda kv: -kv[1].get('seconds', 0))[:3]
+            slow = ', '.join(f"{k} {v.get('seconds', 0):.2f}s" for k, v in slow)
+            print(f"{size:>7} {threads:>7} {r['wall_s']:>10.2f} {r['peak_rss_mb']:>10.1f} {r['mp_per_s']:>8.2f}  {slow}")
+    print("-" * 78)
+
+    # Complexity: log-log slope per thread count (and per stage)
+    for threads in args.threads:
+        sel = [r for r in rows if r['threads'] == threads]
+        px = [r['pixels'] for r in sel]
+        k_t = loglog_slope(px, [r['wall_s'] for r in sel])
+        k_m = loglog_slope(px, [r['peak_rss_mb'] for r in sel])
+        flag = '  <-- super-linear, check for a regression' if k_t > SLOPE_WARN else ''
+        print(f"{threads} thread(s): time ~ N^{k_t:.2f}, memory ~ N^{k_m:.2f}{flag}")
+        stages = set().union(*(r['stages'] for r in sel))
+        for stage in sorted(stages):
+            pts = [(r['pixels'], r['stages'][stage]['seconds']) for r in sel
+                   if stage in r['stages'] and r['stages'][stage].get('seconds', 0) > 0]
+            k = loglog_slope(*zip(*pts)) if len(pts) > 1 else float('nan')
+            if k > SLOPE_WARN: print(f"    stage {stage}: time ~ N^{k:.2f}  <-- super-linear")
+
+    os.makedirs(args.out, exist_ok=True)
+    csv_path = os.path.join(args.out, 'scaling.csv')
+    stage_names = sorted(set().union(*(r['stages'] for r in rows)))
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['size', 'threads', 'pixels', 'wall_s', 'peak_rss_mb', 'mp_per_s',
+                         *[f'{s}_s' for s in stage_names], *[f'{s}_peak_mb' for s in stage_names]])
+        for r in rows:
+            st = r['stages']
+            writer.writerow([r['size'], r['threads'], r['pixels'], f"{r['wall_s']:.4f}", f"{r['peak_rss_mb']:.1f}",
+                             f"{r['mp_per_s']:.3f}",
+                             *[f"{st.get(s, {}).get('seconds', 0):.4f}" for s in stage_names],
+                             *[f"{st.get(s, {}).get('peak_mb', 0):.1f}" for s in stage_names]])
+    plot(rows, os.path.join(args.out, 'scaling.png'))
+    print(f"Saved {csv_path} and {os.path.join(args.out, 'scaling.png')}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Scaling of the analysis with image size and thread count")
+    p.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Scene edge lengths (square)")
+    p.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS, help="Metric / filter thread counts")
+    p.add_argument('--q', type=int, nargs='+', default=[20, 30, 40], help="Evenly spaced Q values to sweep")
+    p.add_argument('--bpg-path', default='bpg-0.9.8-win64')
+    p.add_argument('--precision', default='float64', choices=['float64', 'float32'])
+    p.add_argument('--filter', default='none', help="Registered pre-filter (e.g. 'lee')")
+    p.add_argument('--sweep-preset', default='default', help="Encoder preset of the sweeps (see EncoderConfig)")
+    p.add_argument('--final-preset', default='default', help="Encoder preset of the OOP re-encode")
+    p.add_argument('--memory', default='rss', choices=['rss', 'tracemalloc'],
+                   help="Per-stage tracking ('tracemalloc' is exact but slows the run)")
+    p.add_argument('--noise', type=float, default=0.25)
+    p.add_argument('--vst-a', type=float, default=VSTConfig.a)
+    p.add_argument('--vst-b', type=float, default=VSTConfig.b)
+    p.add_argument('--out', default=os.path.join('temp', 'scaling'))
+    p.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        args.size, args.threads = args.sizes[0], args.threads[0]
+        print(json.dumps(run_child(args)))
+    else:
+        benchmark(args)
@@ -0,0 +1,53 @@
+import subprocess
+import sys
+import numpy as np
+
+# Entry points a worker / CLI / notebook would import
+MODULES = [
+    'src.config',
+    'src.transform',
+    'src.codec',
+    'src.experiments',
+    'src.app_logic',
+    'src.ui',
+    'src.ui.main',
+]
+
+# Heavy dependencies that should only load when actually used
+HEAVY = ['matplotlib.pyplot', 'ipywidgets', 'skimage', 'pandas', 'scipy.fft', 'scipy.stats', 'imageio', 'tifffile', 'PIL']
+
+PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(dt, ','.join(loaded))
+"""
+
+def measure(module: str, repeats: int = 5):
+    """Imports the module in fresh interpreters. Returns (times_ms, heavy modules loaded)."""
+    times = []
+    loaded = ''
+    for _ in range(repeats):
+        res = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"Import of {module} failed: {res.stderr.strip()}")
+        dt, loaded = res.stdout.strip().split(' ', 1) if ' ' in res.stdout.strip() else (res.stdout.strip(), '')
+        times.append(float(dt) * 1000)
+    return times, loaded
+
+def benchmark(repeats: int = 5):
+    # numpy is paid by every entry point; report it as the floor
+    base, _ = measure('numpy', repeats)
+    print(f"Startup benchmark ({repeats} fresh interpreters per module)")
+    print("-" * 78)
+    print(f"{'numpy (floor)':<18}: {np.median(base):8.1f} ms")
+    for module in MODULES:
+        times, loaded = measure(module, repeats)
+        print(f"{module:<18}: {np.median(times):8.1f} ms ± {np.std(times):6.1f} ms  heavy: {loaded or '-'}")
+    print("-" * 78)
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
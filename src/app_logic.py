@@ -1,37 +1,261 @@
-import pandas as pd
 import numpy as np
 import os
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Tuple, Dict, Any, Optional, List
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Any, Optional, List, Callable
+from dataclasses import dataclass, field
 
-from .config import VSTConfig
+from .config import VSTConfig, MonteCarloConfig
 from .codec import BPGCodec
 from .experiments import RateDistortionRunner
-from .data_loader import SyntheticGenerator, ImageLoader
+from .monte_carlo import MonteCarloRunner, MonteCarloResult
+from .data_loader import SyntheticGenerator, ImageLoader, decimate
 from .transform import VarianceStabilizer
-from .interfaces import EncodeResult
+from .interfaces import EncodeResult, FilterRegistry
+from . import filters # triggers filter registration
+from .storage import StoredImage
+from .cache import ImageCache
+from .pipeline import Pipeline
+from .distributed import SweepCoordinator
+from .memory import TRACKER, set_budget, track
+from .precision import resolve_dtype
+from .rd_model import RDComparison, compare_fits, fit_rd_curve, sparse_q
+from .vst_estimate import VSTEstimate, estimate_vst
+
+# Display format per summary column (formatting happens only at display time)
+METRIC_FORMATS = {'Q(OOP)': 'd', 'MSE': '.2f', 'Filesize (KB)': '.1f', 'CR': '.1f'}
 
 @dataclass
 class AnalysisResult:
-    metrics_df: pd.DataFrame
-    curves: Dict[str, Any] # q, psnr, etc lists
-    oop_points: Dict[str, Dict[str, float]] # 'linear': {...}, 'vst': {...}
-    source_image: np.ndarray # Noised
-    ref_image: np.ndarray    # Original
-    file_ext: str            # Original extension or .png for gen
-    oop_image_lin: Optional[np.ndarray] = None
-    oop_image_vst: Optional[np.ndarray] = None
+    curves: Dict[str, Dict[str, np.ndarray]] # 'linear'/'vst' -> column -> numeric array
+    oop_points: Dict[str, Dict[str, float]]  # 'linear': {...}, 'vst': {...}
+    file_ext: str                            # Original extension or .png for gen
+    oop_metric: str = 'psnr'
+    images: Dict[str, Optional[StoredImage]] = field(default_factory=dict) # source, ref, oop_linear, oop_vst
+    quality_maps: Dict[str, Dict[str, np.ndarray]] = field(default_factory=dict) # domain -> metric -> per-tile PSNR (dB) at the OOP
+    memory: Dict[str, Dict[str, float]] = field(default_factory=dict) # stage -> calls / seconds / peak_mb / rss_mb (empty if tracking is off)
+
+    def _image(self, key: str) -> Optional[np.ndarray]:
+        stored = self.images.get(key)
+        return stored.load() if stored is not None else None
+
+    @property
+    def source_image(self) -> Optional[np.ndarray]: # Noised
+        return self._image('source')
+
+    @property
+    def ref_image(self) -> Optional[np.ndarray]:    # Original
+        return self._image('ref')
+
+    @property
+    def oop_image_lin(self) -> Optional[np.ndarray]:
+        return self._image('oop_linear')
+
+    @property
+    def oop_image_vst(self) -> Optional[np.ndarray]:
+        return self._image('oop_vst')
+
+    @property
+    def nbytes(self) -> int:
+        """RAM held by the curves and (non-spilled) images."""
+        curves = sum(np.asarray(v).nbytes for c in self.curves.values() for v in c.values())
+        maps = sum(m.nbytes for d in self.quality_maps.values() for m in d.values())
+        return curves + maps + sum(img.nbytes for img in self.images.values() if img is not None)
+
+    @property
+    def metrics_df(self):
+        """Numeric OOP summary (one row per method)."""
+        import pandas as pd
+        rows = []
+        for domain, label in [('linear', 'Standard space'), ('vst', 'VST space')]:
+            oop = self.oop_points.get(domain, {})
+            rows.append({
+                'Method': label,
+                'Q(OOP)': int(oop.get('q', 0)),
+                f'{self.oop_metric.upper()}(OOP)': oop.get(self.oop_metric, 0.0),
+                'PSNR': oop.get('psnr', 0.0),
+                'HVS-M': oop.get('psnr_hvsm', 0.0),
+                'MSE': oop.get('mse', 0.0),
+                'Filesize (KB)': oop.get('file_size_kb', 0.0),
+                'CR': oop.get('cr', 0.0),
+            })
+        return pd.DataFrame(rows)
+
+    @property
+    def memory_df(self):
+        """Per-stage memory (MB) and wall time (s), one row per stage, largest peak first."""
+        import pandas as pd
+        df = pd.DataFrame.from_dict(self.memory, orient='index', columns=['calls', 'seconds', 'peak_mb', 'rss_mb'])
+        return df.rename_axis('stage').sort_values(['peak_mb', 'rss_mb'], ascending=False)
+
+    def formatted_metrics(self):
+        """OOP summary with values rendered as strings, for display."""
+        df = self.metrics_df
+        for col in df.columns[1:]:
+            fmt = METRIC_FORMATS.get(col, '.2f')
+            df[col] = [f"{v:{fmt}}" for v in df[col]]
+        return df
+
+    def release(self):
+        """Frees the images (and deletes spilled files)."""
+        for img in self.images.values():
+            if img is not None: img.release()
+        self.images.clear()
+        self.quality_maps.clear()
+
+@dataclass
+class StackAnalysisResult:
+    frame_curves: Dict[str, List[Dict[str, np.ndarray]]] # domain -> one curve per frame
+    frame_oops: Dict[str, List[Dict[str, float]]]        # domain -> per-frame OOP
+    stack_curves: Dict[str, Dict[str, np.ndarray]]       # domain -> curve averaged over frames
+    stack_oop: Dict[str, Dict[str, float]]               # domain -> OOP of the averaged curve (one Q for the stack)
+    n_frames: int
+    oop_metric: str = 'psnr'
+
+    @property
+    def metrics_df(self):
+        """Per-frame OOPs plus mean / std over frames and the stack-level OOP (numeric)."""
+        import pandas as pd
+        cols = list(dict.fromkeys(['q', self.oop_metric, 'psnr', 'psnr_hvsm', 'file_size_kb', 'cr']))
+        rows = []
+        for domain, label in [('linear', 'Standard space'), ('vst', 'VST space')]:
+            oops = self.frame_oops.get(domain, [])
+            for f, oop in enumerate(oops):
+                rows.append({'Method': label, 'Frame': str(f), **{c: oop.get(c, np.nan) for c in cols}})
+            if oops:
+                values = np.array([[oop.get(c, np.nan) for c in cols] for oop in oops], dtype=float)
+                rows.append({'Method': label, 'Frame': 'mean', **dict(zip(cols, np.nanmean(values, axis=0)))})
+                rows.append({'Method': label, 'Frame': 'std', **dict(zip(cols, np.nanstd(values, axis=0)))})
+            stack = self.stack_oop.get(domain, {})
+            rows.append({'Method': label, 'Frame': 'stack', **{c: stack.get(c, np.nan) for c in cols}})
+        return pd.DataFrame(rows)
+
+@dataclass
+class FilterComparisonResult:
+    curves: Dict[str, Dict[str, np.ndarray]]  # pipeline -> column -> numeric array
+    oop_points: Dict[str, Dict[str, float]]   # pipeline -> OOP record
+    oop_metric: str = 'psnr'
+    filter_times: Dict[str, float] = field(default_factory=dict) # pipeline -> filtering time (s)
+
+    @property
+    def metrics_df(self):
+        """Numeric OOP summary (one row per pipeline)."""
+        import pandas as pd
+        rows = []
+        for name, oop in self.oop_points.items():
+            rows.append({
+                'Pipeline': name,
+                'Q(OOP)': int(oop.get('q', 0)),
+                f'{self.oop_metric.upper()}(OOP)': oop.get(self.oop_metric, 0.0),
+                'PSNR': oop.get('psnr', 0.0),
+                'HVS-M': oop.get('psnr_hvsm', 0.0),
+                'Filesize (KB)': oop.get('file_size_kb', 0.0),
+                'CR': oop.get('cr', 0.0),
+                'Filter (s)': self.filter_times.get(name, 0.0),
+            })
+        return pd.DataFrame(rows)
+
+@dataclass
+class PyramidPreviewResult:
+    level_curves: Dict[str, List[Dict[str, np.ndarray]]] # domain -> curve per level (0 = full resolution)
+    oop_points: Dict[str, Dict[str, float]]              # domain -> OOP confirmed at full resolution
+    predicted_q: Dict[str, int]                          # domain -> OOP Q of the coarsest level
+    factor: int                                          # decimation of the coarsest level
+    oop_metric: str = 'psnr'
+
+    @property
+    def preview_curves(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Full-range sweeps of the coarsest level."""
+        return {d: curves[-1] for d, curves in self.level_curves.items()}
+
+    @property
+    def refined_curves(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Full-resolution points around the predicted OOP."""
+        return {d: curves[0] for d, curves in self.level_curves.items()}
+
+    @property
+    def metrics_df(self):
+        """Predicted vs confirmed OOP per domain, with the full-resolution encode count."""
+        import pandas as pd
+        rows = []
+        for domain, label in [('linear', 'Standard space'), ('vst', 'VST space')]:
+            oop = self.oop_points.get(domain, {})
+            rows.append({
+                'Method': label,
+                'Q(preview)': self.predicted_q.get(domain, -1),
+                'Q(OOP)': int(oop.get('q', -1)),
+                f'{self.oop_metric.upper()}(OOP)': oop.get(self.oop_metric, 0.0),
+                'Filesize (KB)': oop.get('file_size_kb', 0.0),
+                'Full-res encodes': len(self.refined_curves.get(domain, {}).get('q', [])),
+            })
+        return pd.DataFrame(rows)
 
 class AnalysisController:
-    def __init__(self, bpg_path: str = 'bpg-0.9.8-win64'):
+    def __init__(self, bpg_path: str = 'bpg-0.9.8-win64',
+                 image_storage: str = 'float32', spill_dir: Optional[str] = None,
+                 cache_max_mb: float = 512,
+                 pipeline_memory_mb: float = 512, pipeline_disk_dir: Optional[str] = None,
+                 precision: str = 'float64', memory_budget_mb: Optional[float] = None):
+        """
+        Args:
+            memory_budget_mb: Process memory budget of the chunked stages (AppConfig.memory.budget_mb,
+                see src.memory.set_budget); None keeps the current one.
+        """
+        if memory_budget_mb is not None:
+            set_budget(memory_budget_mb)
+        self.bpg_path = bpg_path
+        # Result images: 'float64' | 'float32' | 'uint8' (LUT), optionally spilled to .npy memmaps
+        self.image_storage = image_storage
+        # Working precision of the inputs (see src.precision): 'float64' | 'float32'
+        self.precision = precision
+        # Size of the synthetic scene for source_type 'gen' (rows, cols)
+        self.gen_shape: Tuple[int, int] = (400, 400)
+        # Named in-memory inputs for source_type 'array' (e.g. arrays uploaded to src.service)
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.spill_dir = spill_dir
         self.codec = BPGCodec(bpg_path)
         self.runner = RateDistortionRunner(self.codec)
         self.last_result: Optional[AnalysisResult] = None
         
-        # Cache for generator to avoid regeneration if params confirm
-        self._cached_gen_data = None
-        self._cached_noise_level = -1.0
+        # LRU cache (byte budget) for loaded files and generator outputs
+        self.image_cache = ImageCache(int(cache_max_mb * 1024 ** 2))
+
+        # Stage graph: sweeps reuse every memoized node (transform, filter, encode, decode,
+        # metrics) whose inputs and parameters did not change
+        self.pipeline = Pipeline(pipeline_memory_mb, pipeline_disk_dir)
+        self.runner.pipeline = self.pipeline
+        # Inputs and curves of the last run_analysis, for reselect_oop
+        self._last_sweep: Optional[Dict[str, Any]] = None
+        # Optional multi-node backend: sweeps are queued in a shared directory and
+        # run by QueueWorker processes (see src.distributed, use_job_queue)
+        self.job_queue: Optional[SweepCoordinator] = None
+
+    def set_encoder(self, sweep: Optional[Dict[str, Any]] = None, final: Optional[Dict[str, Any]] = None):
+        """
+        bpgenc settings ({'level', 'encoder'}, see EncoderConfig) for the sweeps and for
+        the re-encode of the chosen OOPs. final = None or equal to sweep: no re-encode.
+        """
+        self.runner.codec = self.codec.with_settings(**(sweep or {}))
+        final_codec = self.codec.with_settings(**final) if final is not None else None
+        if final_codec is not None and final_codec.fingerprint() == self.runner.codec.fingerprint():
+            final_codec = None
+        self.runner.final_codec = final_codec
+
+    @contextmanager
+    def _runner_settings(self, **settings):
+        """Sets runner attributes (pre_filter, metric_mode, ...) for one call and restores them afterwards."""
+        saved = {name: getattr(self.runner, name) for name in settings}
+        for name, value in settings.items(): setattr(self.runner, name, value)
+        try:
+            yield
+        finally:
+            for name, value in saved.items(): setattr(self.runner, name, value)
+
+    def use_job_queue(self, queue_dir: Optional[str], chunk_size: int = 8):
+        """Runs the sweeps of run_analysis through a shared-directory job queue (None = locally)."""
+        self.job_queue = SweepCoordinator(queue_dir, chunk_size) if queue_dir else None
 
     def get_data(self, source_type: str, 
                  noise_level: float = 0.0, 
@@ -42,20 +266,33 @@ class AnalysisController:
         Returns: (Ref, Noised, FileExtension)
         """
         if source_type == 'gen':
-            if self._cached_gen_data is None or noise_level != self._cached_noise_level:
-                self._cached_gen_data = SyntheticGenerator.get_data(noise_level)
-                self._cached_noise_level = noise_level
-            return self._cached_gen_data[0], self._cached_gen_data[1], '.png'
+            # Keyed by noise level: the same draw is reused until the level changes
+            shape = tuple(self.gen_shape)
+            key = ('gen', noise_level, self.precision, shape)
+            dtype = resolve_dtype(self.precision)
+            clean, noised = self.image_cache.get_or_load(
+                key, lambda: SyntheticGenerator.get_data(noise_level, shape, dtype=dtype))
+            return clean, noised, '.png'
+
+        elif source_type == 'array':
+            # path_noised / path_original name entries of self.arrays
+            if path_noised not in self.arrays: return None, None, ""
+            dtype = resolve_dtype(self.precision)
+            def load(name):
+                if name not in self.arrays: return None # No reference mode
+                # A copy: the entry must not change when the caller edits its array
+                return self.image_cache.get_or_load(('array', name, self.precision),
+                                                    lambda: np.array(self.arrays[name], dtype=dtype))
+            return load(path_original), load(path_noised), '.npy'
             
         elif source_type == 'file':
             try:
                 if not os.path.exists(path_noised): return None, None, ""
                 
-                i_n = ImageLoader.load_file(path_noised)
+                paths = [path_noised]
                 if os.path.exists(path_original):
-                    i_o = ImageLoader.load_file(path_original)
-                else:
-                    i_o = None # No reference mode?
+                    paths.append(path_original)
+                i_n, i_o = (self._load_files(paths) + [None])[:2] # No reference mode if original is missing
                 
                 _, ext = os.path.splitext(path_noised)
                 return i_o, i_n, ext
@@ -64,6 +301,28 @@ class AnalysisController:
                 return None, None, ""
         return None, None, ""
 
+    def _load_files(self, paths: List[str], min_value: float = 1.0) -> List[np.ndarray]:
+        """
+        Loads images through the cache. Misses are read concurrently on a thread pool
+        (file decoding and numpy conversion release the GIL).
+        """
+        dtype = resolve_dtype(self.precision)
+        keys = [ImageCache.file_key(p, min_value=min_value, dtype=self.precision) for p in paths]
+        images = [self.image_cache.get(k) for k in keys]
+        missing = [i for i, img in enumerate(images) if img is None]
+
+        def load(i):
+            return self.image_cache.put(keys[i], ImageLoader.load_file(paths[i], min_value=min_value, dtype=dtype))
+
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                for i, img in zip(missing, pool.map(load, missing)):
+                    images[i] = img
+        else:
+            for i in missing:
+                images[i] = load(i)
+        return images
+
     def run_analysis(self, 
                      source_type: str,
                      noise_level: float,
@@ -71,102 +330,404 @@ class AnalysisController:
                      path_original: str,
                      vst_a: float, vst_b: float,
                      q_start: int, q_end: int, q_step: int,
-                     oop_metric: str = 'psnr') -> AnalysisResult:
-        
-        img_ref, img_noised, file_ext = self.get_data(source_type, noise_level, path_noised, path_original)
+                     oop_metric: str = 'psnr',
+                     early_stop_patience: int = 0,
+                     record_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                     progress_callback: Optional[Callable[[int, int], None]] = None,
+                     metric_mode: str = 'full',
+                     preview_fraction: float = 0.1,
+                     pre_filter: Optional[str] = None,
+                     filter_params: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+        """
+        Runs the VST and linear sweeps, finds the OOPs and rebuilds the OOP images.
+        Args:
+            early_stop_patience: Stop each sweep once the OOP is bracketed by N worse points (0 = off).
+            record_callback: Called as (domain, record) for every scored Q, e.g. for live plots.
+            progress_callback: Called as (done, total) over both sweeps.
+            metric_mode: 'full' or 'preview'. In preview mode the curves use subsampled metric
+                estimates (preview_fraction of the blocks) and only the OOPs are scored in full;
+                the estimates are kept in the OOP dicts as 'preview_<metric>'.
+            pre_filter: Name of a registered filter (e.g. 'dct') applied before compression
+                in both paths, or None / 'none'. filter_params are passed to its constructor.
+        """
+        settings = {'metric_mode': metric_mode, 'preview_fraction': preview_fraction,
+                    'pre_filter': FilterRegistry.create(pre_filter, **(filter_params or {}))}
+        # Per call: later runs (rate target, stacks, Monte Carlo) must not inherit them
+        with self._runner_settings(**settings):
+            TRACKER.reset() # The result reports this run only
+            with track('load'):
+                img_ref, img_noised, file_ext = self.get_data(source_type, noise_level, path_noised, path_original)
         
-        if img_noised is None:
-            raise ValueError("Could not load image data")
+            if img_noised is None:
+                raise ValueError("Could not load image data")
             
-        vst_cfg = VSTConfig(a=vst_a, b=vst_b)
-        q_rng = list(range(q_start, q_end + 1, q_step))
+            vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+            q_rng = list(range(q_start, q_end + 1, q_step))
         
-        # 1. Run Curves
-        res_vst = self.runner.run_curve(img_ref, img_noised, vst_cfg, q_rng, use_vst=True)
-        res_lin = self.runner.run_curve(img_ref, img_noised, vst_cfg, q_rng, use_vst=False)
-        
-        # 2. Find OOPs
-        def find_oop(res):
-            metric_key = oop_metric
-            if metric_key not in res or not res[metric_key]: 
-                 # Fallback to PSNR if metric not found (e.g. psnr_hvsm missing)
-                 metric_key = 'psnr'
-            
-            if not res[metric_key]: return {}, -1
-            
-            idx = np.argmax(res[metric_key])
-            return {k: res[k][idx] for k in res.keys()}, int(res['q'][idx])
-            
-        oop_vst, q_vst = find_oop(res_vst)
-        oop_lin, q_lin = find_oop(res_lin)
+            # 1. Run Curves
+            def run_domain(domain: str, offset: int) -> Dict[str, np.ndarray]:
+                on_record = (lambda r: record_callback(domain, r)) if record_callback else None
+                on_progress = (lambda d, t: progress_callback(offset + d, 2 * t)) if progress_callback else None
+                return self.runner.run_curve(img_ref, img_noised, vst_cfg, q_rng, use_vst=(domain == 'vst'),
+                                             progress_callback=on_progress, record_callback=on_record,
+                                             stop_metric=oop_metric, stop_patience=early_stop_patience)
+
+            if self.job_queue is not None:
+                # Distributed: Q-chunks of both domains go to the queue workers at once
+                # (no live records and no early stopping across chunks)
+                swept = self.job_queue.run_curves(self.runner, img_ref, img_noised, vst_cfg, q_rng,
+                                                  progress_callback=progress_callback)
+                res_vst, maps_vst = swept['vst']['curve'], swept['vst']['maps']
+                res_lin, maps_lin = swept['linear']['curve'], swept['linear']['maps']
+            else:
+                res_vst = run_domain('vst', 0)
+                maps_vst = self.runner.last_maps
+                res_lin = run_domain('linear', len(q_rng))
+                maps_lin = self.runner.last_maps
+
+            self._last_sweep = {
+                'img_ref': img_ref, 'img_noised': img_noised, 'file_ext': file_ext, 'vst_cfg': vst_cfg,
+                'curves': {'linear': res_lin, 'vst': res_vst}, 'maps': {'linear': maps_lin, 'vst': maps_vst},
+                'metric_mode': metric_mode, 'runner_settings': settings,
+            }
+            return self._select_oop(self._last_sweep, oop_metric)
+
+    def reselect_oop(self, oop_metric: str) -> AnalysisResult:
+        """
+        Re-picks the OOPs of the last run_analysis for another metric, reusing its curves
+        (no sweep; the OOP images are memo hits in the stage graph).
+        """
+        if self._last_sweep is None:
+            raise ValueError("No analysis to re-select from; call run_analysis first")
+        # The sweep's filter and metric mode: the OOP images are memo hits of that chain
+        with self._runner_settings(**self._last_sweep['runner_settings']):
+            return self._select_oop(self._last_sweep, oop_metric)
+
+    def _select_oop(self, sweep: Dict[str, Any], oop_metric: str) -> AnalysisResult:
+        """Steps after the sweeps: OOPs, OOP images, preview confirmation, packed result."""
+        img_ref, img_noised, vst_cfg = sweep['img_ref'], sweep['img_noised'], sweep['vst_cfg']
+        res_lin, res_vst = sweep['curves']['linear'], sweep['curves']['vst']
+
+        # 2. Find OOPs (the per-tile HVS maps at the OOP come from the sweep itself)
+        oop_vst, q_vst = self.runner.find_oop(res_vst, oop_metric)
+        oop_lin, q_lin = self.runner.find_oop(res_lin, oop_metric)
+        quality_maps = {'linear': dict(sweep['maps']['linear'].get(q_lin, {})),
+                        'vst': dict(sweep['maps']['vst'].get(q_vst, {}))}
         
-        # 3. Re-generate OOP images
-        def get_compressed_image(img, q, use_vst_loc):
+        # 3. Re-generate OOP images. With a final encoder preset only the chosen OOPs are
+        # re-encoded (and scored in full); the sweep values stay in the OOP dicts as 'sweep_<name>'
+        final = self.runner.final_codec is not None
+        def get_compressed_image(img, oop, q, use_vst_loc, domain):
             if q == -1: return None
-            if use_vst_loc:
-                vst = VarianceStabilizer(vst_cfg)
-                to_compress = vst.forward(img)
-            else:
-                to_compress = img
-                
-            res = self.codec.compress_decompress(to_compress, q=q)
-            decoded = res.decoded_image
-            
-            if use_vst_loc:
-                return vst.inverse(decoded)
-            return decoded
+            if final:
+                return self._final_oop(sweep, oop, q, use_vst_loc, quality_maps[domain])
+            # Same chain as the sweep; with the stage graph this is a memo hit
+            return self.runner.restore(img, vst_cfg, q, use_vst_loc)
 
-        img_oop_vst = get_compressed_image(img_noised, q_vst, True)
-        img_oop_lin = get_compressed_image(img_noised, q_lin, False)
+        with track('encode_final' if final else 'oop'):
+            img_oop_vst = get_compressed_image(img_noised, oop_vst, q_vst, True, 'vst')
+            img_oop_lin = get_compressed_image(img_noised, oop_lin, q_lin, False, 'linear')
         
-        # 4. DataFrame
-        def get_fmt(val, fmt=".2f"):
-            return f"{val:{fmt}}" if isinstance(val, (int, float)) else str(val)
+            # 4. Preview mode: confirm the OOPs with a full evaluation (final encodes already are)
+            if sweep['metric_mode'] == 'preview' and not final:
+                ref_eval = img_ref if img_ref is not None else img_noised
+                for domain, oop, img_oop in [('linear', oop_lin, img_oop_lin), ('vst', oop_vst, img_oop_vst)]:
+                    if not oop or img_oop is None: continue
+                    for name, val in self.runner.full_metrics(ref_eval, img_oop, quality_maps[domain]).items():
+                        if name in oop: oop[f'preview_{name}'] = oop[name]
+                        oop[name] = float(val)
 
-        # Helper to calc MSE for OOP if not directly available (but we can compute it manually or use metrics)
+        # OOP MSE against the reference
         def get_oop_mse(img_oop, img_ref):
              if img_oop is None or img_ref is None: return 0.0
-             return np.mean((img_oop - img_ref)**2)
-
-        mse_lin = get_oop_mse(img_oop_lin, img_ref)
-        mse_vst = get_oop_mse(img_oop_vst, img_ref)
-
-        df = pd.DataFrame([
-            {
-                'Method': 'Standard space', 
-                'Q(OOP)': oop_lin.get('q', 0), 
-                f'{oop_metric.upper()}(OOP)': get_fmt(oop_lin.get(oop_metric, 0)),
-                'PSNR': get_fmt(oop_lin.get('psnr', 0)), 
-                'HVS-M': get_fmt(oop_lin.get('psnr_hvsm', 0)), 
-                'MSE': get_fmt(mse_lin, ".2f"),
-                'Filesize (KB)': get_fmt(oop_lin.get('file_size_kb', 0), ".1f"),
-                'CR': get_fmt(oop_lin.get('cr', 0), ".1f")
-            },
-            {
-                'Method': 'VST space', 
-                'Q(OOP)': oop_vst.get('q', 0), 
-                f'{oop_metric.upper()}(OOP)': get_fmt(oop_vst.get(oop_metric, 0)),
-                'PSNR': get_fmt(oop_vst.get('psnr', 0)), 
-                'HVS-M': get_fmt(oop_vst.get('psnr_hvsm', 0)), 
-                'MSE': get_fmt(mse_vst, ".2f"),
-                'Filesize (KB)': get_fmt(oop_vst.get('file_size_kb', 0), ".1f"),
-                'CR': get_fmt(oop_vst.get('cr', 0), ".1f")
-            }
-        ])
-        
+             return float(np.mean((img_oop - img_ref)**2))
+
+        if oop_lin: oop_lin['mse'] = get_oop_mse(img_oop_lin, img_ref)
+        if oop_vst: oop_vst['mse'] = get_oop_mse(img_oop_vst, img_ref)
+
+        # 5. Compact storage for the images
+        def pack(img, name):
+            if img is None: return None
+            return StoredImage.pack(img, self.image_storage, self.spill_dir, name)
+
         result = AnalysisResult(
-            metrics_df=df,
             curves={'linear': res_lin, 'vst': res_vst},
             oop_points={'linear': oop_lin, 'vst': oop_vst},
-            source_image=img_noised,
-            ref_image=img_ref,
-            file_ext=file_ext,
-            oop_image_lin=img_oop_lin,
-            oop_image_vst=img_oop_vst
+            file_ext=sweep['file_ext'],
+            oop_metric=oop_metric,
+            images={
+                'source': pack(img_noised, 'source'),
+                'ref': pack(img_ref, 'ref'),
+                'oop_linear': pack(img_oop_lin, 'oop_linear'),
+                'oop_vst': pack(img_oop_vst, 'oop_vst'),
+            },
+            quality_maps=quality_maps,
+            memory=TRACKER.report()
         )
         self.last_result = result
         return result
 
+    def _final_oop(self, sweep: Dict[str, Any], oop: Dict[str, Any], q: int, use_vst: bool,
+                   maps: Dict[str, np.ndarray]) -> np.ndarray:
+        """Re-encodes one OOP with the runner's final codec; updates the OOP record and its tile maps in place."""
+        record, img, final_maps = self.runner.final_record(sweep['img_ref'], sweep['img_noised'],
+                                                           sweep['vst_cfg'], q, use_vst)
+        for name, val in record.items():
+            if name == 'q': continue
+            if name in oop: oop[f'sweep_{name}'] = oop[name]
+            oop[name] = float(val)
+        maps.clear()
+        maps.update(final_maps)
+        return img
+
+    def run_filter_comparison(self,
+                              source_type: str,
+                              noise_level: float,
+                              path_noised: str,
+                              path_original: str,
+                              vst_a: float, vst_b: float,
+                              q_start: int, q_end: int, q_step: int,
+                              filter_names: Optional[List[str]] = None,
+                              oop_metric: str = 'psnr',
+                              filter_params: Optional[Dict[str, Dict[str, Any]]] = None,
+                              progress_callback: Optional[Callable[[int, int], None]] = None) -> FilterComparisonResult:
+        """
+        Compares filter -> compress pipelines against plain linear and VST compression.
+        Pipelines: 'linear', 'vst', then one per filter name (linear-domain filters such as
+        'lee', 'kuan', 'enhanced_lee', 'frost' by default), each followed by linear compression.
+        Args:
+            filter_params: Optional constructor arguments per filter name.
+        """
+        img_ref, img_noised, _ = self.get_data(source_type, noise_level, path_noised, path_original)
+        if img_noised is None:
+            raise ValueError("Could not load image data")
+
+        if filter_names is None:
+            filter_names = [n for n, cls in FilterRegistry.get_all().items() if cls.domain == 'linear']
+        vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+        q_rng = list(range(q_start, q_end + 1, q_step))
+        pipelines = [('linear', None, False), ('vst', None, True)] + [(n, n, False) for n in filter_names]
+
+        curves, oops, times = {}, {}, {}
+        saved_filter = self.runner.pre_filter
+        try:
+            for i, (label, name, use_vst) in enumerate(pipelines):
+                self.runner.pre_filter = FilterRegistry.create(name, **(filter_params or {}).get(name, {}))
+                if name:
+                    # Filter once up front (memoized by the runner) so it can be timed separately
+                    t0 = time.perf_counter()
+                    self.runner._prepare(img_noised, vst_cfg, use_vst)
+                    times[label] = time.perf_counter() - t0
+                on_progress = (lambda d, t, i=i: progress_callback(i * t + d, len(pipelines) * t)) if progress_callback else None
+                curves[label] = self.runner.run_curve(img_ref, img_noised, vst_cfg, q_rng, use_vst=use_vst,
+                                                      progress_callback=on_progress)
+                oops[label], _ = self.runner.find_oop(curves[label], oop_metric)
+        finally:
+            self.runner.pre_filter = saved_filter
+
+        return FilterComparisonResult(curves, oops, oop_metric, times)
+
+    def run_pyramid_preview(self,
+                            source_type: str,
+                            noise_level: float,
+                            path_noised: str,
+                            path_original: str,
+                            vst_a: float, vst_b: float,
+                            q_start: int, q_end: int, q_step: int,
+                            levels: int = 2,
+                            window: int = 3,
+                            oop_metric: str = 'psnr',
+                            pre_filter: Optional[str] = None,
+                            filter_params: Optional[Dict[str, Any]] = None,
+                            progress_callback: Optional[Callable[[int, int], None]] = None) -> PyramidPreviewResult:
+        """
+        Coarse-to-fine OOP search for interactive use.
+        The full Q sweep runs only on the pair decimated by 2**levels (see decimate: plain
+        subsampling, so the speckle statistics are kept). Each finer pyramid level, down
+        to full resolution, then evaluates only the Qs within `window` steps of the OOP
+        predicted by the level above (widened until bracketed, see refine_curve).
+        Args:
+            progress_callback: Called as (done, total) over levels and domains.
+        """
+        with self._runner_settings(metric_mode='full',
+                                   pre_filter=FilterRegistry.create(pre_filter, **(filter_params or {}))):
+            img_ref, img_noised, _ = self.get_data(source_type, noise_level, path_noised, path_original)
+            if img_noised is None:
+                raise ValueError("Could not load image data")
+
+            vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+            q_rng = list(range(q_start, q_end + 1, q_step))
+            pyramid = [(decimate(img_ref, 2 ** l), decimate(img_noised, 2 ** l)) for l in range(levels + 1)]
+            total, done = 2 * (levels + 1), 0
+
+            level_curves, oops, predicted = {}, {}, {}
+            for domain in ['vst', 'linear']:
+                use_vst = domain == 'vst'
+                curves = [None] * (levels + 1)
+                q_pred = -1
+                for l in range(levels, -1, -1):
+                    ref_l, noised_l = pyramid[l]
+                    if l == levels:
+                        curves[l] = self.runner.run_curve(ref_l, noised_l, vst_cfg, q_rng, use_vst=use_vst)
+                        predicted[domain] = self.runner.find_oop(curves[l], oop_metric)[1]
+                    else:
+                        curves[l] = self.runner.refine_curve(ref_l, noised_l, vst_cfg, q_rng, q_pred,
+                                                             window, oop_metric, use_vst)
+                    q_pred = self.runner.find_oop(curves[l], oop_metric)[1]
+                    done += 1
+                    if progress_callback: progress_callback(done, total)
+                level_curves[domain] = curves
+                oops[domain], _ = self.runner.find_oop(curves[0], oop_metric)
+
+            return PyramidPreviewResult(level_curves, oops, predicted, 2 ** levels, oop_metric)
+
+    def run_rd_model(self,
+                     source_type: str,
+                     noise_level: float,
+                     path_noised: str,
+                     path_original: str,
+                     vst_a: float, vst_b: float,
+                     q_start: int, q_end: int, q_step: int,
+                     n_points: int = 7,
+                     oop_metric: str = 'psnr',
+                     n_boot: int = 200,
+                     confidence: float = 0.95,
+                     pre_filter: Optional[str] = None,
+                     filter_params: Optional[Dict[str, Any]] = None,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> RDComparison:
+        """
+        Sparse-sweep comparison: each domain is encoded at only n_points Qs spread over
+        the range, RD models are fitted (see rd_model.fit_rd_curve) and the full curves,
+        the OOPs (with bootstrap intervals) and the BD-rate / BD-quality of VST vs linear
+        are predicted over every Q of the range.
+        """
+        with self._runner_settings(metric_mode='full',
+                                   pre_filter=FilterRegistry.create(pre_filter, **(filter_params or {}))):
+            img_ref, img_noised, _ = self.get_data(source_type, noise_level, path_noised, path_original)
+            if img_noised is None:
+                raise ValueError("Could not load image data")
+
+            vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+            q_rng = list(range(q_start, q_end + 1, q_step))
+            q_sparse = sparse_q(q_rng, n_points)
+
+            fits = {}
+            for i, domain in enumerate(['linear', 'vst']):
+                on_progress = (lambda d, t, i=i: progress_callback(i * t + d, 2 * t)) if progress_callback else None
+                curve = self.runner.run_curve(img_ref, img_noised, vst_cfg, q_sparse, use_vst=(domain == 'vst'),
+                                              progress_callback=on_progress)
+                fits[domain] = fit_rd_curve(curve, oop_metric, n_boot=n_boot)
+
+            result = compare_fits(fits['linear'], fits['vst'], q_rng, confidence)
+            result.encodes = {d: len(q_sparse) for d in fits}
+            return result
+
+    def run_stack_analysis(self,
+                           path_noised: str,
+                           path_original: str,
+                           vst_a: float, vst_b: float,
+                           q_start: int, q_end: int, q_step: int,
+                           oop_metric: str = 'psnr',
+                           frame_axis: Optional[int] = None,
+                           n_workers: Optional[int] = None,
+                           progress_callback: Optional[Callable[[int, int], None]] = None) -> StackAnalysisResult:
+        """
+        Linear vs VST analysis of a multi-frame / multi-band file, frame by frame.
+        The frame axis is kept (see ImageLoader.load_stack); OOP images are not rebuilt.
+        """
+        def load(path):
+            key = ImageCache.file_key(path, min_value=1.0, stack=True, frame_axis=frame_axis, dtype=self.precision)
+            return self.image_cache.get_or_load(key, lambda: ImageLoader.load_stack(
+                path, frame_axis=frame_axis, dtype=resolve_dtype(self.precision)))
+
+        noised = load(path_noised)
+        ref = load(path_original) if os.path.exists(path_original) else None
+        if ref is not None and ref.shape != noised.shape:
+            raise ValueError(f"Stack shapes differ: {noised.shape} vs {ref.shape}")
+
+        vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+        q_rng = list(range(q_start, q_end + 1, q_step))
+
+        frame_curves, frame_oops, stack_curves, stack_oop = {}, {}, {}, {}
+        for i, domain in enumerate(['vst', 'linear']):
+            on_progress = (lambda d, t, o=i * len(q_rng): progress_callback(o + d, 2 * t)) if progress_callback else None
+            curves = self.runner.run_stack_curve(ref, noised, vst_cfg, q_rng, use_vst=(domain == 'vst'),
+                                                 n_workers=n_workers, progress_callback=on_progress)
+            frame_curves[domain] = curves
+            frame_oops[domain] = [self.runner.find_oop(c, oop_metric)[0] for c in curves]
+
+            # Stack aggregate: average every column over frames, then one OOP for the stack
+            mean_curve = {k: np.mean([c[k] for c in curves], axis=0) for k in curves[0].keys()}
+            mean_curve['q'] = curves[0]['q']
+            stack_curves[domain] = mean_curve
+            stack_oop[domain] = self.runner.find_oop(mean_curve, oop_metric)[0]
+
+        return StackAnalysisResult(frame_curves=frame_curves, frame_oops=frame_oops,
+                                   stack_curves=stack_curves, stack_oop=stack_oop,
+                                   n_frames=noised.shape[0], oop_metric=oop_metric)
+
+    def run_rate_target(self,
+                        source_type: str,
+                        noise_level: float,
+                        path_noised: str,
+                        path_original: str,
+                        vst_a: float, vst_b: float,
+                        use_vst: bool = True,
+                        target_bpp: Optional[float] = None,
+                        target_size_kb: Optional[float] = None,
+                        target_cr: Optional[float] = None,
+                        q_min: int = 1, q_max: int = 51) -> Dict[str, Any]:
+        """
+        Finds the best-quality Q that meets a bpp / file size (KB) / CR budget,
+        using ~log2(q_max - q_min) encodes instead of a full sweep.
+        Returns a curve-style record for the chosen Q (see RateDistortionRunner.run_rate_target).
+        """
+        img_ref, img_noised, _ = self.get_data(source_type, noise_level, path_noised, path_original)
+        
+        if img_noised is None:
+            raise ValueError("Could not load image data")
+            
+        vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+        return self.runner.run_rate_target(img_ref, img_noised, vst_cfg, use_vst=use_vst,
+                                           target_bpp=target_bpp, target_size_kb=target_size_kb,
+                                           target_cr=target_cr, q_min=q_min, q_max=q_max)
+
+    def estimate_vst(self,
+                     source_type: str,
+                     noise_level: float,
+                     path_noised: str,
+                     path_original: str,
+                     b: Optional[float] = None,
+                     target_sigma: Optional[float] = None,
+                     tile: int = 8) -> VSTEstimate:
+        """
+        Recommends VST parameters from the speckle statistics of the noised image
+        (see vst_estimate.estimate_vst), in place of a sweep over a / b.
+        """
+        _, img_noised, _ = self.get_data(source_type, noise_level, path_noised, path_original)
+
+        if img_noised is None:
+            raise ValueError("Could not load image data")
+
+        with track('vst_estimate'):
+            return estimate_vst(img_noised, tile=tile, b=b, target_sigma=target_sigma)
+
+    def run_monte_carlo(self,
+                        noise_level: float,
+                        vst_a: float, vst_b: float,
+                        q_start: int, q_end: int, q_step: int,
+                        oop_metric: str = 'psnr',
+                        mc: Optional[MonteCarloConfig] = None,
+                        progress_callback: Optional[Callable[[int, int], None]] = None) -> MonteCarloResult:
+        """
+        Runs the generator analysis over mc.n_realizations seeded noise draws in parallel.
+        Returns mean and confidence intervals of the OOP Q, PSNR, HVS-M and CR per domain.
+        """
+        vst_cfg = VSTConfig(a=vst_a, b=vst_b)
+        q_rng = list(range(q_start, q_end + 1, q_step))
+        mc_runner = MonteCarloRunner(self.bpg_path, self.runner.metrics_to_compute, runner=self.runner)
+        return mc_runner.run(noise_level, vst_cfg, q_rng, oop_metric, mc, progress_callback, self.precision)
+
     def save_oop_image(self, result: AnalysisResult, method: str, output_dir: str = "results") -> str:
         """
         Saves the visual result of the OOP for the given method ('vst' or 'linear').
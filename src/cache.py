@@ -0,0 +1,130 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+def _nbytes(value: Any) -> int:
+    """Approximate memory held by arrays inside a (nested) value."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, '__dict__'): # e.g. EncodedStream / EncodeResult
+        return sum(_nbytes(v) for v in vars(value).values())
+    return 0
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Read-only views of cached arrays, so callers cannot corrupt shared entries. The
+    arrays themselves keep their flags: they may still belong to the caller (e.g. a
+    stage that passes its input through).
+    """
+    if isinstance(value, np.ndarray):
+        if not value.flags.writeable:
+            return value
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, (tuple, list)):
+        items = [_freeze(v) for v in value]
+        return type(value)(*items) if hasattr(value, '_fields') else type(value)(items) # namedtuples too
+    return value
+
+
+class ImageCache:
+    """
+    Thread-safe LRU cache for images with a byte budget.
+    Entries are evicted least-recently-used first once the budget is exceeded;
+    values larger than the whole budget are returned but not stored. Concurrent
+    get_or_load calls for the same key run the loader once; the others wait for it.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, Future] = {} # Keys whose loader is running
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_key(path: str, **options) -> Tuple:
+        """Key for a file: (abs path, mtime, size, loader options). Changes when the file does."""
+        st = os.stat(path)
+        return ('file', os.path.abspath(path), st.st_mtime_ns, st.st_size, tuple(sorted(options.items())))
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        size = _nbytes(value)
+        value = _freeze(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.current_bytes -= old_size
+                self.evictions += 1
+        return value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._loading[key] = Future()
+        if not owner: # Loaded by another thread right now: share its result
+            return pending.result()
+        try:
+            value = self.put(key, loader())
+            pending.set_result(value)
+            return value
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -1,14 +1,33 @@
+import copy
 import os
 import subprocess
+import uuid
 import numpy as np
-import imageio.v3 as iio
 from pathlib import Path
 from typing import Tuple, Optional
 from shutil import which
-from .interfaces import BaseCodec, EncodeResult
+from .cache import ImageCache
+from .interfaces import BaseCodec, EncodeResult, EncodedStream
+from .memory import budget_rows
+from .precision import float_dtype
 
 class BPGCodec(BaseCodec):
-    def __init__(self, bpg_folder_path: str, temp_dir: str = 'temp'):
+    def __init__(self, bpg_folder_path: str, temp_dir: str = 'temp',
+                 level: Optional[int] = None, encoder: Optional[str] = None,
+                 size_cache_mb: float = 64):
+        """
+        Args:
+            level: bpgenc -m, compression effort 1 (fastest) .. 9 (smallest files);
+                None = bpgenc's default (8).
+            encoder: bpgenc -e, HEVC back end ('x265', or 'jctvc' if the build has it);
+                None = bpgenc's default.
+            size_cache_mb: Byte budget of the streams kept for rate-targeted Q searches.
+        """
+        if level is not None and not 1 <= level <= 9:
+            raise ValueError(f"bpgenc level must be in 1..9, got {level}")
+        self.level = level
+        self.encoder = encoder
+        self.size_cache = ImageCache(int(size_cache_mb * 1024 ** 2))
         is_windows = os.name == 'nt'
         
         # Construct full paths: Windows uses folder+program name, ARM uses program name only
@@ -33,13 +52,44 @@ class BPGCodec(BaseCodec):
         if not enc_available:
             print(f"Warning: Encoder not found at {self.bpg_enc}")
 
+    def fingerprint(self) -> str:
+        # Encoder settings only enter when set, so keys of default encodes stay valid
+        fp = f"BPG:{self.bpg_enc}"
+        if self.level is not None: fp += f":m{self.level}"
+        if self.encoder is not None: fp += f":e{self.encoder}"
+        return fp
+
+    @property
+    def settings(self) -> dict:
+        """Encoder settings (level / encoder), as accepted by with_settings."""
+        return {'level': self.level, 'encoder': self.encoder}
+
+    def with_settings(self, level: Optional[int] = None, encoder: Optional[str] = None) -> 'BPGCodec':
+        """Copy of this codec with other encoder settings (same binaries and temp folder)."""
+        if level is not None and not 1 <= level <= 9:
+            raise ValueError(f"bpgenc level must be in 1..9, got {level}")
+        clone = copy.copy(self)
+        clone.size_cache = ImageCache(clone.size_cache.max_bytes) # Streams depend on the settings
+        clone.level, clone.encoder = level, encoder
+        return clone
+
+    def _enc_args(self, q: int) -> list:
+        args = [str(self.bpg_enc), '-q', str(q), '-b', '8']
+        if self.level is not None: args += ['-m', str(self.level)]
+        if self.encoder is not None: args += ['-e', self.encoder]
+        return args
+
     def _normalize_and_save_png(self, image: np.ndarray, png_path: Path) -> Tuple[float, float]:
         """Helper: Converts float image to 8-bit PNG."""
+        import imageio.v3 as iio
         d_min, d_max = image.min(), image.max()
-        if d_max == d_min:
-            norm_img = np.zeros_like(image, dtype=np.uint8)
-        else:
-            norm_img = ((image - d_min) / (d_max - d_min) * 255.0).astype(np.uint8)
+        norm_img = np.zeros(image.shape, dtype=np.uint8)
+        if d_max != d_min:
+            # Row blocks keep the float temporaries within the memory budget
+            step = budget_rows(int(np.prod(image.shape[1:], dtype=np.int64)) * 8 * 3)
+            for r0 in range(0, image.shape[0], step):
+                block = image[r0:r0 + step]
+                norm_img[r0:r0 + step] = ((block - d_min) / (d_max - d_min) * 255.0).astype(np.uint8)
         
         iio.imwrite(png_path, norm_img)
         return d_min, d_max
@@ -49,62 +99,88 @@ class BPGCodec(BaseCodec):
         out_path = Path(output_path)
         out_path.parent.mkdir(parents=True, exist_ok=True)
         
-        t_input = self.temp_dir / f'temp_save_input_{os.getpid()}.png'
+        t_input = self._temp_path('temp_save_input', '.png')
         
         try:
             self._normalize_and_save_png(image, t_input)
             
-            cmd_enc = [str(self.bpg_enc), '-q', str(q), '-b', '8', '-o', str(out_path), str(t_input)]
+            cmd_enc = self._enc_args(q) + ['-o', str(out_path), str(t_input)]
             self._run_command(cmd_enc)
             
             return out_path.stat().st_size
         finally:
             if t_input.exists(): t_input.unlink()
 
-    def compress_decompress(self, image: np.ndarray, q: int) -> EncodeResult:
-        """Cycle: Float -> PNG -> BPG -> PNG -> Float"""
-        pid = os.getpid()
-        t_in = self.temp_dir / f'input_{pid}.png'
-        t_bpg = self.temp_dir / f'output_{pid}.bpg'
-        t_out = self.temp_dir / f'decoded_{pid}.png'
+    def _temp_path(self, prefix: str, ext: str) -> Path:
+        """Unique temp file per call, so concurrent calls in one process do not collide."""
+        return self.temp_dir / f'{prefix}_{os.getpid()}_{uuid.uuid4().hex[:8]}{ext}'
+
+    def encode(self, image: np.ndarray, q: int) -> EncodedStream:
+        """Float -> PNG -> BPG. No decode."""
+        t_in = self._temp_path('input', '.png')
+        t_bpg = self._temp_path('output', '.bpg')
         
         try:
             # 1. Normalize
             d_min, d_max = self._normalize_and_save_png(image, t_in)
             
             # 2. Encode
-            cmd_enc = [str(self.bpg_enc), '-q', str(q), '-b', '8', '-o', str(t_bpg), str(t_in)]
+            cmd_enc = self._enc_args(q) + ['-o', str(t_bpg), str(t_in)]
             self._run_command(cmd_enc)
             
             if not t_bpg.exists(): raise RuntimeError("BPG Enc failed")
-            f_size = t_bpg.stat().st_size
+            return EncodedStream(data=t_bpg.read_bytes(), q=q, shape=image.shape[:2],
+                                 d_min=float(d_min), d_max=float(d_max), dtype=float_dtype(image).name)
+            
+        finally:
+            for p in [t_in, t_bpg]:
+                if p.exists(): p.unlink()
+
+    def decode(self, stream: EncodedStream) -> np.ndarray:
+        """BPG -> PNG -> Float, restoring the original range."""
+        t_bpg = self._temp_path('stream', '.bpg')
+        t_out = self._temp_path('decoded', '.png')
+        
+        try:
+            t_bpg.write_bytes(stream.data)
             
             # 3. Decode
             cmd_dec = [str(self.bpg_dec), '-o', str(t_out), str(t_bpg)]
             self._run_command(cmd_dec)
             
             # 4. Restore
+            import imageio.v3 as iio
             dec_uint8 = iio.imread(t_out)
             # Handle grayscale issues (if saved as RGB)
-            if image.ndim == 2 and dec_uint8.ndim == 3: 
+            if dec_uint8.ndim == 3: 
                 dec_uint8 = dec_uint8[:,:,0]
             
             # Crop padding if BPG added any (unlikely for 8x8 blocks but possible)
-            if dec_uint8.shape != image.shape: 
-                dec_uint8 = dec_uint8[:image.shape[0], :image.shape[1]]
+            h, w = stream.shape
+            if dec_uint8.shape != (h, w): 
+                dec_uint8 = dec_uint8[:h, :w]
                 
-            dec_float = (dec_uint8.astype(float) / 255.0) * (d_max - d_min) + d_min
-            
-            h, w = image.shape
-            bpp = (f_size * 8) / (h * w)
-            
-            return EncodeResult(decoded_image=dec_float, file_size_bytes=f_size, bpp=bpp)
+            out = dec_uint8.astype(stream.dtype)
+            out /= 255.0 # In place: one float buffer instead of three
+            out *= (stream.d_max - stream.d_min)
+            out += stream.d_min
+            return out
             
         finally:
-            # Cleanup
-            for p in [t_in, t_bpg, t_out]:
+            for p in [t_bpg, t_out]:
                 if p.exists(): p.unlink()
 
+    def compress_decompress(self, image: np.ndarray, q: int) -> EncodeResult:
+        """Cycle: Float -> PNG -> BPG -> PNG -> Float"""
+        stream = self.encode(image, q)
+        dec_float = self.decode(stream)
+        
+        f_size = stream.size_bytes
+        h, w = image.shape
+        bpp = (f_size * 8) / (h * w)
+        
+        return EncodeResult(decoded_image=dec_float, file_size_bytes=f_size, bpp=bpp)
+
     def _run_command(self, cmd):
         startupinfo = None
         if os.name == 'nt':
@@ -1,20 +1,9 @@
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple, Dict, Any
 import platform
-import matplotlib.pyplot as plt
 
-# Global Plotting Configuration (Requested by User)
-plt.rcParams.update({
-    'font.size': 20,
-    'axes.titlesize': 20,
-    'axes.labelsize': 20,
-    'xtick.labelsize': 20,
-    'ytick.labelsize': 20,
-    'legend.fontsize': 20,
-    'figure.titlesize': 20,
-    'font.family': 'serif',
-    'font.serif': ['Times New Roman']
-})
+# Plotting style (fonts) is applied by src.ui.plotters.apply_plot_style,
+# so importing the configuration stays free of matplotlib.
 
 
 @dataclass
@@ -31,6 +20,7 @@ class DataConfig:
     path_noised: str = 'data/NOISED.tiff'
     path_original: str = 'data/ORIGINAL.tiff'
     gen_noise_level: float = 0.05
+    cache_max_mb: float = 512 # Byte budget of the LRU cache for loaded / generated images
 
 @dataclass
 class ExperimentConfig:
@@ -40,6 +30,52 @@ class ExperimentConfig:
     q_step: int = 1
     metrics: List[str] = field(default_factory=lambda: ['psnr', 'psnr_hvsm', 'ssim', 'mse_codec'])
     oop_metric: str = 'psnr' # 'psnr' or 'psnr_hvsm'
+    early_stop_patience: int = 0 # Stop a sweep after N points past the OOP (0 = full sweep)
+    metric_mode: str = 'full'    # 'full' or 'preview' (subsampled blocks with CIs, full check at the OOP)
+    preview_fraction: float = 0.1 # Share of 8x8 blocks / SSIM windows evaluated in preview mode
+    pre_filter: str = 'none'     # Denoising before compression: 'none' or a registered filter ('dct', 'nlm', 'lee', 'frost', ...)
+    filter_params: Dict[str, Any] = field(default_factory=dict) # Constructor arguments of the filter
+    precision: str = 'float64'   # Working dtype of loader, VST, codec restore and metrics: 'float64' or 'float32'
+    metric_threads: Optional[int] = None # Threads per PSNR-HVS(-M) call over tile bands (None = os.cpu_count(), 1 = off)
+
+@dataclass
+class PipelineConfig:
+    """Configuration for the memoized stage graph (src.pipeline)."""
+    max_memory_mb: float = 512      # Byte budget of the in-memory stage memo
+    disk_cache: bool = False        # Also persist stage outputs under results_dir/cache/stages
+
+@dataclass
+class MemoryConfig:
+    """Process memory budget and instrumentation (src.memory)."""
+    budget_mb: float = 2048         # Chunked stages (filters, HVS metrics, codec I/O, plots) size their tiles from it
+    track: str = 'off'              # Per-stage peak memory: 'off', 'rss' (cheap) or 'tracemalloc' (exact, slower)
+
+@dataclass
+class EncoderConfig:
+    """bpgenc effort presets: 'level' (-m, 1 = fastest .. 9 = smallest) and 'encoder' (-e); unset = bpgenc default."""
+    presets: Dict[str, Dict[str, Any]] = field(default_factory=lambda: {
+        'preview': {'level': 1},                       # Fastest encodes, for sweeps
+        'default': {},                                 # bpgenc defaults (-m 8, x265)
+        'final': {'level': 9},                         # Maximum effort
+        'reference': {'level': 9, 'encoder': 'jctvc'}, # Slowest; only if bpgenc was built with JCTVC
+    })
+    sweep_preset: str = 'default' # Used for every Q of the sweeps
+    final_preset: str = 'default' # Re-encode of the chosen OOPs only (same as sweep_preset = no re-encode)
+
+    def settings(self, name: str) -> Dict[str, Any]:
+        if name not in self.presets:
+            raise ValueError(f"Unknown encoder preset '{name}'. Available: {sorted(self.presets)}")
+        return dict(self.presets[name])
+
+@dataclass
+class MonteCarloConfig:
+    """Configuration for Monte Carlo runs over noise realizations (generator source)."""
+    n_realizations: int = 16
+    seed: int = 0
+    n_workers: Optional[int] = None # None = os.cpu_count()
+    batch_size: int = 4             # Realizations generated per worker task
+    confidence: float = 0.95
+    shape: Tuple[int, int] = (400, 400)
 
 @dataclass
 class PlottingConfig:
@@ -52,6 +88,7 @@ class PlottingConfig:
     save_format: str = 'png'
     dpi: int = 300
     show_plots: bool = True
+    live_plots: bool = True # Update curves in place while the sweep runs
 
 @dataclass
 class ExportConfig:
@@ -59,6 +96,8 @@ class ExportConfig:
     save_csv: bool = False
     save_oop_images: bool = False
     results_dir: str = 'results'
+    image_storage: str = 'float32' # Result images: 'float64', 'float32' or 'uint8' (LUT, lossless for decoded images)
+    spill_images: bool = False     # Keep result images as .npy memmaps under results_dir/cache
 
 @dataclass
 class AppConfig:
@@ -69,6 +108,11 @@ class AppConfig:
     experiment: ExperimentConfig = field(default_factory=ExperimentConfig)
     plotting: PlottingConfig = field(default_factory=PlottingConfig)
     export: ExportConfig = field(default_factory=ExportConfig)
+    monte_carlo: MonteCarloConfig = field(default_factory=MonteCarloConfig)
+    pipeline: PipelineConfig = field(default_factory=PipelineConfig)
+    memory: MemoryConfig = field(default_factory=MemoryConfig)
+    encoder: EncoderConfig = field(default_factory=EncoderConfig)
+    service_url: Optional[str] = None # Run analyses on a src.service AnalysisService (e.g. 'http://127.0.0.1:8765')
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'AppConfig':
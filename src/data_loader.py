@@ -1,82 +1,243 @@
 import numpy as np
 import os
-from typing import Tuple, Optional
-from PIL import Image
-
-# Try importing imageio/tifffile
-try:
-    import imageio.v3 as iio
-    HAS_IMAGEIO = True
-except ImportError:
-    HAS_IMAGEIO = False
-
-try:
-    import tifffile
-    HAS_TIFFFILE = True
-except ImportError:
-    HAS_TIFFFILE = False
+from importlib.util import find_spec
+from typing import Tuple, Optional, Iterator
+
+from .cache import ImageCache
+from .memory import budget_rows, get_budget
+
+# Check for imageio/tifffile without importing them (imported on first load)
+HAS_IMAGEIO = find_spec('imageio') is not None
+HAS_TIFFFILE = find_spec('tifffile') is not None
 
 class ImageLoader:
     """Universal loader for TIFF, PNG, and other image formats."""
     
     @staticmethod
-    def load_file(path: str, min_value: float = 1.0) -> np.ndarray:
+    def _read(path: str) -> Tuple[np.ndarray, str]:
         """
-        Detects format by extension, loads image, converts to float,
-        handles RGB->Gray conversion, and removes zeros.
+        Reads the raw array, choosing the backend by extension. Returns (array, axes):
+        one letter per axis as in tifffile, Y / X = rows / columns, S = colour samples,
+        any other letter = frames (pages, bands, time).
         """
         if not os.path.exists(path):
             raise FileNotFoundError(f"File not found: {path}")
             
         _, ext = os.path.splitext(path.lower())
         
-        # 1. LOAD DATA
         if ext in ['.tif', '.tiff'] and HAS_TIFFFILE:
-            image = tifffile.imread(path)
+            import tifffile
+            with tifffile.TiffFile(path) as tif:
+                series = tif.series[0]
+                image, axes = series.asarray(), series.axes
+            if len(axes) == image.ndim:
+                return image, axes
         elif HAS_IMAGEIO:
+            import imageio.v3 as iio
             image = iio.imread(path)
         else:
+            from PIL import Image
             image = np.array(Image.open(path))
+        return image, ImageLoader._guess_axes(image.shape)
+
+    @staticmethod
+    def _guess_axes(shape: Tuple[int, ...]) -> str:
+        """
+        Axes of an array without TIFF metadata: a trailing axis of 3 or 4 is colour,
+        other 3-D arrays hold frames on their smallest axis (so (F, H, W) pages and
+        (H, W, B) bands both work).
+        """
+        if len(shape) == 2:
+            return 'YX'
+        colour = shape[-1] in (3, 4)
+        if len(shape) == 3:
+            if colour:
+                return 'YXS'
+            frames = int(np.argmin(shape))
+            return 'YX'[:frames] + 'I' + 'YX'[frames:]
+        if len(shape) == 4 and colour:
+            return 'IYXS'
+        raise ValueError(f"Unsupported image shape: {shape}")
+
+    @staticmethod
+    def _sanitize(image: np.ndarray, min_value: float) -> np.ndarray:
+        """No NaNs and no zeros (for the Log transform). Works in place on the loader's own copy."""
+        image = np.nan_to_num(image, copy=False)
+        return np.maximum(image, min_value, out=image)
+
+    @staticmethod
+    def _to_gray(image: np.ndarray, axes: str, dtype) -> Tuple[np.ndarray, str]:
+        """Averages the colour samples (S axis), one channel at a time (no float copy of all channels)."""
+        if 'S' not in axes:
+            return image.astype(dtype), axes
+        s = axes.index('S')
+        channels = np.moveaxis(image, s, 0)
+        gray = channels[0].astype(dtype)
+        for c in channels[1:]:
+            gray += c
+        gray /= channels.shape[0]
+        return gray, axes.replace('S', '')
+
+    @staticmethod
+    def load_file(path: str, min_value: float = 1.0, dtype=np.float32) -> np.ndarray:
+        """
+        Detects format by extension, loads image, converts to float (`dtype`, the
+        working precision), handles RGB->Gray conversion, and removes zeros.
+        Multi-frame files (TIFF pages, bands) raise ValueError: see load_stack.
+        """
+        # 1. LOAD DATA
+        image, axes = ImageLoader._read(path)
+        frames = [a for a in axes if a not in 'YXS']
+        if frames:
+            raise ValueError(f"{path} holds {image.shape[axes.index(frames[0])]} frames (shape {image.shape}, "
+                             f"axes {axes}); load it with ImageLoader.load_stack / run_stack_analysis")
 
         # 2. PREPROCESS
-        image = image.astype(np.float32)
-        
         # Handle RGB (H, W, 3) or RGBA (H, W, 4) -> Grayscale (H, W)
-        if image.ndim == 3:
-            image = np.mean(image, axis=2)
+        image, _ = ImageLoader._to_gray(image, axes, dtype)
             
         # 3. SANITIZE (No zeros for Log transform)
-        image = np.nan_to_num(image)
-        image = np.maximum(image, min_value)
-        
-        return image
+        return ImageLoader._sanitize(image, min_value)
+
+    @staticmethod
+    def load_stack(path: str, min_value: float = 1.0, frame_axis: Optional[int] = None,
+                   dtype=np.float32) -> np.ndarray:
+        """
+        Loads a multi-frame / multi-band image as a (F, H, W) float stack (`dtype`)
+        instead of averaging the frames.
+        Args:
+            frame_axis: Axis of the 3-D array holding the frames. By default it comes
+                from the TIFF metadata, or else a trailing axis of 3 or 4 is colour
+                (averaged, F = 1) and the smallest axis of other 3-D arrays holds the frames.
+        Returns:
+            (F, H, W) array; a single 2-D image gives F = 1.
+        """
+        image, axes = ImageLoader._read(path)
+        if 'S' in axes and (image.shape[axes.index('S')] not in (3, 4) or (frame_axis is not None and image.ndim == 3)):
+            axes = axes.replace('S', 'I') # Per-pixel samples that are not colour (or named as frames): bands
+
+        # Colour frames -> grayscale frames
+        image, axes = ImageLoader._to_gray(image, axes, dtype)
+        if frame_axis is not None:
+            if image.ndim != 3:
+                raise ValueError(f"frame_axis needs a 3-D image, got shape {image.shape}")
+            axes = 'YX'[:frame_axis % 3] + 'I' + 'YX'[frame_axis % 3:]
+        frames = [i for i, a in enumerate(axes) if a not in 'YX']
+        if len(frames) > 1:
+            raise ValueError(f"Unsupported image shape for a stack: {image.shape} (axes {axes})")
+        image = np.moveaxis(image, frames[0], 0) if frames else image[None]
+
+        return ImageLoader._sanitize(np.ascontiguousarray(image), min_value)
+
+# Clean synthetic scenes by (shape, dtype); sized from the memory budget in get_clean
+_CLEAN_CACHE = ImageCache(0)
 
 class SyntheticGenerator:
     """Generates synthetic SAR patterns."""
+    CLEAN_CACHE_FRACTION = 0.25 # Share of the memory budget for cached clean scenes
     
     @staticmethod
-    def get_data(noise_level: float = 0.25, shape: Tuple[int, int] = (400, 400)) -> Tuple[np.ndarray, np.ndarray]:
+    def get_clean(shape: Tuple[int, int] = (400, 400), dtype=np.float64) -> np.ndarray:
         """
-        Generates clean and noised synthetic SAR images.
-        Returns: (clean, noised)
+        Clean synthetic scene, cached per shape and dtype (read-only array).
+        Any size: the scene is built in row bands (float64 arithmetic, stored as
+        `dtype`), so the temporaries stay small even for 16k x 16k scenes. The cache
+        holds at most CLEAN_CACHE_FRACTION of the memory budget; larger scenes are
+        rebuilt on every call.
         """
-        x, y = np.meshgrid(np.linspace(0, 1, shape[0]), np.linspace(0, 1, shape[1]))
-        
-        clean = 100 * (x + y) + 50
-        
-        # Add circle feature
-        mask_circle = (x - 0.6)**2 + (y - 0.6)**2 < 0.05
-        clean[mask_circle] += 150
+        shape, dtype = tuple(shape), np.dtype(dtype).str
+        _CLEAN_CACHE.max_bytes = int(get_budget() * SyntheticGenerator.CLEAN_CACHE_FRACTION)
+        return _CLEAN_CACHE.get_or_load((shape, dtype), lambda: SyntheticGenerator._build_clean(shape, dtype))
+
+    @staticmethod
+    def _build_clean(shape: Tuple[int, int], dtype: str) -> np.ndarray:
+        clean = np.empty(shape, dtype=dtype)
+        x = np.linspace(0, 1, shape[1])[None, :]
+        ys = np.linspace(0, 1, shape[0])[:, None]
+        step = budget_rows(shape[1] * 8 * 4, fraction=0.1)
+
+        for r0 in range(0, shape[0], step):
+            y = ys[r0:r0 + step]
+            band = 100 * (x + y) + 50
+
+            # Add circle feature
+            mask_circle = (x - 0.6)**2 + (y - 0.6)**2 < 0.05
+            band[mask_circle] += 150
+
+            # Add dark square feature
+            mask_dark = (np.abs(x - 0.3) < 0.1) & (np.abs(y - 0.3) < 0.1)
+            band[mask_dark] = 1.0
+            clean[r0:r0 + step] = band
         
-        # Add dark square feature
-        mask_dark = (np.abs(x - 0.3) < 0.1) & (np.abs(y - 0.3) < 0.1)
-        clean[mask_dark] = 1.0 
+        clean.flags.writeable = False
+        return clean
+
+    @staticmethod
+    def get_speckle(noise_level: float, shape: Tuple[int, int],
+                    rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Unit-mean Gamma speckle. Uses the global np.random state (float64) when rng is None,
+        otherwise draws float32 samples from the given Generator.
+        """
+        k = 1 / (noise_level ** 2)
+        if rng is None:
+            return np.random.gamma(k, 1.0, shape) / k
+        noise = rng.standard_gamma(k, size=shape, dtype=np.float32)
+        noise /= np.float32(k)
+        return noise
+
+    @staticmethod
+    def get_data(noise_level: float = 0.25, shape: Tuple[int, int] = (400, 400),
+                 rng: Optional[np.random.Generator] = None, dtype=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Generates clean and noised synthetic SAR images of any size.
+        Args:
+            dtype: Precision of both images (None: float64 clean, noised in the
+                precision of the speckle draw, see get_speckle).
+        Returns: (clean, noised)
+        """
+        clean = SyntheticGenerator.get_clean(tuple(shape), dtype or np.float64)
         
         # Add Speckle Noise (Gamma distributed)
-        k = 1 / (noise_level ** 2)
-        noise = np.random.gamma(k, 1.0, shape) / k
+        noise = SyntheticGenerator.get_speckle(noise_level, shape, rng)
+        if dtype is not None:
+            noise = noise.astype(dtype, copy=False)
         
-        noised = clean * noise
-        noised = np.maximum(noised, 1.0)
+        # In place on the speckle buffer (no full-size temporary)
+        noised = np.multiply(noise, clean, out=noise, dtype=noise.dtype)
+        noised = np.maximum(noised, 1.0, out=noised)
         
-        return clean, noised
\ No newline at end of file
+        return clean, noised
+
+    @staticmethod
+    def iter_realizations(noise_level: float, n: int, seed: int = 0,
+                          shape: Tuple[int, int] = (400, 400),
+                          batch_size: int = 8, start: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields (first_index, batch) with float32 batches of shape (B, H, W) holding
+        noised realizations start .. start + n - 1. Realization i is drawn from
+        np.random.default_rng([seed, i]), so it does not depend on batching or workers.
+        """
+        clean = SyntheticGenerator.get_clean(tuple(shape)).astype(np.float32)
+        for first in range(start, start + n, batch_size):
+            count = min(batch_size, start + n - first)
+            batch = np.empty((count, *shape), dtype=np.float32)
+            for j in range(count):
+                rng = np.random.default_rng([seed, first + j])
+                batch[j] = SyntheticGenerator.get_speckle(noise_level, shape, rng)
+            batch *= clean
+            np.maximum(batch, 1.0, out=batch)
+            yield first, batch
+
+
+def decimate(image: Optional[np.ndarray], factor: int) -> Optional[np.ndarray]:
+    """
+    Pyramid level for preview sweeps: every `factor`-th pixel along both axes, without
+    a low-pass. Each kept pixel carries its own speckle sample, so the noise statistics
+    (looks, coefficient of variation) match the full image; block averaging would
+    multi-look the speckle and bias the preview towards a lighter-noise OOP.
+    Applied to a (clean, noised) pair it keeps the two pixel-aligned.
+    """
+    if image is None or factor <= 1:
+        return image
+    return np.ascontiguousarray(image[..., ::factor, ::factor])
@@ -0,0 +1,414 @@
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import VSTConfig
+from .experiments import RateDistortionRunner
+from .interfaces import BaseCodec
+from .memory import get_budget
+from .pipeline import fingerprint
+
+# Shared-directory job queue for Q sweeps. Layout under the queue root:
+#   inputs/<digest>.npy        images, stored once per content
+#   jobs/<job_id>.pkl          job spec: one (image, domain, Q-chunk)
+#   claims/<job_id>.claim      created with O_EXCL by the worker that owns the job;
+#                              its mtime is the worker's heartbeat
+#   results/<job_id>.pkl       partial curve + HVS maps of the chunk
+#   errors/<job_id>.txt        traceback of a failed job
+# Every file is written to a temporary name and moved into place with os.replace,
+# so readers on other hosts never see partial files (requires a filesystem with
+# atomic rename and O_EXCL create, e.g. local disks, NFSv3+, SMB). A batch's job,
+# claim, result and error files are removed once it is merged or has failed
+# (SweepCoordinator.run_curves), and so are its inputs unless a job of another
+# batch still references them (inputs are shared by content).
+
+DIRS = ('inputs', 'jobs', 'claims', 'results', 'errors')
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_pickle(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class FileJobQueue:
+    """Paths and primitive operations on a queue directory (shared by both sides)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        for d in DIRS:
+            os.makedirs(os.path.join(root, d), exist_ok=True)
+
+    def path(self, kind: str, job_id: str) -> str:
+        ext = {'jobs': 'pkl', 'claims': 'claim', 'results': 'pkl', 'errors': 'txt'}[kind]
+        return os.path.join(self.root, kind, f"{job_id}.{ext}")
+
+    def pending(self) -> List[str]:
+        """Job ids without a result or error, oldest first."""
+        done = {os.path.splitext(n)[0] for n in os.listdir(os.path.join(self.root, 'results'))}
+        done |= {os.path.splitext(n)[0] for n in os.listdir(os.path.join(self.root, 'errors'))}
+        names = sorted(n for n in os.listdir(os.path.join(self.root, 'jobs')) if n.endswith('.pkl'))
+        return [job_id for job_id in (os.path.splitext(n)[0] for n in names) if job_id not in done]
+
+    # --- Inputs ---
+
+    def put_image(self, image: Optional[np.ndarray], name: Optional[str] = None) -> Optional[str]:
+        """
+        Stores an image once per content. Returns its name under inputs/ (None for None).
+        name: The name a previous call returned for this image (skips hashing it again).
+        """
+        if image is None:
+            return None
+        name = name or f"{fingerprint(image)}.npy"
+        path = os.path.join(self.root, 'inputs', name)
+        if not os.path.exists(path):
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp.npy"
+            np.save(tmp, np.ascontiguousarray(image))
+            os.replace(tmp, path)
+        return name
+
+    def get_image(self, name: Optional[str]) -> Optional[np.ndarray]:
+        if name is None:
+            return None
+        return np.load(os.path.join(self.root, 'inputs', name))
+
+    # --- Claims ---
+
+    def claim(self, job_id: str, worker_id: str) -> bool:
+        """Atomically claims a job (O_EXCL create). False if someone else holds it."""
+        try:
+            fd = os.open(self.path('claims', job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(worker_id)
+        return True
+
+    def reclaim_stale(self, job_id: str, stale_after_s: float) -> bool:
+        """
+        Removes a claim whose heartbeat is older than stale_after_s. The claim is first
+        renamed to a unique name, so of several workers noticing it only one removes it.
+        """
+        path = self.path('claims', job_id)
+        try:
+            if time.time() - os.path.getmtime(path) < stale_after_s:
+                return False
+            grave = f"{path}.{uuid.uuid4().hex[:8]}.stale"
+            os.rename(path, grave)
+        except FileNotFoundError:
+            return False
+        os.remove(grave)
+        return True
+
+    def heartbeat(self, job_id: str):
+        try:
+            os.utime(self.path('claims', job_id))
+        except FileNotFoundError: # Reclaimed meanwhile; the result is still accepted
+            pass
+
+    def release(self, job_id: str, worker_id: str):
+        """Removes the claim if it is still held by worker_id (it may have been taken over)."""
+        path = self.path('claims', job_id)
+        try:
+            with open(path) as f:
+                if f.read() != worker_id: return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, job_ids: Sequence[str]):
+        """
+        Deletes the files of finished (or abandoned) jobs. The job spec goes first, so
+        workers stop seeing a job that is not done yet.
+        """
+        for job_id in job_ids:
+            for kind in ('jobs', 'results', 'errors', 'claims'):
+                try:
+                    os.remove(self.path(kind, job_id))
+                except FileNotFoundError:
+                    pass
+
+    def referenced_inputs(self) -> set:
+        """Input names used by the queued job specs."""
+        names = set()
+        for n in os.listdir(os.path.join(self.root, 'jobs')):
+            if not n.endswith('.pkl'): continue
+            try:
+                job = _read_pickle(os.path.join(self.root, 'jobs', n))
+            except (FileNotFoundError, EOFError): # Removed meanwhile
+                continue
+            names.update(job[k] for k in ('ref', 'noised') if job.get(k))
+        return names
+
+    def remove_inputs(self, names: Sequence[Optional[str]]):
+        """Deletes the given inputs unless a queued job still references them."""
+        keep = self.referenced_inputs()
+        for name in set(names) - keep - {None}:
+            try:
+                os.remove(os.path.join(self.root, 'inputs', name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Removes all jobs, claims, results, errors and inputs."""
+        for d in DIRS:
+            folder = os.path.join(self.root, d)
+            for name in os.listdir(folder):
+                os.remove(os.path.join(folder, name))
+
+
+# --- Worker side ---
+
+class QueueWorker:
+    """
+    Executes queued sweep chunks: claims a job, runs RateDistortionRunner.run_curve on
+    its Qs while a thread refreshes the claim's heartbeat, writes the result and
+    releases the claim. Claims with a heartbeat older than stale_after_s (crashed or
+    lost worker) are taken over.
+    """
+
+    def __init__(self, root: str, codec: BaseCodec, worker_id: Optional[str] = None,
+                 heartbeat_s: float = 5.0, stale_after_s: float = 60.0, poll_s: float = 1.0):
+        self.queue = FileJobQueue(root)
+        self.codec = codec
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:4]}"
+        self.heartbeat_s = heartbeat_s
+        self.stale_after_s = stale_after_s
+        self.poll_s = poll_s
+        self.jobs_done = 0
+
+    def _next_job(self) -> Optional[str]:
+        for job_id in self.queue.pending():
+            if self.queue.claim(job_id, self.worker_id):
+                return job_id
+            if self.queue.reclaim_stale(job_id, self.stale_after_s) and self.queue.claim(job_id, self.worker_id):
+                return job_id
+        return None
+
+    def run(self, max_jobs: Optional[int] = None, idle_timeout: Optional[float] = None) -> int:
+        """
+        Processes jobs until max_jobs are done or the queue stayed empty for idle_timeout
+        seconds (None = run forever). Returns the number of jobs done.
+        """
+        idle_since = time.time()
+        while max_jobs is None or self.jobs_done < max_jobs:
+            job_id = self._next_job()
+            if job_id is None:
+                if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                    break
+                time.sleep(self.poll_s)
+                continue
+            self.process(job_id)
+            idle_since = time.time()
+        return self.jobs_done
+
+    def process(self, job_id: str):
+        """Runs one claimed job and publishes its result (or error)."""
+        try:
+            job = _read_pickle(self.queue.path('jobs', job_id))
+        except FileNotFoundError: # Batch removed (merged or abandoned) after the listing
+            self.queue.release(job_id, self.worker_id)
+            return
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_s):
+                self.queue.heartbeat(job_id)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        try:
+            t0 = time.perf_counter()
+            curve, maps = run_job(job, self.codec, self.queue)
+            if not os.path.exists(self.queue.path('jobs', job_id)):
+                return # Abandoned meanwhile: a result file would never be collected
+            result = {'curve': curve, 'maps': maps, 'worker': self.worker_id,
+                      'elapsed_s': time.perf_counter() - t0}
+            _atomic_write(self.queue.path('results', job_id), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            _atomic_write(self.queue.path('errors', job_id),
+                          f"{self.worker_id}\n{traceback.format_exc()}".encode())
+        finally:
+            stop.set()
+            beater.join()
+            self.queue.release(job_id, self.worker_id)
+            self.jobs_done += 1
+
+
+def run_job(job: Dict[str, Any], codec: BaseCodec,
+            queue: FileJobQueue) -> Tuple[Dict[str, np.ndarray], Dict[int, Dict[str, np.ndarray]]]:
+    """One (image, domain, Q-chunk) sweep. Returns (curve columns, per-Q HVS maps)."""
+    if job.get('encoder') and hasattr(codec, 'with_settings'):
+        codec = codec.with_settings(**job['encoder'])
+    runner = RateDistortionRunner(codec, job['metrics'], metric_mode=job['metric_mode'],
+                                  preview_fraction=job['preview_fraction'], preview_seed=job['preview_seed'])
+    runner.pre_filter = job['pre_filter']
+    curve = runner.run_curve(queue.get_image(job['ref']), queue.get_image(job['noised']), job['vst'],
+                             job['q_values'], use_vst=(job['domain'] == 'vst'))
+    return curve, runner.last_maps
+
+
+# --- Coordinator side ---
+
+class SweepCoordinator:
+    """
+    Splits sweeps into (image, domain, Q-chunk) jobs on a FileJobQueue, waits for the
+    workers and merges the partial curves back into the per-domain columns that
+    RateDistortionRunner.run_curve returns (sorted by Q).
+    """
+
+    def __init__(self, root: str, chunk_size: int = 8, poll_s: float = 0.5):
+        self.queue = FileJobQueue(root)
+        self.chunk_size = chunk_size
+        self.poll_s = poll_s
+
+    def submit(self, runner: RateDistortionRunner, img_clean: Optional[np.ndarray], img_noised: np.ndarray,
+               vst_config: VSTConfig, q_range: List[int],
+               domains: Sequence[str] = ('vst', 'linear'), image_id: str = 'image') -> List[str]:
+        """
+        Queues the sweeps of one image. The runner only provides the settings (metrics,
+        metric mode, pre_filter, encoder preset); workers use their own codec. Returns the job ids.
+        """
+        ref_name, noised_name = self.queue.put_image(img_clean), self.queue.put_image(img_noised)
+        settings = {
+            'metrics': list(runner.metrics_to_compute), 'metric_mode': runner.metric_mode,
+            'preview_fraction': runner.preview_fraction, 'preview_seed': runner.preview_seed,
+            'pre_filter': runner.pre_filter,
+            'encoder': getattr(runner.codec, 'settings', None), # Sweep preset (bpgenc -m / -e)
+        }
+        batch = uuid.uuid4().hex[:8]
+        job_ids = []
+        for domain in domains:
+            for i in range(0, len(q_range), self.chunk_size):
+                q_values = list(q_range[i:i + self.chunk_size])
+                job_id = f"{batch}-{image_id}-{domain}-{i // self.chunk_size:04d}"
+                job = {'job_id': job_id, 'image_id': image_id, 'domain': domain, 'q_values': q_values,
+                       'ref': ref_name, 'noised': noised_name, 'vst': vst_config, **settings}
+                _atomic_write(self.queue.path('jobs', job_id), pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL))
+                job_ids.append(job_id)
+        # Another batch's cleanup may have removed a shared input before these jobs were
+        # visible to it; now that they are, store it again if so
+        self.queue.put_image(img_clean, ref_name)
+        self.queue.put_image(img_noised, noised_name)
+        return job_ids
+
+    def wait(self, job_ids: List[str], timeout: Optional[float] = None,
+             progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Blocks until every job has a result. Raises RuntimeError on a failed job and
+        TimeoutError after `timeout` seconds. The files stay until queue.remove(job_ids)
+        (run_curves does that).
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        start = time.time()
+        while len(results) < len(job_ids):
+            for job_id in job_ids:
+                if job_id in results: continue
+                if os.path.exists(self.queue.path('errors', job_id)):
+                    with open(self.queue.path('errors', job_id)) as f:
+                        raise RuntimeError(f"Job {job_id} failed on worker {f.read()}")
+                path = self.queue.path('results', job_id)
+                if os.path.exists(path):
+                    results[job_id] = {**_read_pickle(path), 'job': _read_pickle(self.queue.path('jobs', job_id))}
+                    if progress_callback: progress_callback(len(results), len(job_ids))
+            if len(results) < len(job_ids):
+                if timeout is not None and time.time() - start > timeout:
+                    raise TimeoutError(f"{len(job_ids) - len(results)} of {len(job_ids)} jobs still pending")
+                time.sleep(self.poll_s)
+        return results
+
+    @staticmethod
+    def merge(results: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """(image_id, domain) -> {'curve': columns sorted by Q, 'maps': {q: maps}}."""
+        parts: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for res in results.values():
+            parts.setdefault((res['job']['image_id'], res['job']['domain']), []).append(res)
+
+        merged = {}
+        for key, chunks in parts.items():
+            columns: Dict[str, List[Any]] = {}
+            maps: Dict[int, Dict[str, np.ndarray]] = {}
+            for res in chunks:
+                for k, v in res['curve'].items():
+                    columns.setdefault(k, []).extend(np.asarray(v).tolist())
+                maps.update(res['maps'])
+            order = np.argsort(columns.get('q', []), kind='stable')
+            curve = {k: np.asarray(v)[order] for k, v in RateDistortionRunner.to_columns(columns).items()}
+            merged[key] = {'curve': curve, 'maps': maps}
+        return merged
+
+    def run_curves(self, runner: RateDistortionRunner, img_clean: Optional[np.ndarray], img_noised: np.ndarray,
+                   vst_config: VSTConfig, q_range: List[int], domains: Sequence[str] = ('vst', 'linear'),
+                   timeout: Optional[float] = None,
+                   progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        submit + wait + merge for one image: domain -> {'curve', 'maps'}. The batch's
+        files (and inputs no other job uses) are removed afterwards, also when a job
+        failed or the wait timed out.
+        """
+        job_ids = self.submit(runner, img_clean, img_noised, vst_config, q_range, domains)
+        job = _read_pickle(self.queue.path('jobs', job_ids[0]))
+        try:
+            merged = self.merge(self.wait(job_ids, timeout, progress_callback))
+        finally:
+            self.queue.remove(job_ids)
+            self.queue.remove_inputs([job['ref'], job['noised']])
+        return {domain: merged.get(('image', domain), {'curve': {}, 'maps': {}}) for domain in domains}
+
+
+def spawn_local_workers(root: str, n_workers: int, bpg_path: str,
+                        idle_timeout: Optional[float] = None) -> List[subprocess.Popen]:
+    """Starts n worker processes on this machine (python -m src.distributed ...) with this process's memory budget."""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, '-m', 'src.distributed', root, '--bpg-path', bpg_path,
+           '--memory-budget-mb', str(get_budget() / 1024 ** 2)]
+    if idle_timeout is not None:
+        cmd += ['--idle-timeout', str(idle_timeout)]
+    return [subprocess.Popen(cmd, cwd=package_root) for _ in range(n_workers)]
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    from .codec import BPGCodec
+
+    parser = argparse.ArgumentParser(description="Worker for the shared-directory sweep queue.")
+    parser.add_argument('queue_dir', help="Queue root shared with the coordinator")
+    parser.add_argument('--bpg-path', default='libbpg', help="Folder with bpgenc / bpgdec")
+    parser.add_argument('--heartbeat', type=float, default=5.0, help="Heartbeat period (s)")
+    parser.add_argument('--stale-after', type=float, default=60.0, help="Take over claims older than this (s)")
+    parser.add_argument('--idle-timeout', type=float, default=None, help="Exit after this long without jobs (s)")
+    parser.add_argument('--max-jobs', type=int, default=None)
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help="Memory budget for the chunked stages (default: 2048)")
+    parser.add_argument('--metric-threads', type=int, default=1,
+                        help="Threads per PSNR-HVS-M call (default 1: workers already run side by side)")
+    args = parser.parse_args(argv)
+    if args.memory_budget_mb is not None:
+        from .memory import set_budget
+        set_budget(args.memory_budget_mb)
+    from .psnr_hvsm import set_metric_threads
+    set_metric_threads(args.metric_threads)
+
+    codec = BPGCodec(args.bpg_path) # Temp files are uniquely named, so workers can share the folder
+    worker = QueueWorker(args.queue_dir, codec, heartbeat_s=args.heartbeat, stale_after_s=args.stale_after)
+    done = worker.run(max_jobs=args.max_jobs, idle_timeout=args.idle_timeout)
+    print(f"{worker.worker_id}: {done} jobs done")
+
+
+if __name__ == "__main__":
+    main()
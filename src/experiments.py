@@ -1,85 +1,534 @@
+import os
 import numpy as np
-from typing import List, Dict, Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Iterator, Tuple
 from .config import VSTConfig
 from .transform import VarianceStabilizer
-from .interfaces import BaseCodec, MetricRegistry
+from .interfaces import BaseCodec, MetricRegistry, EncodeResult, EncodedStream, BaseFilter
 from .metrics import QualityMetrics # triggers registration
+from .pipeline import Pipeline, StageRef
+
+# --- Stage functions (pure; everything that affects the output is an input or a parameter) ---
+
+def _forward_stage(img: np.ndarray, vst: VSTConfig) -> np.ndarray:
+    return VarianceStabilizer(vst).forward(img)
+
+def _inverse_stage(img: np.ndarray, vst: VSTConfig) -> np.ndarray:
+    return VarianceStabilizer(vst).inverse(img)
+
+def _filter_stage(img: np.ndarray, flt: BaseFilter) -> np.ndarray:
+    if img.ndim == 3:
+        return np.stack([flt.apply(frame) for frame in img])
+    return flt.apply(img)
+
+def _encode_stage(img: np.ndarray, codec: BaseCodec, q: int) -> EncodedStream:
+    return codec.encode(img, q)
+
+def _decode_stage(stream: EncodedStream, codec: BaseCodec) -> np.ndarray:
+    return codec.decode(stream)
+
+def _codec_stage(img: np.ndarray, codec: BaseCodec, q: int) -> EncodeResult:
+    return codec.compress_decompress(img, q)
+
+def _decoded_image_stage(res: EncodeResult) -> np.ndarray:
+    return res.decoded_image
+
+def _codec_stats_stage(img: np.ndarray, coded: Any, decoded: np.ndarray) -> Dict[str, float]:
+    size = coded.size_bytes if isinstance(coded, EncodedStream) else coded.file_size_bytes
+    h, w = img.shape
+    return {
+        'bpp': size * 8 / (h * w),
+        'file_size_kb': size / 1024.0,
+        'cr': h * w / size if size > 0 else 0,
+        'mse_codec': np.mean((img - decoded) ** 2),
+    }
 
 class RateDistortionRunner:
-    def __init__(self, codec: BaseCodec, metrics_to_compute: Optional[List[str]] = None):
+    def __init__(self, codec: BaseCodec, metrics_to_compute: Optional[List[str]] = None,
+                 metric_mode: str = 'full', preview_fraction: float = 0.1, preview_seed: int = 0):
         self.codec = codec
         self.metrics_to_compute = metrics_to_compute or list(MetricRegistry.get_all().keys())
+        # 'preview': metrics with a registered estimator are computed on a block subsample
+        # and reported with '<name>_ci_low' / '<name>_ci_high' columns
+        self.metric_mode = metric_mode
+        self.preview_fraction = preview_fraction
+        self.preview_seed = preview_seed
+        # Per-tile PSNR-HVS / HVS-M maps of the last sweep, keyed by Q (filled as a by-product
+        # of the full HVS metrics, see full_metrics)
+        self.last_maps: Dict[int, Dict[str, np.ndarray]] = {}
+        # Optional denoising stage before compression (see src.filters)
+        self.pre_filter: Optional[BaseFilter] = None
+        self._prepared_src: Optional[np.ndarray] = None
+        self._prepared: Dict[Tuple, np.ndarray] = {}
+        # Optional stage graph: when set, every step (filter, transform, encode, decode,
+        # inverse, metrics) is a memoized node, so reruns only execute what changed
+        self.pipeline: Optional[Pipeline] = None
+        # Optional codec for the chosen OOPs only (e.g. maximum encoder effort while the
+        # sweeps use a fast preset); None = the OOPs keep their sweep encodes
+        self.final_codec: Optional[BaseCodec] = None
 
-    def run_curve(self, 
-                  img_clean: np.ndarray, 
-                  img_noised: np.ndarray, 
-                  vst_config: VSTConfig, 
-                  q_range: List[int], 
-                  use_vst: bool = True, 
-                  progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, List[Any]]:
-        
-        results = {m: [] for m in self.metrics_to_compute}
-        results.update({
-            'q': [], 'bpp': [], 'file_size_kb': [], 'cr': [], 'mse_codec': []
-        })
-        
-        if use_vst:
-            vst = VarianceStabilizer(vst_config)
-            img_to_compress = vst.forward(img_noised)
+    def _prepare(self, img_noised: np.ndarray, vst_config: VSTConfig, use_vst: bool):
+        """
+        Returns (image fed to the codec, VST or None).
+        With a pre_filter, the filter runs in its own domain: a 'vst' filter on the
+        forward transform (mapped back for the linear path), a 'linear' filter on the
+        input. Filtered images are memoized per source image, so the sweeps and the
+        OOP re-encodes filter only once.
+        """
+        vst = VarianceStabilizer(vst_config) if use_vst else None
+        if self.pipeline is not None:
+            return self._graph_input(img_noised, vst_config, use_vst).value, vst
+        if self.pre_filter is None:
+            return (vst.forward(img_noised) if vst else img_noised), vst
+
+        if self._prepared_src is not img_noised:
+            # Keyed by identity: holding the source (and filter) keeps the ids unique
+            self._prepared_src, self._prepared = img_noised, {}
+        key = (use_vst, vst_config.a, vst_config.b, vst_config.epsilon, self.pre_filter)
+        if key not in self._prepared:
+            self._prepared[key] = self._apply_filter(img_noised, vst_config, use_vst)
+        return self._prepared[key], vst
+
+    def _apply_filter(self, img_noised: np.ndarray, vst_config: VSTConfig, use_vst: bool) -> np.ndarray:
+        """Runs pre_filter on an (H, W) image or frame by frame on a (F, H, W) stack."""
+        flt = self.pre_filter
+        vst = VarianceStabilizer(vst_config)
+
+        def run(img: np.ndarray) -> np.ndarray:
+            if flt.domain == 'vst':
+                out = flt.apply(vst.forward(img))
+                return out if use_vst else vst.inverse(out)
+            out = flt.apply(img)
+            return vst.forward(out) if use_vst else out
+
+        if img_noised.ndim == 3:
+            return np.stack([run(frame) for frame in img_noised])
+        return run(img_noised)
+
+    # --- Stage graph ---
+
+    def _graph_input(self, img_noised: np.ndarray, vst_config: VSTConfig, use_vst: bool) -> StageRef:
+        """Nodes up to the codec input: source -> [filter] -> [transform] -> [filter -> inverse]."""
+        pipe = self.pipeline
+        flt = self.pre_filter
+        node = pipe.source('source', img_noised)
+        if flt is not None and flt.domain == 'linear':
+            node = pipe.stage('filter', _filter_stage, node, flt=flt)
+        if use_vst or (flt is not None and flt.domain == 'vst'):
+            node = pipe.stage('transform', _forward_stage, node, vst=vst_config)
+        if flt is not None and flt.domain == 'vst':
+            node = pipe.stage('filter', _filter_stage, node, flt=flt)
+            if not use_vst:
+                node = pipe.stage('inverse', _inverse_stage, node, vst=vst_config)
+        return node
+
+    def _graph_point(self, prep: StageRef, q: int, vst_config: VSTConfig,
+                     use_vst: bool, codec: Optional[BaseCodec] = None) -> Tuple[StageRef, StageRef]:
+        """Nodes for one Q: encode -> decode -> [inverse]. Returns (codec stats, restored image)."""
+        pipe = self.pipeline
+        codec = codec or self.codec
+        if type(codec).encode is BaseCodec.encode:
+            # Codec without encode-only support: one combined node
+            coded = pipe.stage('codec', _codec_stage, prep, codec=codec, q=q)
+            decoded = pipe.stage('decode', _decoded_image_stage, coded)
         else:
-            img_to_compress = img_noised
+            coded = pipe.stage('encode', _encode_stage, prep, codec=codec, q=q)
+            decoded = pipe.stage('decode', _decode_stage, coded, codec=codec)
+        restored = pipe.stage('inverse', _inverse_stage, decoded, vst=vst_config) if use_vst else decoded
+        stats = pipe.stage('codec_stats', _codec_stats_stage, prep, coded, decoded)
+        return stats, restored
+
+    def _metrics_stage(self, ref_img: np.ndarray, img_restored: np.ndarray, metrics: Tuple[str, ...],
+                       mode: str, fraction: float, seed: int) -> Dict[str, Any]:
+        """Metric node: {'values': {...}, 'maps': per-tile HVS maps (full mode)}."""
+        if mode == 'preview':
+            return {'values': self.preview_metrics(ref_img, img_restored), 'maps': {}}
+        maps = {}
+        return {'values': self.full_metrics(ref_img, img_restored, maps), 'maps': maps}
+
+    def _graph_record(self, prep: StageRef, ref: StageRef, q: int,
+                      vst_config: VSTConfig, use_vst: bool) -> Dict[str, Any]:
+        stats, restored = self._graph_point(prep, q, vst_config, use_vst)
+        scores = self.pipeline.stage('metrics', self._metrics_stage, ref, restored,
+                                     metrics=tuple(self.metrics_to_compute), mode=self.metric_mode,
+                                     fraction=self.preview_fraction, seed=self.preview_seed).value
+        if scores['maps']: self.last_maps[q] = scores['maps']
+        return {'q': q, **stats.value, **scores['values']}
+
+    def restore(self, img_noised: np.ndarray, vst_config: VSTConfig, q: int, use_vst: bool = True) -> np.ndarray:
+        """Image after the full chain (prepare, codec, inverse) at one Q. A memo hit after a sweep."""
+        if self.pipeline is not None:
+            _, restored = self._graph_point(self._graph_input(img_noised, vst_config, use_vst), q, vst_config, use_vst)
+            return restored.value
+        to_compress, vst = self._prepare(img_noised, vst_config, use_vst)
+        decoded = self.codec.compress_decompress(to_compress, q=q).decoded_image
+        return vst.inverse(decoded) if vst is not None else decoded
+
+    def final_record(self, img_clean: Optional[np.ndarray], img_noised: np.ndarray, vst_config: VSTConfig,
+                     q: int, use_vst: bool = True) -> Tuple[Dict[str, Any], np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Re-encodes one (chosen) Q with final_codec and scores it with the full metrics.
+        Returns (record, restored image, per-tile HVS maps).
+        """
+        codec = self.final_codec or self.codec
+        ref_img = img_clean if img_clean is not None else img_noised
+        if self.pipeline is not None:
+            prep = self._graph_input(img_noised, vst_config, use_vst)
+            stats, restored = self._graph_point(prep, q, vst_config, use_vst, codec)
+            scores = self.pipeline.stage('metrics', self._metrics_stage, self.pipeline.source('source', ref_img),
+                                         restored, metrics=tuple(self.metrics_to_compute), mode='full',
+                                         fraction=self.preview_fraction, seed=self.preview_seed).value
+            return {'q': q, **stats.value, **scores['values']}, restored.value, scores['maps']
+
+        to_compress, vst = self._prepare(img_noised, vst_config, use_vst)
+        res = codec.compress_decompress(to_compress, q=q)
+        img_restored = vst.inverse(res.decoded_image) if vst is not None else res.decoded_image
+        maps = {}
+        record = {'q': q, **_codec_stats_stage(to_compress, res, res.decoded_image),
+                  **self.full_metrics(ref_img, img_restored, maps)}
+        return record, img_restored, maps
+
+    def _score(self, q: int, res: EncodeResult, img_to_compress: np.ndarray,
+               vst: Optional[VarianceStabilizer], ref_img: np.ndarray) -> Tuple[Dict[str, Any], np.ndarray]:
+        """Builds the record for one decoded Q. Returns (record, restored image)."""
+        img_decoded = res.decoded_image
+        f_size_bytes = res.file_size_bytes
+        h, w = img_to_compress.shape
+        original_size_bytes = h * w
+
+        # 2. MSE of Codec (Internal domain)
+        mse_internal = np.mean((img_to_compress - img_decoded) ** 2)
+
+        # 3. Inverse Transform (if needed)
+        if vst is not None:
+            img_restored = vst.inverse(img_decoded)
+        else:
+            img_restored = img_decoded
+
+        # 4. Metrics
+        record = {
+            'q': q,
+            'bpp': res.bpp,
+            'file_size_kb': f_size_bytes / 1024.0,
+            'cr': original_size_bytes / f_size_bytes if f_size_bytes > 0 else 0,
+            'mse_codec': mse_internal,
+        }
+
+        # 5. Dynamic Metrics
+        if self.metric_mode == 'preview':
+            record.update(self.preview_metrics(ref_img, img_restored))
+        else:
+            maps = {}
+            record.update(self.full_metrics(ref_img, img_restored, maps))
+            if maps: self.last_maps[q] = maps
+
+        return record, img_restored
+
+    def full_metrics(self, ref_img: np.ndarray, img_restored: np.ndarray,
+                     maps: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, float]:
+        """
+        Every configured metric over all pixels.
+        PSNR-HVS and PSNR-HVS-M share one DCT pass; its per-tile quality maps are
+        written into `maps` (if given) at no extra cost.
+        """
+        values = {}
+        hvs_names = [m for m in ('psnr_hvs', 'psnr_hvsm') if m in self.metrics_to_compute]
+        if hvs_names:
+            hvs, hvsm, tile_maps = QualityMetrics.compute_hvs_quality_maps(ref_img, img_restored)
+            hvs_values = {'psnr_hvs': hvs, 'psnr_hvsm': hvsm}
+            for m in hvs_names:
+                values[m] = hvs_values[m]
+                if maps is not None and m in tile_maps: maps[m] = tile_maps[m]
+
+        for metric_name in self.metrics_to_compute:
+            if metric_name in values: continue
+            func = MetricRegistry.get_metric(metric_name)
+            if func:
+                values[metric_name] = func(ref_img, img_restored)
+        return {m: values[m] for m in self.metrics_to_compute if m in values}
+
+    def preview_metrics(self, ref_img: np.ndarray, img_restored: np.ndarray) -> Dict[str, float]:
+        """Subsampled estimates (with CI columns); metrics without an estimator run in full."""
+        values = {}
+        for metric_name in self.metrics_to_compute:
+            estimator = MetricRegistry.get_preview_metric(metric_name)
+            if estimator:
+                est = estimator(ref_img, img_restored, fraction=self.preview_fraction, seed=self.preview_seed)
+                values[metric_name] = est.value
+                values[f'{metric_name}_ci_low'] = est.ci_low
+                values[f'{metric_name}_ci_high'] = est.ci_high
+            else:
+                func = MetricRegistry.get_metric(metric_name)
+                if func:
+                    values[metric_name] = func(ref_img, img_restored)
+        return values
+
+    def iter_curve(self,
+                   img_clean: np.ndarray,
+                   img_noised: np.ndarray,
+                   vst_config: VSTConfig,
+                   q_range: List[int],
+                   use_vst: bool = True,
+                   progress_callback: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming version of run_curve.
+        Yields one record (q, bpp, file_size_kb, cr, mse_codec, metrics...) per Q
+        as soon as it is scored. Closing the generator skips the remaining encodes.
+        """
+        self.last_maps = {}
 
         # If img_clean is None, we might compare against noised (though usually bad practice),
         # but the caller logic seems to handle this.
         ref_img = img_clean if img_clean is not None else img_noised
-        h, w = img_noised.shape
-        original_size_bytes = h * w 
-        
+
+        if self.pipeline is not None:
+            # Lazy nodes: nothing upstream is computed unless a downstream node misses
+            prep = self._graph_input(img_noised, vst_config, use_vst)
+            ref = self.pipeline.source('source', ref_img)
+        else:
+            img_to_compress, vst = self._prepare(img_noised, vst_config, use_vst)
+
         total = len(q_range)
-        
+
         for idx, q in enumerate(q_range):
+            record = None
             try:
-                # 1. Compress/Decompress
-                # Now returns EncodeResult
-                res = self.codec.compress_decompress(img_to_compress, q=q)
-                img_decoded = res.decoded_image
-                f_size_bytes = res.file_size_bytes
-                bpp = res.bpp
-                
-                # 2. MSE of Codec (Internal domain)
-                mse_internal = np.mean((img_to_compress - img_decoded) ** 2)
-
-                # 3. Inverse Transform (if needed)
-                if use_vst:
-                    img_restored = vst.inverse(img_decoded)
+                if self.pipeline is not None:
+                    record = self._graph_record(prep, ref, q, vst_config, use_vst)
                 else:
-                    img_restored = img_decoded
-                
-                # 4. Metrics
-                results['q'].append(q)
-                results['bpp'].append(bpp)
-                results['file_size_kb'].append(f_size_bytes / 1024.0)
-                results['mse_codec'].append(mse_internal)
-                
-                cr = original_size_bytes / f_size_bytes if f_size_bytes > 0 else 0
-                results['cr'].append(cr)
-                
-                # 5. Dynamic Metrics
-                for metric_name in self.metrics_to_compute:
-                    func = MetricRegistry.get_metric(metric_name)
-                    if func:
-                        # Some metrics return tuple, we might need to handle them?
-                        # But our standard metrics return float.
-                        # HVS/HVSM are special in the old code, they were computed together.
-                        # Now they are registered separately.
-                        val = func(ref_img, img_restored)
-                        results[metric_name].append(val)
-                
+                    # 1. Compress/Decompress
+                    # Now returns EncodeResult
+                    res = self.codec.compress_decompress(img_to_compress, q=q)
+                    record, _ = self._score(q, res, img_to_compress, vst, ref_img)
+
             except Exception as e:
                 print(f"Err q={q}: {e}")
                 import traceback
                 traceback.print_exc()
-            
+                record = None
+
             if progress_callback: progress_callback(idx + 1, total)
-                
-        return results
+            if record is not None:
+                yield record
+
+    def run_curve(self,
+                  img_clean: np.ndarray,
+                  img_noised: np.ndarray,
+                  vst_config: VSTConfig,
+                  q_range: List[int],
+                  use_vst: bool = True,
+                  progress_callback: Optional[Callable[[int, int], None]] = None,
+                  record_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  stop_metric: Optional[str] = None,
+                  stop_patience: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Runs the full Q sweep and collects the records into numeric columns
+        (one array per key: q, bpp, file_size_kb, cr, mse_codec, metrics...).
+        Args:
+            record_callback: Called with every record as soon as it is scored.
+            stop_metric / stop_patience: If patience > 0, the sweep stops once the best
+                value of stop_metric is followed by `stop_patience` worse points.
+        """
+        results = {m: [] for m in self.metrics_to_compute}
+        results.update({
+            'q': [], 'bpp': [], 'file_size_kb': [], 'cr': [], 'mse_codec': []
+        })
+
+        stream = self.iter_curve(img_clean, img_noised, vst_config, q_range, use_vst, progress_callback)
+        try:
+            for record in stream:
+                for key, val in record.items():
+                    results.setdefault(key, []).append(val)
+                if record_callback: record_callback(record)
+
+                if stop_patience:
+                    key = stop_metric if stop_metric in results else 'psnr'
+                    if self.is_oop_bracketed(results.get(key, []), stop_patience):
+                        break
+        finally:
+            stream.close()
+
+        return self.to_columns(results)
+
+    @staticmethod
+    def to_columns(results: Dict[str, List[Any]]) -> Dict[str, np.ndarray]:
+        """Lists of records -> compact numeric arrays (int for q, float64 otherwise)."""
+        return {k: np.asarray(v, dtype=np.int64 if k == 'q' else np.float64) for k, v in results.items()}
+
+    def run_stack_curve(self,
+                        ref_stack: Optional[np.ndarray],
+                        noised_stack: np.ndarray,
+                        vst_config: VSTConfig,
+                        q_range: List[int],
+                        use_vst: bool = True,
+                        n_workers: Optional[int] = None,
+                        progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, np.ndarray]]:
+        """
+        Q sweep over a (F, H, W) stack. The VST is applied to the whole stack once,
+        frames are encoded in parallel threads (the codec runs out of process) and
+        metrics are scored with the batched (F, H, W) implementations.
+        Returns:
+            One curve (same columns as run_curve) per frame.
+        """
+        img_to_compress, vst = self._prepare(noised_stack, vst_config, use_vst)
+        ref_stack = ref_stack if ref_stack is not None else noised_stack
+        n_frames, h, w = noised_stack.shape
+        original_size_bytes = h * w
+
+        results = [{'q': [], 'bpp': [], 'file_size_kb': [], 'cr': [], 'mse_codec': []} for _ in range(n_frames)]
+        total = len(q_range)
+
+        with ThreadPoolExecutor(max_workers=n_workers or min(n_frames, os.cpu_count() or 1)) as pool:
+            for idx, q in enumerate(q_range):
+                try:
+                    # 1. Compress/Decompress every frame
+                    encoded = list(pool.map(lambda frame: self.codec.compress_decompress(frame, q=q), img_to_compress))
+                    decoded = np.stack([r.decoded_image for r in encoded])
+
+                    # 2. MSE of Codec (Internal domain), per frame
+                    mse_internal = np.mean((img_to_compress - decoded) ** 2, axis=(-2, -1))
+
+                    # 3. Inverse Transform on the whole stack
+                    restored = vst.inverse(decoded) if vst is not None else decoded
+
+                    # 4. Batched metrics
+                    scores = {}
+                    for metric_name in self.metrics_to_compute:
+                        func = MetricRegistry.get_batch_metric(metric_name)
+                        if func:
+                            scores[metric_name] = np.asarray(func(ref_stack, restored))
+
+                    for f, res in enumerate(encoded):
+                        size = res.file_size_bytes
+                        rec = results[f]
+                        rec['q'].append(q)
+                        rec['bpp'].append(res.bpp)
+                        rec['file_size_kb'].append(size / 1024.0)
+                        rec['cr'].append(original_size_bytes / size if size > 0 else 0)
+                        rec['mse_codec'].append(mse_internal[f])
+                        for metric_name, vals in scores.items():
+                            rec.setdefault(metric_name, []).append(vals[f])
+
+                except Exception as e:
+                    print(f"Err q={q}: {e}")
+                    import traceback
+                    traceback.print_exc()
+
+                if progress_callback: progress_callback(idx + 1, total)
+
+        return [self.to_columns(r) for r in results]
+
+    def refine_curve(self,
+                     img_clean: np.ndarray,
+                     img_noised: np.ndarray,
+                     vst_config: VSTConfig,
+                     q_range: List[int],
+                     q_center: int,
+                     window: int = 2,
+                     metric: str = 'psnr',
+                     use_vst: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Sweeps only the Qs of q_range within `window` steps of q_center (e.g. a predicted
+        OOP). While the best point lies on the edge of the evaluated window, the window is
+        widened by another `window` steps on that side, so the returned OOP is bracketed
+        (or at the end of q_range). Returns the evaluated points as columns sorted by Q.
+        """
+        q_range = sorted(q_range)
+        center = int(np.argmin([abs(q - q_center) for q in q_range]))
+        lo, hi = max(0, center - window), min(len(q_range) - 1, center + window)
+        records: Dict[int, Dict[str, Any]] = {}
+        while True:
+            todo = [q for q in q_range[lo:hi + 1] if q not in records]
+            if todo:
+                curve = self.run_curve(img_clean, img_noised, vst_config, todo, use_vst)
+                for i, q in enumerate(curve['q']):
+                    records[int(q)] = {k: v[i] for k, v in curve.items()}
+
+            columns: Dict[str, List[Any]] = {}
+            for q in sorted(records):
+                for k, v in records[q].items():
+                    columns.setdefault(k, []).append(v)
+            columns = self.to_columns(columns)
+
+            _, q_best = self.find_oop(columns, metric)
+            best = q_range.index(q_best) if q_best in q_range else center
+            if best == lo and lo > 0:
+                lo = max(0, lo - window)
+            elif best == hi and hi < len(q_range) - 1:
+                hi = min(len(q_range) - 1, hi + window)
+            else:
+                return columns
+
+    @staticmethod
+    def is_oop_bracketed(values: List[float], patience: int) -> bool:
+        """True once the best value is followed by `patience` consecutive worse points."""
+        if patience <= 0 or len(values) <= patience:
+            return False
+        best = int(np.argmax(values))
+        return len(values) - 1 - best >= patience
+
+    @staticmethod
+    def find_oop(curve: Dict[str, Any], metric: str = 'psnr') -> Tuple[Dict[str, Any], int]:
+        """
+        Optimal Operation Point: the Q maximizing `metric` (falls back to PSNR).
+        Returns: ({key: value at OOP}, q) or ({}, -1) for an empty curve.
+        """
+        metric_key = metric
+        if metric_key not in curve or len(curve[metric_key]) == 0:
+            # Fallback to PSNR if metric not found (e.g. psnr_hvsm missing)
+            metric_key = 'psnr'
+
+        if len(curve.get(metric_key, [])) == 0: return {}, -1
+
+        idx = int(np.argmax(curve[metric_key]))
+        oop = {k: curve[k][idx] for k in curve.keys() if len(curve[k]) > idx}
+        return {k: v.item() if isinstance(v, np.generic) else v for k, v in oop.items()}, int(curve['q'][idx])
+
+    @staticmethod
+    def budget_bytes(shape: Tuple[int, int],
+                     target_bpp: Optional[float] = None,
+                     target_size_kb: Optional[float] = None,
+                     target_cr: Optional[float] = None) -> float:
+        """Converts a bpp / file size / CR target into a byte budget (8-bit original)."""
+        h, w = shape[:2]
+        if target_bpp is not None: return target_bpp * h * w / 8.0
+        if target_size_kb is not None: return target_size_kb * 1024.0
+        if target_cr is not None: return (h * w) / target_cr
+        raise ValueError("One of target_bpp, target_size_kb or target_cr is required")
+
+    def run_rate_target(self,
+                        img_clean: np.ndarray,
+                        img_noised: np.ndarray,
+                        vst_config: VSTConfig,
+                        use_vst: bool = True,
+                        target_bpp: Optional[float] = None,
+                        target_size_kb: Optional[float] = None,
+                        target_cr: Optional[float] = None,
+                        q_min: int = 1, q_max: int = 51) -> Dict[str, Any]:
+        """
+        Finds the lowest Q whose stream meets the rate target by bisection
+        (encode only), then decodes and scores that single Q.
+        Returns the usual record plus 'target_met', 'budget_bytes', 'n_encodes',
+        'probed' ({q: size_bytes}) and 'image' (restored image at the chosen Q).
+        """
+        img_to_compress, vst = self._prepare(img_noised, vst_config, use_vst)
+        self.last_maps = {}
+        ref_img = img_clean if img_clean is not None else img_noised
+
+        budget = self.budget_bytes(img_noised.shape, target_bpp, target_size_kb, target_cr)
+        search = self.codec.search_q_for_size(img_to_compress, budget, q_min, q_max)
+
+        res = search.encoded
+        if isinstance(res, EncodedStream): # Decode the winning stream; no re-encode
+            h, w = img_to_compress.shape
+            res = EncodeResult(decoded_image=self.codec.decode(res), file_size_bytes=res.size_bytes,
+                               bpp=res.size_bytes * 8 / (h * w))
+        record, img_restored = self._score(search.q, res, img_to_compress, vst, ref_img)
+        record.update({
+            'target_met': search.target_met,
+            'budget_bytes': budget,
+            'n_encodes': search.n_encodes,
+            'probed': search.probed,
+            'image': img_restored,
+        })
+        return record
@@ -0,0 +1,344 @@
+import os
+import numpy as np
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple
+
+from .interfaces import BaseFilter, FilterRegistry
+from .memory import budget_rows
+from .metrics import NoiseEstimator
+from .precision import float_dtype
+from .psnr_hvsm_lib.psnr_hvsm import to_blocks, from_blocks, DCT_H, DCT_W
+
+
+def row_chunks(height: int, chunk_rows: int, align: int = 1) -> List[Tuple[int, int]]:
+    """Splits [0, height) into (start, stop) row ranges; starts are multiples of `align`."""
+    chunk_rows = max(align, (chunk_rows // align) * align)
+    return [(r, min(r + chunk_rows, height)) for r in range(0, height, chunk_rows)]
+
+
+def budget_chunk_rows(chunk_rows: int, row_bytes: int, n_workers: Optional[int] = None, align: int = 1) -> int:
+    """Caps chunk_rows so that the chunks in flight (one per worker) fit the memory budget."""
+    n_workers = n_workers or os.cpu_count() or 1
+    return min(chunk_rows, budget_rows(row_bytes, concurrency=n_workers, align=align))
+
+
+def run_chunks(func, chunks: List[Tuple[int, int]], n_workers: Optional[int] = None) -> List[np.ndarray]:
+    """Maps func(start, stop) over row chunks on a thread pool (numpy / scipy.fft release the GIL)."""
+    n_workers = min(len(chunks), n_workers or os.cpu_count() or 1)
+    if n_workers <= 1:
+        return [func(r0, r1) for r0, r1 in chunks]
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(lambda c: func(*c), chunks))
+
+
+@FilterRegistry.register('dct')
+class DCTDenoiser(BaseFilter):
+    """
+    Sliding-window 8x8 DCT hard-thresholding for additive Gaussian noise,
+    i.e. speckle after VarianceStabilizer.forward.
+
+    Each of the shifted 8x8 grids is cut with to_blocks and transformed in one
+    vectorized dctn call; AC coefficients below threshold * sigma are zeroed and
+    the overlapping blocks are aggregated with weights 1 / (kept coefficients).
+    Large images are processed in row chunks (with a one-block halo) in parallel.
+    """
+    domain = 'vst'
+
+    def __init__(self, sigma: Optional[float] = None, threshold: float = 2.7, step: int = 1,
+                 chunk_rows: int = 128, n_workers: Optional[int] = None):
+        """
+        Args:
+            sigma: Noise std in the VST domain. None = NoiseEstimator.estimate_blind_sigma.
+            threshold: Hard threshold in units of sigma.
+            step: Shift between block grids (1 = every overlapping block, 2/4/8 = faster).
+            chunk_rows: Output rows per work item (rounded to a multiple of 8; capped by the memory budget).
+            n_workers: Threads over chunks (None = os.cpu_count()).
+        """
+        self.sigma = sigma
+        self.threshold = threshold
+        self.step = int(np.clip(step, 1, DCT_H))
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        from scipy.fft import dctn, idctn # Deferred: scipy.fft is slow to import
+
+        img = np.asarray(image, dtype=np.float64)
+        sigma = self.sigma if self.sigma is not None else NoiseEstimator.estimate_blind_sigma(img)
+        if sigma <= 0:
+            return np.array(image, dtype=float_dtype(image))
+        thr = self.threshold * sigma
+        h, w = img.shape
+
+        # One block of reflected border: every output pixel is covered by every grid shift
+        padded = np.pad(img, ((DCT_H, DCT_H), (DCT_W, DCT_W)), mode='symmetric')
+        shifts = [(dy, dx) for dy in range(0, DCT_H, self.step) for dx in range(0, DCT_W, self.step)]
+
+        def denoise(r0: int, r1: int) -> np.ndarray:
+            # Chunks start on multiples of 8, so the grids match the unchunked result
+            slab = padded[r0:r1 + 2 * DCT_H]
+            acc = np.zeros_like(slab)
+            wsum = np.zeros_like(slab)
+            for dy, dx in shifts:
+                bh = (slab.shape[0] - dy) // DCT_H * DCT_H
+                bw = (slab.shape[1] - dx) // DCT_W * DCT_W
+                coeffs = dctn(to_blocks(slab[dy:dy + bh, dx:dx + bw]), norm='ortho', axes=(-1, -2))
+                keep = np.abs(coeffs) >= thr
+                keep[..., 0, 0] = True # DC is never thresholded
+                coeffs *= keep
+                weight = 1.0 / keep.sum(axis=(-1, -2))
+                blocks = idctn(coeffs, norm='ortho', axes=(-1, -2)) * weight[:, None, None]
+                acc[dy:dy + bh, dx:dx + bw] += from_blocks(blocks, bh, bw)
+                wsum[dy:dy + bh, dx:dx + bw] += from_blocks(np.broadcast_to(weight[:, None, None], blocks.shape), bh, bw)
+            out = acc[DCT_H:DCT_H + (r1 - r0), DCT_W:DCT_W + w]
+            return out / wsum[DCT_H:DCT_H + (r1 - r0), DCT_W:DCT_W + w]
+
+        # ~8 float64 temporaries per padded pixel (coefficients, blocks, accumulators)
+        chunk_rows = budget_chunk_rows(self.chunk_rows, (w + 2 * DCT_W) * 64, self.n_workers, DCT_H)
+        parts = run_chunks(denoise, row_chunks(h, chunk_rows, DCT_H), self.n_workers)
+        return np.concatenate(parts, axis=0, dtype=float_dtype(image)) # Computed in float64, returned in the input precision
+
+
+# --- Linear-domain speckle filters (baselines for the VST path) ---
+
+def local_moments(img: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Local mean and variance over size x size windows (box filter: cost independent of size)."""
+    from scipy.ndimage import uniform_filter
+    mean = uniform_filter(img, size, mode='reflect')
+    var = uniform_filter(img * img, size, mode='reflect') - mean * mean
+    return mean, np.maximum(var, 0.0)
+
+
+def speckle_cv2(img: np.ndarray, size: int = 7) -> float:
+    """
+    Squared coefficient of variation of the speckle (1 / looks), estimated as the
+    median local CV^2 (scenes dominated by homogeneous areas).
+    """
+    mean, var = local_moments(img, size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv2 = var / (mean * mean)
+    return float(np.nanmedian(cv2[np.isfinite(cv2)]))
+
+
+class LocalStatsFilter(BaseFilter):
+    """
+    Base for window-statistics speckle filters on the linear (intensity) image.
+    The image is processed in row tiles with a halo of window // 2 rows, so the
+    result equals the untiled filter.
+    """
+    domain = 'linear'
+
+    def __init__(self, window: int = 7, looks: Optional[float] = None,
+                 chunk_rows: int = 256, n_workers: Optional[int] = None):
+        """
+        Args:
+            window: Odd window size.
+            looks: Equivalent number of looks L (speckle CV^2 = 1 / L). None = estimated.
+            chunk_rows: Output rows per tile (capped by the memory budget).
+            n_workers: Threads over tiles (None = os.cpu_count()).
+        """
+        self.window = int(window) | 1
+        self.looks = looks
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers
+
+    @abstractmethod
+    def _filter_tile(self, tile: np.ndarray, cu2: float) -> np.ndarray:
+        """Filters a tile padded by window // 2 on every side, given the speckle cv^2 (apply crops the halo)."""
+        pass
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        img = np.asarray(image, dtype=np.float64)
+        cu2 = 1.0 / self.looks if self.looks else speckle_cv2(img, self.window)
+        halo = self.window // 2
+        padded = np.pad(img, halo, mode='symmetric') # Matches ndimage 'reflect' at the borders
+        h, w = img.shape
+
+        def run(r0: int, r1: int) -> np.ndarray:
+            out = self._filter_tile(padded[r0:r1 + 2 * halo], cu2)
+            return out[halo:halo + (r1 - r0), halo:halo + w]
+
+        # ~8 float64 local-moment temporaries per padded pixel
+        chunk_rows = budget_chunk_rows(self.chunk_rows, (w + 2 * halo) * 64, self.n_workers)
+        return np.concatenate(run_chunks(run, row_chunks(h, chunk_rows), self.n_workers), axis=0, dtype=float_dtype(image))
+
+
+@FilterRegistry.register('lee')
+class LeeFilter(LocalStatsFilter):
+    """Lee filter: mean + W * (I - mean), W = 1 - Cu^2 / Ci^2."""
+
+    def _filter_tile(self, tile: np.ndarray, cu2: float) -> np.ndarray:
+        mean, var = local_moments(tile, self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ci2 = var / (mean * mean)
+            weight = np.clip(np.nan_to_num(1.0 - cu2 / ci2), 0.0, 1.0)
+        return mean + weight * (tile - mean)
+
+
+@FilterRegistry.register('kuan')
+class KuanFilter(LocalStatsFilter):
+    """Kuan filter: mean + W * (I - mean), W = (1 - Cu^2 / Ci^2) / (1 + Cu^2)."""
+
+    def _filter_tile(self, tile: np.ndarray, cu2: float) -> np.ndarray:
+        mean, var = local_moments(tile, self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ci2 = var / (mean * mean)
+            weight = np.clip(np.nan_to_num((1.0 - cu2 / ci2) / (1.0 + cu2)), 0.0, 1.0)
+        return mean + weight * (tile - mean)
+
+
+@FilterRegistry.register('enhanced_lee')
+class EnhancedLeeFilter(LocalStatsFilter):
+    """
+    Enhanced Lee filter (Lopes et al.): pure mean in homogeneous areas (Ci <= Cu),
+    the original pixel at point targets (Ci >= Cmax = sqrt(1 + 2 / L)) and
+    exponentially damped Lee weighting in between.
+    """
+
+    def __init__(self, window: int = 7, looks: Optional[float] = None, damping: float = 1.0,
+                 chunk_rows: int = 256, n_workers: Optional[int] = None):
+        super().__init__(window, looks, chunk_rows, n_workers)
+        self.damping = damping
+
+    def _filter_tile(self, tile: np.ndarray, cu2: float) -> np.ndarray:
+        mean, var = local_moments(tile, self.window)
+        cu = np.sqrt(cu2)
+        cmax = np.sqrt(1.0 + 2.0 * cu2) # 1 / L = Cu^2
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            ci = np.nan_to_num(np.sqrt(var) / mean)
+            weight = 1.0 - np.exp(-self.damping * (ci - cu) / (cmax - ci)) # Weight of the pixel
+        weight = np.where(ci <= cu, 0.0, np.where(ci >= cmax, 1.0, weight))
+        return mean + weight * (tile - mean)
+
+
+@FilterRegistry.register('frost')
+class FrostFilter(LocalStatsFilter):
+    """
+    Frost filter: weighted mean with kernel exp(-damping * Ci^2 * |t|) around each pixel.
+    Uses the L1 distance |dx| + |dy|, which makes the kernel separable; the per-pixel
+    decay is quantized to `levels` values on a fixed quadratic grid over [0, max_decay]
+    (linear interpolation in between; beyond max_decay the kernel is ~ a delta), so the
+    cost is `levels` separable convolutions instead of a per-pixel window scan.
+    """
+
+    def __init__(self, window: int = 7, looks: Optional[float] = None, damping: float = 2.0,
+                 levels: int = 12, max_decay: float = 4.0,
+                 chunk_rows: int = 256, n_workers: Optional[int] = None):
+        super().__init__(window, looks, chunk_rows, n_workers)
+        self.damping = damping
+        self.levels = max(2, levels)
+        self.max_decay = max_decay
+
+    def _filter_tile(self, tile: np.ndarray, cu2: float) -> np.ndarray:
+        from scipy.ndimage import correlate1d
+        mean, var = local_moments(tile, self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = self.damping * np.nan_to_num(var / (mean * mean))
+
+        # Data-independent grid (denser at weak decay), so tiles match the untiled result
+        r = self.window // 2
+        t = np.abs(np.arange(-r, r + 1))
+        grid = self.max_decay * np.linspace(0.0, 1.0, self.levels) ** 2
+        pos = np.interp(alpha, grid, np.arange(self.levels))
+        lo = np.minimum(pos.astype(np.intp), self.levels - 2)
+        frac = pos - lo
+
+        out = np.zeros_like(tile)
+        for k, a in enumerate(grid):
+            k1 = np.exp(-a * t)
+            smoothed = correlate1d(correlate1d(tile, k1, axis=0, mode='reflect'), k1, axis=1, mode='reflect')
+            smoothed /= k1.sum() ** 2
+            weight = np.where(lo == k, 1.0 - frac, 0.0) + np.where(lo == k - 1, frac, 0.0)
+            out += weight * smoothed
+        return out
+
+
+# --- Non-local means (VST domain) ---
+
+# preset -> (patch radius, search radius, offsets per batch)
+NLM_PRESETS = {
+    'fast': (1, 3, 16),
+    'balanced': (2, 5, 16),
+    'quality': (3, 8, 8),
+}
+
+
+@FilterRegistry.register('nlm')
+class NLMDenoiser(BaseFilter):
+    """
+    Non-local means for additive Gaussian noise (speckle after VarianceStabilizer.forward).
+    Patch distances for every search offset are box sums of the squared difference
+    image, taken from its integral image, so the cost does not depend on the patch
+    size; offsets are processed in vectorized batches and row tiles run in parallel.
+    Weights follow Buades et al.: exp(-max(d^2 - 2 sigma^2, 0) / h^2), with the
+    center pixel weighted like its most similar neighbour.
+    """
+    domain = 'vst'
+
+    def __init__(self, preset: str = 'balanced', sigma: Optional[float] = None, h_factor: float = 0.4,
+                 patch_radius: Optional[int] = None, search_radius: Optional[int] = None,
+                 batch_offsets: Optional[int] = None, chunk_rows: int = 128, n_workers: Optional[int] = None):
+        """
+        Args:
+            preset: 'fast', 'balanced' or 'quality' (patch / search radius, batch size).
+            sigma: Noise std in the VST domain. None = NoiseEstimator.estimate_blind_sigma.
+            h_factor: Filtering parameter h = h_factor * sigma.
+            patch_radius / search_radius / batch_offsets: Override the preset.
+            chunk_rows: Output rows per tile (capped by the memory budget).
+            n_workers: Threads over tiles (None = os.cpu_count()).
+        """
+        if preset not in NLM_PRESETS:
+            raise ValueError(f"Unknown NLM preset '{preset}'. Use one of {list(NLM_PRESETS)}")
+        p, s, b = NLM_PRESETS[preset]
+        self.preset = preset
+        self.patch_radius = p if patch_radius is None else patch_radius
+        self.search_radius = s if search_radius is None else search_radius
+        self.batch_offsets = b if batch_offsets is None else max(1, batch_offsets)
+        self.sigma = sigma
+        self.h_factor = h_factor
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        img = np.asarray(image, dtype=np.float64)
+        sigma = self.sigma if self.sigma is not None else NoiseEstimator.estimate_blind_sigma(img)
+        if sigma <= 0:
+            return np.array(image, dtype=float_dtype(image))
+        h, w = img.shape
+        p, s = self.patch_radius, self.search_radius
+        k = 2 * p + 1
+        halo = p + s
+        inv_h2 = 1.0 / (self.h_factor * sigma) ** 2
+        bias = 2.0 * sigma ** 2
+        padded = np.pad(img, halo, mode='symmetric')
+        offsets = [(dy, dx) for dy in range(-s, s + 1) for dx in range(-s, s + 1) if (dy, dx) != (0, 0)]
+
+        def denoise(r0: int, r1: int) -> np.ndarray:
+            rows = r1 - r0
+            slab = padded[r0:r1 + 2 * halo]
+            ref = slab[s:s + rows + 2 * p, s:s + w + 2 * p] # Output pixels plus patch halo
+            center = ref[p:p + rows, p:p + w]
+            acc = np.zeros((rows, w))
+            wsum = np.zeros((rows, w))
+            wmax = np.zeros((rows, w))
+
+            for b0 in range(0, len(offsets), self.batch_offsets):
+                batch = offsets[b0:b0 + self.batch_offsets]
+                shifted = np.stack([slab[s + dy:s + dy + rows + 2 * p, s + dx:s + dx + w + 2 * p] for dy, dx in batch])
+                # Integral image of the squared differences -> k x k box sums
+                sat = np.zeros((len(batch), rows + 2 * p + 1, w + 2 * p + 1))
+                np.cumsum(np.cumsum((shifted - ref) ** 2, axis=1), axis=2, out=sat[:, 1:, 1:])
+                dist = (sat[:, k:, k:] - sat[:, :-k, k:] - sat[:, k:, :-k] + sat[:, :-k, :-k]) / (k * k)
+                weights = np.exp(-np.maximum(dist - bias, 0.0) * inv_h2)
+                acc += np.einsum('bij,bij->ij', weights, shifted[:, p:p + rows, p:p + w])
+                wsum += weights.sum(axis=0)
+                np.maximum(wmax, weights.max(axis=0), out=wmax)
+
+            wmax = np.where(wsum > 0, wmax, 1.0)
+            return (acc + wmax * center) / (wsum + wmax)
+
+        # Shifted patches, integral images, distances and weights per offset in a batch
+        row_bytes = (w + 2 * halo) * (5 * self.batch_offsets + 8) * 8
+        chunk_rows = budget_chunk_rows(self.chunk_rows, row_bytes, self.n_workers)
+        return np.concatenate(run_chunks(denoise, row_chunks(h, chunk_rows), self.n_workers), axis=0, dtype=float_dtype(image))
@@ -3,15 +3,117 @@ import numpy as np
 from typing import Dict, Any, Tuple, List, Optional
 from dataclasses import dataclass
 
+from .cache import ImageCache
+
 @dataclass
 class EncodeResult:
     decoded_image: np.ndarray
     file_size_bytes: int
     bpp: float
 
+@dataclass
+class EncodedStream:
+    """Compressed bitstream plus what is needed to restore the float image."""
+    data: bytes
+    q: int
+    shape: Tuple[int, int]
+    d_min: float
+    d_max: float
+    dtype: str = 'float64' # Precision of the encoded image; decode restores into it
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.data)
+
+@dataclass
+class SizeSearch:
+    """Result of BaseCodec.search_q_for_size."""
+    q: int
+    target_met: bool
+    probed: Dict[int, int] # {q: size_bytes} of the Qs the bisection evaluated
+    n_encodes: int         # Encoder runs (probes not served by the size cache)
+    encoded: Any           # EncodedStream at q (EncodeResult for codecs without encode-only)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.probed[self.q]
+
 class BaseCodec(ABC):
     """Abstract base class for all image codecs."""
+
+    # Streams of search_q_for_size by (image digest, shape, q); None = no caching.
+    # Codecs set a byte-bounded ImageCache per instance (see BPGCodec).
+    size_cache: Optional[ImageCache] = None
     
+    def fingerprint(self) -> str:
+        """Identifies the codec configuration in stage-graph keys (see src.pipeline)."""
+        return type(self).__name__
+
+    def encode(self, image: np.ndarray, q: int) -> EncodedStream:
+        """Encodes only (no decode). Optional for codecs."""
+        raise NotImplementedError(f"{type(self).__name__} does not support encode-only")
+
+    def decode(self, stream: EncodedStream) -> np.ndarray:
+        """Decodes a stream produced by encode() back to a float image."""
+        raise NotImplementedError(f"{type(self).__name__} does not support decode")
+
+    def encoded_size(self, image: np.ndarray, q: int) -> int:
+        """Compressed size in bytes for quality q. Uses encode-only when available."""
+        try:
+            return self.encode(image, q).size_bytes
+        except NotImplementedError:
+            return self.compress_decompress(image, q).file_size_bytes
+
+    def search_q_for_size(self, image: np.ndarray, max_bytes: float,
+                          q_min: int = 1, q_max: int = 51) -> SizeSearch:
+        """
+        Bisects Q for the best quality (lowest Q) whose stream fits in max_bytes.
+        Relies on the size being monotonically non-increasing in Q. Probes are encode
+        only; the stream at the chosen Q is returned, so the caller decodes once and
+        never re-encodes. Streams are cached per image content in size_cache, so
+        repeated searches are cheap.
+        """
+        import hashlib
+        digest = hashlib.blake2b(np.ascontiguousarray(image).view(np.uint8), digest_size=16).hexdigest()
+        encoded: Dict[int, Any] = {}
+        n_encodes = 0
+
+        def encode(q: int):
+            nonlocal n_encodes
+            n_encodes += 1
+            try:
+                return self.encode(image, q)
+            except NotImplementedError:
+                return self.compress_decompress(image, q)
+
+        def size_at(q: int) -> int:
+            if q not in encoded:
+                if self.size_cache is None:
+                    encoded[q] = encode(q)
+                else:
+                    encoded[q] = self.size_cache.get_or_load((digest, image.shape, q), lambda: encode(q))
+            value = encoded[q]
+            return value.size_bytes if isinstance(value, EncodedStream) else value.file_size_bytes
+
+        def result(q: int, met: bool) -> SizeSearch:
+            return SizeSearch(q=q, target_met=met, probed={k: size_at(k) for k in sorted(encoded)},
+                              n_encodes=n_encodes, encoded=encoded[q])
+
+        if size_at(q_min) <= max_bytes:
+            return result(q_min, True)
+        if size_at(q_max) > max_bytes:
+            return result(q_max, False)
+
+        # Invariant: size(lo) > budget >= size(hi)
+        lo, hi = q_min, q_max
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if size_at(mid) <= max_bytes:
+                hi = mid
+            else:
+                lo = mid
+        return result(hi, True)
+
     @abstractmethod
     def compress_decompress(self, image: np.ndarray, q: int) -> EncodeResult:
         """
@@ -35,6 +137,8 @@ class BaseCodec(ABC):
 class MetricRegistry:
     """Registry for managing available quality metrics."""
     _metrics: Dict[str, Any] = {}
+    _batch_metrics: Dict[str, Any] = {}
+    _preview_metrics: Dict[str, Any] = {}
 
     @classmethod
     def register(cls, name: str):
@@ -43,14 +147,95 @@ class MetricRegistry:
             return func
         return decorator
 
+    @classmethod
+    def register_batch(cls, name: str):
+        """Registers a vectorized version of a metric: (F, H, W) inputs -> (F,) values."""
+        def decorator(func):
+            cls._batch_metrics[name] = func
+            return func
+        return decorator
+
+    @classmethod
+    def register_preview(cls, name: str):
+        """
+        Registers a subsampled estimator of a metric:
+        (gt, dist, data_range=None, fraction, seed, confidence) -> estimate with a CI.
+        """
+        def decorator(func):
+            cls._preview_metrics[name] = func
+            return func
+        return decorator
+
     @classmethod
     def get_metric(cls, name: str):
         return cls._metrics.get(name)
 
+    @classmethod
+    def get_preview_metric(cls, name: str):
+        return cls._preview_metrics.get(name)
+
+    @classmethod
+    def get_batch_metric(cls, name: str):
+        """Batched metric, falling back to a per-frame loop over the single-image one."""
+        if name in cls._batch_metrics:
+            return cls._batch_metrics[name]
+        func = cls._metrics.get(name)
+        if func is None:
+            return None
+        def looped(gt: np.ndarray, dist: np.ndarray, data_range=None) -> np.ndarray:
+            return np.array([func(g, d, data_range) for g, d in zip(gt, dist)])
+        return looped
+
     @classmethod
     def get_all(cls) -> Dict[str, Any]:
         return cls._metrics
 
+class BaseFilter(ABC):
+    """Abstract base class for denoising filters applied before compression."""
+    name: str = ''
+    # Domain the filter expects: 'linear' (multiplicative speckle, ImageLoader output)
+    # or 'vst' (additive noise, VarianceStabilizer.forward output)
+    domain: str = 'linear'
+
+    @abstractmethod
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """Filters a single (H, W) image in the filter's domain."""
+        pass
+
+    def fingerprint(self) -> str:
+        """Identifies the filter and its parameters in stage-graph keys (see src.pipeline)."""
+        return f"{self.name}:{sorted(vars(self).items())!r}"
+
+class FilterRegistry:
+    """Registry for managing available denoising filters (classes, by name)."""
+    _filters: Dict[str, Any] = {}
+
+    @classmethod
+    def register(cls, name: str):
+        def decorator(filter_cls):
+            filter_cls.name = name
+            cls._filters[name] = filter_cls
+            return filter_cls
+        return decorator
+
+    @classmethod
+    def get_filter(cls, name: str):
+        return cls._filters.get(name)
+
+    @classmethod
+    def create(cls, name: Optional[str], **params) -> Optional[BaseFilter]:
+        """Instantiates a registered filter. None / 'none' means no filtering."""
+        if not name or name == 'none':
+            return None
+        filter_cls = cls._filters.get(name)
+        if filter_cls is None:
+            raise ValueError(f"Unknown filter '{name}'. Available: {sorted(cls._filters)}")
+        return filter_cls(**params)
+
+    @classmethod
+    def get_all(cls) -> Dict[str, Any]:
+        return cls._filters
+
 class PlotterInterface(ABC):
     """Abstract base class for UI plotters."""
     
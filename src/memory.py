@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Process-wide memory budget. Chunked stages (filters, HVS metrics, codec I/O, plot
+# rendering) size their blocks from it, so a large input switches to smaller tiles
+# instead of exhausting the node. Set from AppConfig.memory (see set_budget).
+_BUDGET = {'bytes': 2048 * 1024 ** 2}
+
+TRACK_MODES = ('off', 'rss', 'tracemalloc')
+
+
+def set_budget(mb: float):
+    _BUDGET['bytes'] = int(mb * 1024 ** 2)
+
+
+def get_budget() -> int:
+    """Budget in bytes."""
+    return _BUDGET['bytes']
+
+
+def budget_rows(row_bytes: int, concurrency: int = 1, align: int = 1, fraction: float = 0.5) -> int:
+    """
+    Rows per chunk so that `concurrency` chunks with `row_bytes` of temporaries per row
+    stay within `fraction` of the budget (the rest is left for inputs and outputs).
+    At least one aligned row is returned.
+    """
+    rows = int(get_budget() * fraction) // max(1, row_bytes * max(1, concurrency))
+    return max(align, rows // align * align)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes (0 if unknown)."""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # KiB on Linux
+    except ImportError:
+        return 0
+
+
+class MemoryTracker:
+    """
+    Per-stage memory statistics (and wall time, summed over calls).
+    mode 'rss': RSS after each stage (cheap). mode 'tracemalloc': additionally the peak
+    of traced allocations (numpy buffers included) above the level at stage entry;
+    exact, but tracing slows allocation-heavy code down. Nested stages are handled:
+    an inner stage's peak also counts for the stages around it.
+    """
+
+    def __init__(self, mode: str = 'off'):
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._stack: List[List[int]] = [] # [traced at entry, running peak] per open stage
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self.mode = 'off'
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str):
+        if mode not in TRACK_MODES:
+            raise ValueError(f"Unknown memory tracking mode '{mode}'. Use one of {TRACK_MODES}")
+        if mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        elif mode != 'tracemalloc' and self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.mode = mode
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def _record(self, stage: str, traced_peak: Optional[int], seconds: float):
+        entry = self.stats.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'peak_mb': 0.0, 'rss_mb': 0.0})
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['rss_mb'] = max(entry['rss_mb'], current_rss() / 1024 ** 2)
+        if traced_peak is not None:
+            entry['peak_mb'] = max(entry['peak_mb'], traced_peak / 1024 ** 2)
+
+    @contextmanager
+    def track(self, stage: str):
+        if self.mode == 'off':
+            yield
+            return
+        start = time.perf_counter()
+        if self.mode == 'rss' or not tracemalloc.is_tracing():
+            try:
+                yield
+            finally:
+                with self._lock: self._record(stage, None, time.perf_counter() - start)
+            return
+
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self._stack: # The reset below would lose the outer peaks
+                frame[1] = max(frame[1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            self._stack.append(frame)
+        try:
+            yield
+        finally:
+            with self._lock:
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                self._stack.remove(frame)
+                for outer in self._stack:
+                    outer[1] = max(outer[1], frame[1])
+                self._record(stage, frame[1] - frame[0], time.perf_counter() - start)
+
+    def report(self) -> Dict[str, Any]:
+        """Copy of the per-stage stats plus the process peak RSS ('process' entry)."""
+        with self._lock:
+            out = {stage: dict(entry) for stage, entry in self.stats.items()}
+        if self.mode != 'off':
+            out['process'] = {'calls': 0, 'seconds': 0.0, 'peak_mb': 0.0, 'rss_mb': peak_rss() / 1024 ** 2}
+        return out
+
+
+# Shared by the pipeline stages, the controller and the plotters
+TRACKER = MemoryTracker()
+
+
+def track(stage: str):
+    """Context manager recording the memory of `stage` on the shared tracker."""
+    return TRACKER.track(stage)
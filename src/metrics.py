@@ -1,10 +1,12 @@
 import numpy as np
-from skimage.metrics import peak_signal_noise_ratio as psnr
-from skimage.metrics import structural_similarity as ssim
-from .interfaces import MetricRegistry
+from dataclasses import dataclass
+from typing import Dict, Tuple
+# skimage is imported inside the metric functions: it is slow to import
+# and workers that only run VST + codec never need it.
 
 from .interfaces import MetricRegistry
 from .psnr_hvsm import psnr_hvs_hvsm
+from .precision import float_dtype
 
 HAS_HVSM = True
 
@@ -15,6 +17,7 @@ class QualityMetrics:
     @MetricRegistry.register("psnr")
     def compute_psnr(gt: np.ndarray, dist: np.ndarray, data_range=None) -> float:
         """Peak Signal-to-Noise Ratio."""
+        from skimage.metrics import peak_signal_noise_ratio as psnr
         if data_range is None: data_range = gt.max() - gt.min()
         return psnr(gt, dist, data_range=data_range)
 
@@ -22,9 +25,22 @@ class QualityMetrics:
     @MetricRegistry.register("ssim")
     def compute_ssim(gt: np.ndarray, dist: np.ndarray, data_range=None) -> float:
         """Structural Similarity Index."""
+        from skimage.metrics import structural_similarity as ssim
         if data_range is None: data_range = gt.max() - gt.min()
         return ssim(gt, dist, data_range=data_range)
 
+    @staticmethod
+    @MetricRegistry.register_batch("psnr")
+    def compute_psnr_batch(gt: np.ndarray, dist: np.ndarray, data_range=None) -> np.ndarray:
+        """PSNR per frame of (F, H, W) stacks (same definition as compute_psnr)."""
+        if data_range is None:
+            data_range = gt.max(axis=(-2, -1)).astype(np.float64) - gt.min(axis=(-2, -1))
+        diff = np.subtract(gt, dist, dtype=float_dtype(gt, dist))
+        np.square(diff, out=diff)
+        mse = np.mean(diff, axis=(-2, -1), dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            return 10 * np.log10((np.asarray(data_range, dtype=np.float64) ** 2) / mse)
+
     @staticmethod
     def compute_hvs_metrics(gt: np.ndarray, dist: np.ndarray, data_range=None) -> tuple:
         """
@@ -62,6 +78,35 @@ class QualityMetrics:
             _, hvsm = QualityMetrics.compute_hvs_metrics(gt, dist, data_range)
             return hvsm
 
+        # Batched (F, H, W) versions use the library's vectorized tile path
+        @staticmethod
+        @MetricRegistry.register_batch("psnr_hvs")
+        def compute_psnr_hvs_batch(gt: np.ndarray, dist: np.ndarray, data_range=None) -> np.ndarray:
+            hvs, _ = psnr_hvs_hvsm(gt, dist, batch=True)
+            return np.asarray(hvs)
+
+        @staticmethod
+        @MetricRegistry.register_batch("psnr_hvsm")
+        def compute_psnr_hvsm_batch(gt: np.ndarray, dist: np.ndarray, data_range=None) -> np.ndarray:
+            _, hvsm = psnr_hvs_hvsm(gt, dist, batch=True)
+            return np.asarray(hvsm)
+
+    @staticmethod
+    def compute_hvs_quality_maps(gt: np.ndarray, dist: np.ndarray) -> Tuple[float, float, Dict[str, np.ndarray]]:
+        """
+        PSNR-HVS and PSNR-HVS-M together with their per-8x8-tile maps, from one DCT pass.
+        Returns: (psnr_hvs, psnr_hvsm, {'psnr_hvs': map, 'psnr_hvsm': map}) where each map is
+            the per-tile PSNR in dB (float32, shape (H // 8, W // 8), capped at 100 dB like the library).
+        """
+        from .psnr_hvsm_lib.psnr import get_psnr
+        hvs, hvsm, hvs_mse, hvsm_mse = psnr_hvs_hvsm(gt, dist, return_maps=True)
+        if hvs_mse is None:
+            return hvs, hvsm, {}
+        with np.errstate(divide='ignore'):
+            maps = {'psnr_hvs': get_psnr(hvs_mse, 1.0).astype(np.float32),
+                    'psnr_hvsm': get_psnr(hvsm_mse, 1.0).astype(np.float32)}
+        return hvs, hvsm, maps
+
     @staticmethod
     def compute_relative_error_map(gt: np.ndarray, dist: np.ndarray) -> np.ndarray:
         """
@@ -84,21 +129,189 @@ class QualityMetrics:
         """
         # Avoid division by zero
         epsilon = 1e-6
-        gt_safe = gt.astype(np.float64)
+        dt = float_dtype(gt, dist) # No upcast of float32 inputs
+        gt_safe = gt.astype(dt)
         gt_safe[gt_safe == 0] = epsilon
         
-        dist_float = dist.astype(np.float64)
-        
         # Calculate Fractional Relative Error: (dist - gt) / gt
         # Range: [-1.0, +inf) usually
-        rel_error = (dist_float - gt_safe) / gt_safe
+        rel_error = np.subtract(dist, gt_safe, dtype=dt)
+        rel_error /= gt_safe
         
         # Scale and Shift
         # 128 is the neutral center. 
         # +/- 128 covers the range from -100% to +100% error.
-        delta = 128 + (128 * rel_error)
+        rel_error *= 128
+        rel_error += 128
         
-        return np.clip(delta, 0, 255).astype(np.uint8)
+        return np.clip(rel_error, 0, 255, out=rel_error).astype(np.uint8)
+
+@dataclass
+class MetricEstimate:
+    """Subsampled metric value with a confidence interval."""
+    value: float
+    ci_low: float
+    ci_high: float
+    fraction: float # Share of blocks / windows actually evaluated
+
+    def __float__(self) -> float:
+        return float(self.value)
+
+
+class PreviewMetrics:
+    """
+    Fast metric estimates for exploratory sweeps.
+    Metrics are evaluated on a stratified random subset of 8x8 blocks (SSIM: 7x7 windows):
+    the block grid is split into strata x strata regions and each region contributes
+    the same fraction of its blocks, so the whole image is covered evenly.
+    """
+    STRATA = 8
+    SSIM_WIN = 7
+
+    @staticmethod
+    def sample_cells(n_rows: int, n_cols: int, fraction: float, rng: np.random.Generator,
+                     strata: int = STRATA) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Stratified sample of cells from an n_rows x n_cols grid (proportional allocation).
+        Fewer strata are used when the sample is too small for two cells per stratum, and
+        every stratum gets at least two (or all of its) cells, so each has a variance estimate.
+        Returns: (flat cell indices, stratum id per sample, cells per stratum, samples per stratum)
+        """
+        strata = max(1, min(strata, int(np.sqrt(fraction * n_rows * n_cols / 2))))
+        s_rows = np.minimum(np.arange(n_rows) * strata // n_rows, strata - 1)
+        s_cols = np.minimum(np.arange(n_cols) * strata // n_cols, strata - 1)
+        stratum = (s_rows[:, None] * strata + s_cols[None, :]).ravel()
+
+        counts = np.bincount(stratum, minlength=strata * strata)
+        n_h = np.clip(np.round(fraction * counts), np.minimum(2, counts), counts).astype(np.int64)
+
+        # Random order inside each stratum, keep the first n_h
+        order = np.lexsort((rng.random(stratum.size), stratum))
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(stratum.size) - np.repeat(starts, counts)
+        chosen = order[rank < np.repeat(n_h, counts)]
+        return chosen, stratum[chosen], counts, n_h
+
+    @staticmethod
+    def stratified_mean(x: np.ndarray, strata_ids: np.ndarray, counts: np.ndarray, n_h: np.ndarray,
+                        confidence: float = 0.95) -> Tuple[float, float]:
+        """
+        Stratified estimate of the population mean. Returns (mean, half width of the CI).
+        A partly sampled stratum with a single sample takes the pooled within-stratum variance.
+        """
+        from statistics import NormalDist
+        size = counts.size
+        nh = n_h.astype(np.float64)
+        weights = counts / counts.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_h = np.where(nh > 0, np.bincount(strata_ids, x, size) / nh, 0.0)
+            sq_h = np.bincount(strata_ids, x * x, size)
+            var_h = np.maximum(np.where(nh > 1, (sq_h - nh * mean_h ** 2) / (nh - 1), 0.0), 0)
+            dof = np.maximum(nh - 1, 0)
+            pooled = np.sum(dof * var_h) / dof.sum() if dof.sum() > 0 else 0.0
+            var_h = np.where((nh == 1) & (counts > 1), pooled, var_h)
+            fpc = np.where(counts > 0, 1 - nh / counts, 0.0)
+            var = np.sum(np.where(nh > 0, weights ** 2 * fpc * var_h / nh, 0.0))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return float(np.sum(weights * mean_h)), float(z * np.sqrt(var))
+
+    @staticmethod
+    def _sample_blocks(gt: np.ndarray, dist: np.ndarray, fraction: float, seed: int):
+        """Stratified 8x8 blocks on the aligned grid. Returns (blocks_gt, blocks_dist, sampling info)."""
+        n_rows, n_cols = gt.shape[0] // 8, gt.shape[1] // 8
+        rng = np.random.default_rng(seed)
+        chosen, ids, counts, n_h = PreviewMetrics.sample_cells(n_rows, n_cols, fraction, rng)
+        rows, cols = np.divmod(chosen, n_cols)
+        offs = np.arange(8)
+        ri = (rows * 8)[:, None, None] + offs[None, :, None]
+        ci = (cols * 8)[:, None, None] + offs[None, None, :]
+        return gt[ri, ci], dist[ri, ci], (ids, counts, n_h, float(chosen.size / (n_rows * n_cols)))
+
+    @staticmethod
+    def _psnr_estimate(mse: float, half: float, peak: float, frac: float) -> MetricEstimate:
+        from .psnr_hvsm_lib.psnr import get_psnr
+        value, low, high = (float(get_psnr(max(m, 0.0), peak)) for m in (mse, mse + half, mse - half))
+        return MetricEstimate(value, low, high, frac)
+
+    @staticmethod
+    @MetricRegistry.register_preview("psnr")
+    def estimate_psnr(gt: np.ndarray, dist: np.ndarray, data_range=None, fraction: float = 0.1,
+                      seed: int = 0, confidence: float = 0.95) -> MetricEstimate:
+        """PSNR from the mean squared error of sampled blocks."""
+        if data_range is None: data_range = gt.max() - gt.min()
+        b_gt, b_dist, (ids, counts, n_h, frac) = PreviewMetrics._sample_blocks(gt, dist, fraction, seed)
+        block_mse = np.mean(np.subtract(b_gt, b_dist, dtype=float_dtype(gt, dist)) ** 2, axis=(-2, -1), dtype=np.float64)
+        mse, half = PreviewMetrics.stratified_mean(block_mse, ids, counts, n_h, confidence)
+        return PreviewMetrics._psnr_estimate(mse, half, float(data_range), frac)
+
+    @staticmethod
+    def _estimate_hvs(gt: np.ndarray, dist: np.ndarray, which: int, fraction: float,
+                      seed: int, confidence: float) -> MetricEstimate:
+        from .psnr_hvsm_lib.psnr_hvsm import hvs_hvsm_mse_tiles
+        # Same normalization as the full wrapper (psnr_hvs_hvsm)
+        scale = 255.0 if gt.max() > 1.1 else 1.0
+        b_gt, b_dist, (ids, counts, n_h, frac) = PreviewMetrics._sample_blocks(gt, dist, fraction, seed)
+        dt = float_dtype(gt, dist)
+        tiles = hvs_hvsm_mse_tiles(b_gt.astype(dt) / scale, b_dist.astype(dt) / scale)
+        mse, half = PreviewMetrics.stratified_mean(tiles[which][:, 0], ids, counts, n_h, confidence)
+        return PreviewMetrics._psnr_estimate(mse, half, 1.0, frac)
+
+    @staticmethod
+    @MetricRegistry.register_preview("psnr_hvs")
+    def estimate_psnr_hvs(gt: np.ndarray, dist: np.ndarray, data_range=None, fraction: float = 0.1,
+                          seed: int = 0, confidence: float = 0.95) -> MetricEstimate:
+        """PSNR-HVS from the DCT errors of sampled 8x8 tiles."""
+        return PreviewMetrics._estimate_hvs(gt, dist, 0, fraction, seed, confidence)
+
+    @staticmethod
+    @MetricRegistry.register_preview("psnr_hvsm")
+    def estimate_psnr_hvsm(gt: np.ndarray, dist: np.ndarray, data_range=None, fraction: float = 0.1,
+                           seed: int = 0, confidence: float = 0.95) -> MetricEstimate:
+        """PSNR-HVS-M from the masked DCT errors of sampled 8x8 tiles."""
+        return PreviewMetrics._estimate_hvs(gt, dist, 1, fraction, seed, confidence)
+
+    @staticmethod
+    @MetricRegistry.register_preview("ssim")
+    def estimate_ssim(gt: np.ndarray, dist: np.ndarray, data_range=None, fraction: float = 0.1,
+                      seed: int = 0, confidence: float = 0.95) -> MetricEstimate:
+        """
+        Mean SSIM over sampled 7x7 windows (skimage defaults: uniform window,
+        sample covariance, K1=0.01, K2=0.03). Each sampled window sits at a random
+        position inside its grid cell, so the estimate (and its CI) covers every window
+        position rather than one fixed grid.
+        """
+        if data_range is None: data_range = gt.max() - gt.min()
+        win = PreviewMetrics.SSIM_WIN
+        rng = np.random.default_rng(seed)
+        pad = (win - 1) // 2
+        # Window origins must keep the centre out of the ignored border strip
+        span_r, span_c = gt.shape[0] - 2 * pad, gt.shape[1] - 2 * pad
+        n_rows, n_cols = span_r // win, span_c // win
+        off_r = rng.integers(0, span_r - n_rows * win + 1)
+        off_c = rng.integers(0, span_c - n_cols * win + 1)
+        chosen, ids, counts, n_h = PreviewMetrics.sample_cells(n_rows, n_cols, fraction, rng)
+        rows, cols = np.divmod(chosen, n_cols)
+        jitter = rng.integers(0, win, (2, chosen.size))
+        offs = np.arange(win)
+        ri = (off_r + rows * win + jitter[0])[:, None, None] + offs[None, :, None]
+        ci = (off_c + cols * win + jitter[1])[:, None, None] + offs[None, None, :]
+        dt = float_dtype(gt, dist)
+        x = gt[ri, ci].astype(dt)
+        y = dist[ri, ci].astype(dt)
+
+        # Window moments accumulate in float64 (the variances are differences of them)
+        cov_norm = win * win / (win * win - 1)
+        mean = lambda v: v.mean(axis=(-2, -1), dtype=np.float64)
+        ux, uy = mean(x), mean(y)
+        vx = cov_norm * (mean(x * x) - ux * ux)
+        vy = cov_norm * (mean(y * y) - uy * uy)
+        vxy = cov_norm * (mean(x * y) - ux * uy)
+        c1, c2 = (0.01 * data_range) ** 2, (0.03 * data_range) ** 2
+        s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2))
+
+        mean, half = PreviewMetrics.stratified_mean(s, ids, counts, n_h, confidence)
+        return MetricEstimate(mean, mean - half, mean + half, float(chosen.size / (n_rows * n_cols)))
+
 
 class NoiseEstimator:
     @staticmethod
@@ -113,6 +326,6 @@ class NoiseEstimator:
         kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]])
         high_freq = convolve2d(img_log, kernel, mode='same', boundary='symm')
         mad = np.median(np.abs(high_freq - np.median(high_freq)))
-        # 1.4826 converts MAD to Sigma for Gaussian distribution
-        # * 4.5 is empirical calibration for VST log domain
-        return (1.4826 * mad) * 4.5
+        # 1.4826 converts MAD to Sigma for Gaussian distribution;
+        # the Laplacian amplifies white noise by its L2 norm (sqrt(20))
+        return (1.4826 * mad) / np.sqrt(np.sum(kernel ** 2))
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .config import VSTConfig, MonteCarloConfig
+from .data_loader import SyntheticGenerator
+from .experiments import RateDistortionRunner
+from .memory import get_budget, set_budget
+from .psnr_hvsm import set_metric_threads
+from .precision import resolve_dtype
+
+# OOP quantities aggregated over realizations
+MC_QUANTITIES = ['q', 'psnr', 'psnr_hvsm', 'cr']
+
+
+class RunningStats:
+    """Streaming mean / variance (Welford). Never stores the samples."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else 0.0
+
+    def confidence_interval(self, confidence: float = 0.95) -> Tuple[float, float]:
+        """Student-t interval for the mean."""
+        if self.n < 2: return self.mean, self.mean
+        from scipy.stats import t
+        half = t.ppf(0.5 + confidence / 2, self.n - 1) * self.std / np.sqrt(self.n)
+        return self.mean - half, self.mean + half
+
+
+@dataclass
+class MonteCarloResult:
+    n_realizations: int
+    confidence: float
+    stats: Dict[str, Dict[str, RunningStats]] = field(default_factory=dict) # domain -> quantity -> stats
+
+    @property
+    def summary_df(self):
+        """Mean, std and confidence interval of every OOP quantity per domain."""
+        import pandas as pd
+        rows = []
+        for domain, label in [('linear', 'Standard space'), ('vst', 'VST space')]:
+            for name, st in self.stats.get(domain, {}).items():
+                lo, hi = st.confidence_interval(self.confidence)
+                rows.append({'Method': label, 'Quantity': name, 'N': st.n, 'Mean': st.mean,
+                             'Std': st.std, 'CI Low': lo, 'CI High': hi})
+        return pd.DataFrame(rows)
+
+
+# --- Worker side (module level so it can be pickled) ---
+
+_WORKER: Dict[str, Any] = {}
+
+def _runner_settings(runner: RateDistortionRunner) -> Dict[str, Any]:
+    """What a worker needs to score like `runner`: metrics, metric mode, pre_filter, encoder preset."""
+    return {
+        'metrics': runner.metrics_to_compute, 'metric_mode': runner.metric_mode,
+        'preview_fraction': runner.preview_fraction, 'preview_seed': runner.preview_seed,
+        'pre_filter': runner.pre_filter,
+        'encoder': getattr(runner.codec, 'settings', None), # Sweep preset (bpgenc -m / -e)
+    }
+
+def _init_worker(bpg_path: str, settings: Dict[str, Any], budget_mb: float):
+    from .codec import BPGCodec
+    set_budget(budget_mb) # The parent's budget, also under the 'spawn' start method
+    set_metric_threads(1) # n_workers processes already fill the cores
+    codec = BPGCodec(bpg_path)
+    if settings['encoder']:
+        codec = codec.with_settings(**settings['encoder'])
+    runner = RateDistortionRunner(codec, settings['metrics'], metric_mode=settings['metric_mode'],
+                                  preview_fraction=settings['preview_fraction'], preview_seed=settings['preview_seed'])
+    runner.pre_filter = settings['pre_filter']
+    _WORKER['runner'] = runner
+
+def _oop_values(runner: RateDistortionRunner, img_clean: np.ndarray, img_noised: np.ndarray,
+                vst_cfg: VSTConfig, q_range: List[int], oop_metric: str) -> Dict[str, Dict[str, float]]:
+    """Full analysis of one realization, reduced to its OOP scalars."""
+    out = {}
+    for domain in ['linear', 'vst']:
+        curve = runner.run_curve(img_clean, img_noised, vst_cfg, q_range, use_vst=(domain == 'vst'))
+        oop, _ = runner.find_oop(curve, oop_metric)
+        out[domain] = {k: float(oop[k]) for k in MC_QUANTITIES + [oop_metric] if k in oop}
+    return out
+
+def _run_batch(task: Dict[str, Any], runner: Optional[RateDistortionRunner] = None) -> List[Dict[str, Dict[str, float]]]:
+    runner = runner or _WORKER['runner']
+    dtype = resolve_dtype(task.get('precision', 'float64'))
+    clean = SyntheticGenerator.get_clean(tuple(task['shape'])).astype(dtype, copy=False)
+    results = []
+    for _, batch in SyntheticGenerator.iter_realizations(task['noise_level'], task['count'], task['seed'],
+                                                         task['shape'], batch_size=task['count'],
+                                                         start=task['start']):
+        for noised in batch.astype(dtype, copy=False):
+            results.append(_oop_values(runner, clean, noised, task['vst'], task['q_range'], task['oop_metric']))
+    return results
+
+
+class MonteCarloRunner:
+    """
+    Repeats the full linear vs VST analysis over N seeded noise realizations of the
+    synthetic scene and aggregates the OOPs with streaming statistics.
+    Realizations are generated inside the workers, so at most
+    n_workers * batch_size images exist at any time.
+    """
+
+    def __init__(self, bpg_path: str, metrics_to_compute: Optional[List[str]] = None,
+                 runner: Optional[RateDistortionRunner] = None):
+        self.bpg_path = bpg_path
+        self.metrics_to_compute = metrics_to_compute
+        # Used for in-process runs (n_workers == 1); pool workers build their own with its settings
+        self.runner = runner
+
+    def run(self,
+            noise_level: float,
+            vst_config: VSTConfig,
+            q_range: List[int],
+            oop_metric: str = 'psnr',
+            mc: Optional[MonteCarloConfig] = None,
+            progress_callback: Optional[Callable[[int, int], None]] = None,
+            precision: str = 'float64') -> MonteCarloResult:
+        mc = mc or MonteCarloConfig()
+        n_workers = mc.n_workers or os.cpu_count() or 1
+        batch = max(1, mc.batch_size)
+
+        result = MonteCarloResult(n_realizations=mc.n_realizations, confidence=mc.confidence)
+        tasks = [{'noise_level': noise_level, 'seed': mc.seed, 'shape': tuple(mc.shape),
+                  'start': s, 'count': min(batch, mc.n_realizations - s),
+                  'vst': vst_config, 'q_range': list(q_range), 'oop_metric': oop_metric,
+                  'precision': precision}
+                 for s in range(0, mc.n_realizations, batch)]
+
+        done = 0
+        def accumulate(batch_results):
+            nonlocal done
+            for oops in batch_results:
+                for domain, values in oops.items():
+                    domain_stats = result.stats.setdefault(domain, {})
+                    for name, val in values.items():
+                        domain_stats.setdefault(name, RunningStats()).update(val)
+                done += 1
+            if progress_callback: progress_callback(done, mc.n_realizations)
+
+        if self.runner is None:
+            from .codec import BPGCodec
+            self.runner = RateDistortionRunner(BPGCodec(self.bpg_path), self.metrics_to_compute)
+        if n_workers == 1:
+            for task in tasks:
+                accumulate(_run_batch(task, self.runner))
+            return result
+
+        # Keep a bounded number of tasks in flight so results stream back in order of completion
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(self.bpg_path, _runner_settings(self.runner),
+                                           get_budget() / 1024 ** 2)) as pool:
+            pending = set()
+            for task in tasks:
+                pending.add(pool.submit(_run_batch, task))
+                if len(pending) >= 2 * n_workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in finished: accumulate(f.result())
+            for f in wait(pending).done:
+                accumulate(f.result())
+
+        return result
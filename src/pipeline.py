@@ -0,0 +1,171 @@
+import hashlib
+import os
+import pickle
+import threading
+import uuid
+from dataclasses import is_dataclass, fields
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+from .cache import ImageCache
+from .memory import track
+
+
+def _feed(h, value: Any):
+    """Feeds a parameter value into the digest (arrays by content, containers recursively)."""
+    if isinstance(value, np.ndarray):
+        h.update(f'nd:{value.dtype.str}:{value.shape}'.encode())
+        h.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (bytes, bytearray)):
+        h.update(b'by:')
+        h.update(value)
+    elif isinstance(value, np.generic):
+        _feed(h, value.item())
+    elif value is None or isinstance(value, (str, int, float, bool)):
+        h.update(f'{type(value).__name__}:{value!r};'.encode())
+    elif isinstance(value, dict):
+        h.update(b'd{')
+        for k in sorted(value, key=repr):
+            _feed(h, k)
+            _feed(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'l[')
+        for v in value: _feed(h, v)
+        h.update(b']')
+    elif hasattr(value, 'fingerprint'):
+        h.update(f'fp:{value.fingerprint()};'.encode())
+    elif is_dataclass(value):
+        h.update(f'dc:{type(value).__name__}'.encode())
+        _feed(h, {f.name: getattr(value, f.name) for f in fields(value)})
+    else:
+        raise TypeError(f"Cannot fingerprint stage parameter of type {type(value).__name__}")
+
+
+def fingerprint(*values: Any) -> str:
+    """Stable digest of stage parameters."""
+    h = hashlib.blake2b(digest_size=16)
+    for v in values: _feed(h, v)
+    return h.hexdigest()
+
+
+class StageRef:
+    """
+    Lazy handle to a stage output. The key is known up front (it depends only on the
+    stage name, its parameters and the keys of its inputs); the value is computed,
+    or fetched from the memo, on first access.
+    """
+    __slots__ = ('pipeline', 'name', 'key', '_compute', 'inputs')
+
+    def __init__(self, pipeline: 'Pipeline', name: str, key: str, compute: Callable[..., Any],
+                 inputs: tuple = ()):
+        self.pipeline = pipeline
+        self.name = name
+        self.key = key
+        self._compute = compute # Called with the input values
+        self.inputs = inputs
+
+    @property
+    def value(self) -> Any:
+        return self.pipeline._materialize(self)
+
+    def __repr__(self):
+        return f"StageRef({self.name}, {self.key[:8]})"
+
+
+class Pipeline:
+    """
+    Stage graph with memoized intermediate results.
+    Each stage (load, transform, filter, encode, decode, inverse, metrics, ...) is keyed
+    by a hash of its name, parameters and input keys, so changing a parameter only
+    re-executes the stages downstream of it; everything upstream is a memo hit and is
+    not even materialized unless needed. Outputs are kept in a byte-budgeted LRU in
+    memory and, for the stages in `disk_stages`, pickled under `disk_dir`.
+
+    Stage functions must be pure: everything that affects the output has to be a
+    parameter or an input. The graph may be evaluated from several threads: concurrent
+    requests for the same stage wait for the first computation instead of repeating it.
+    """
+
+    def __init__(self, max_memory_mb: float = 512, disk_dir: Optional[str] = None,
+                 disk_stages: Optional[Iterable[str]] = None):
+        """
+        Args:
+            max_memory_mb: Byte budget of the in-memory memo.
+            disk_dir: If set, stage outputs are also stored as <disk_dir>/<stage>/<key>.pkl.
+            disk_stages: Stages persisted to disk (None = all).
+        """
+        self.memory = ImageCache(int(max_memory_mb * 1024 ** 2))
+        self.disk_dir = disk_dir
+        self.disk_stages = set(disk_stages) if disk_stages is not None else None
+        self.runs: Dict[str, int] = {} # Executions per stage (memo misses)
+        self._source_keys: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    # --- Graph construction ---
+
+    def source(self, name: str, value: Any, key: Optional[str] = None) -> StageRef:
+        """
+        Wraps an existing value (e.g. a loaded image) as a graph input ('source' node,
+        not memoized). Without an explicit key the content is hashed; the digest is
+        remembered per object. `name` only labels the input.
+        """
+        if key is None:
+            entry = self._source_keys.get(id(value))
+            if entry is None or entry[0] is not value:
+                if len(self._source_keys) >= 8: self._source_keys.clear()
+                # Holding the object keeps its id() unique while the entry exists
+                entry = (value, fingerprint(value))
+                self._source_keys[id(value)] = entry
+            key = entry[1]
+        return StageRef(self, 'source', fingerprint(name, key), lambda: value)
+
+    def stage(self, name: str, func: Callable[..., Any], *inputs: StageRef, **params) -> StageRef:
+        """Declares func(*input values, **params) as a stage. Nothing runs until .value is read."""
+        key = fingerprint(name, [i.key for i in inputs], params)
+        return StageRef(self, name, key, lambda *values: func(*values, **params), inputs)
+
+    # --- Evaluation ---
+
+    def _disk_path(self, ref: StageRef) -> Optional[str]:
+        if self.disk_dir is None: return None
+        if self.disk_stages is not None and ref.name not in self.disk_stages: return None
+        return os.path.join(self.disk_dir, ref.name, f"{ref.key}.pkl")
+
+    def _materialize(self, ref: StageRef) -> Any:
+        if ref.name == 'source': # Held by the caller already
+            return ref._compute()
+        # Concurrent requests for the key wait for the first computation (ImageCache.get_or_load)
+        return self.memory.get_or_load(ref.key, lambda: self._load_or_compute(ref))
+
+    def _load_or_compute(self, ref: StageRef) -> Any:
+        path = self._disk_path(ref)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+        values = [i.value for i in ref.inputs] # Inputs first: the stage's memory is its own
+        with track(ref.name):
+            value = ref._compute(*values)
+        with self._lock:
+            self.runs[ref.name] = self.runs.get(ref.name, 0) + 1
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp" # Unique per writer (threads share the pid)
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        return value
+
+    def clear(self, disk: bool = False):
+        """Drops the in-memory memo (and the disk store if requested)."""
+        self.memory.clear()
+        self._source_keys.clear()
+        if disk and self.disk_dir and os.path.isdir(self.disk_dir):
+            import shutil
+            shutil.rmtree(self.disk_dir)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {**self.memory.stats, 'runs': dict(self.runs)}
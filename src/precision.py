@@ -0,0 +1,21 @@
+import numpy as np
+
+# Working precision of the image chain. Data is converted once, where it enters (loader,
+# generator); the VST, codec restore, metrics and error maps then compute in the dtype
+# of their inputs instead of upcasting. float32 halves the memory traffic and is ample
+# for 8-bit quantized data; float64 is the reference. Reductions (means, sums over
+# images) always accumulate in float64.
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+
+def resolve_dtype(precision: str) -> np.dtype:
+    """'float64' / 'float32' -> numpy dtype."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Use one of {tuple(PRECISIONS)}")
+    return np.dtype(PRECISIONS[precision])
+
+
+def float_dtype(*arrays) -> np.dtype:
+    """Dtype to compute in for these inputs: float32 if they all are, float64 otherwise (ints included)."""
+    dt = np.result_type(*arrays)
+    return dt if dt == np.float32 else np.dtype(np.float64)
@@ -2,17 +2,35 @@
 import sys
 import os
 import numpy as np
+from typing import Optional
+
+from .memory import budget_rows
+from .precision import float_dtype
 
 # Add repo root check removed as we now use relative imports
 
 try:
     # Import the pure python backend from the VENDORED local library
-    from .psnr_hvsm_lib.psnr_hvsm import psnr_hvs_hvsm as _lib_psnr_hvsm
+    from .psnr_hvsm_lib.psnr_hvsm import psnr_hvs_hvsm as _lib_psnr_hvsm, tiles_to_map
 except ImportError:
     print("WARNING: Could not import vendored psnr_hvsm_lib. Using fallback/stub.")
     _lib_psnr_hvsm = None
 
-def psnr_hvs_hvsm(img1: np.ndarray, img2: np.ndarray) -> tuple:
+# Threads per metric call (tile bands in parallel); None = os.cpu_count(). Serial by
+# default: worker processes and service threads already run metrics side by side, so
+# only the interactive UI opts in (AppConfig.experiment.metric_threads)
+_THREADS = {'n': 1}
+# Images with fewer rows per thread than this are not split further (pool overhead)
+MIN_BAND_ROWS = 64
+
+def set_metric_threads(n: Optional[int] = None):
+    _THREADS['n'] = n
+
+def metric_threads() -> int:
+    return max(1, _THREADS['n'] or os.cpu_count() or 1)
+
+def psnr_hvs_hvsm(img1: np.ndarray, img2: np.ndarray, batch: bool = False, return_maps: bool = False,
+                  n_threads: Optional[int] = None) -> tuple:
     """
     Wrapper for the local PSNR-HVS-M library integration.
     Handles normalization to [0, 1] and cropping to 8x8 multiples.
@@ -20,50 +38,72 @@ def psnr_hvs_hvsm(img1: np.ndarray, img2: np.ndarray) -> tuple:
     Args:
         img1: Reference image (any range, will be normalized)
         img2: Distorted image (any range, will be normalized)
+        batch: If True, inputs are (..., H, W) stacks and one value per frame is returned.
+        return_maps: If True, also return the per-8x8-tile HVS and HVS-M MSE (normalized
+            [0, 1] units) as (..., H // 8, W // 8) grids, from the same pass.
+        n_threads: Threads over tile bands (None = set_metric_threads, default 1).
         
     Returns:
-        (psnr_hvs, psnr_hvsm)
+        (psnr_hvs, psnr_hvsm) - scalars, or arrays over the leading axes if batch
+        (psnr_hvs, psnr_hvsm, hvs_map, hvsm_map) if return_maps
     """
     # 1. Determine Range and Normalize
     # The library hardcodes peak=1.0 in get_psnr().
     # So we MUST normalize to [0, 1].
     
-    img1 = img1.astype(np.float64)
-    img2 = img2.astype(np.float64)
+    # Copies in the inputs' precision (float32 stays float32), normalized in place
+    dt = float_dtype(img1, img2)
+    img1 = img1.astype(dt)
+    img2 = img2.astype(dt)
     
     # Heuristic for range: if max > 1.1, assume [0, 255]
-    if img1.max() > 1.1:
+    if batch:
+        # Decided per frame
+        scale = np.where(img1.max(axis=(-2, -1), keepdims=True) > 1.1, 255.0, 1.0)
+        img1 /= scale
+        img2 /= scale
+    elif img1.max() > 1.1:
         img1 /= 255.0
         img2 /= 255.0
         
     # 2. Crop to 8x8
-    h, w = img1.shape
+    h, w = img1.shape[-2:]
     h = (h // 8) * 8
     w = (w // 8) * 8
-    img1 = img1[:h, :w]
-    img2 = img2[:h, :w]
+    img1 = img1[..., :h, :w]
+    img2 = img2[..., :h, :w]
     
     # 3. Call Library
     if _lib_psnr_hvsm is None:
-        return 0.0, 0.0
+        return (0.0, 0.0, None, None) if return_maps else (0.0, 0.0)
 
     try:
         # Function signature: (images_a, images_b, batch=False)
-        # It handles batching. We pass single images (H, W).
+        # It handles batching. We pass single images (H, W) or stacks (..., H, W).
         # Internal to_blocks expects (..., H, W).
         # hvs_mse_tiles returns tiles.
         # psnr_hvs_hvsm returns scalar means if not batch.
         
-        res_hvs, res_hvsm = _lib_psnr_hvsm(img1, img2, batch=False)
+        # Bands of rows sized from the memory budget (~16 float64 temporaries per pixel,
+        # for every band in flight)
+        n_threads = metric_threads() if n_threads is None else max(1, n_threads)
+        n_threads = max(1, min(n_threads, h // MIN_BAND_ROWS))
+        n_frames = int(np.prod(img1.shape[:-2], dtype=np.int64))
+        chunk_rows = budget_rows(n_frames * w * 8 * 16, concurrency=n_threads, align=8)
+        res = _lib_psnr_hvsm(img1, img2, batch=batch, return_tiles=return_maps,
+                             chunk_rows=chunk_rows, n_workers=n_threads)
+        res_hvs, res_hvsm = res[:2]
         
         # Ensure scalars
-        if isinstance(res_hvs, np.ndarray) and res_hvs.size == 1:
+        if isinstance(res_hvs, np.ndarray) and res_hvs.size == 1 and not batch:
             res_hvs = float(res_hvs)
-        if isinstance(res_hvsm, np.ndarray) and res_hvsm.size == 1:
+        if isinstance(res_hvsm, np.ndarray) and res_hvsm.size == 1 and not batch:
             res_hvsm = float(res_hvsm)
             
+        if return_maps:
+            return res_hvs, res_hvsm, tiles_to_map(res[2], h, w), tiles_to_map(res[3], h, w)
         return res_hvs, res_hvsm
         
     except Exception as e:
         print(f"Error calling internal PSNR-HVS-M library: {e}")
-        return 0.0, 0.0
+        return (0.0, 0.0, None, None) if return_maps else (0.0, 0.0)
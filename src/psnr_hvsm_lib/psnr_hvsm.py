@@ -1,6 +1,6 @@
 import numpy as np
-from scipy.fft import dctn
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from .psnr import get_psnr # Relative import within lib
 
 # ... Constants ...
@@ -30,12 +30,17 @@ def to_blocks(x: np.ndarray) -> np.ndarray:
     h, w = shape[-2:]
     return np.moveaxis(x.reshape(-1, h // DCT_H, DCT_H, w // DCT_W, DCT_W), -2, -3).reshape(*prev_shape, -1, DCT_H, DCT_W)
 
+def from_blocks(blocks: np.ndarray, h: int, w: int) -> np.ndarray:
+    """Inverse of to_blocks: (..., n_blocks, 8, 8) -> (..., h, w)."""
+    prev_shape = blocks.shape[:-3]
+    return np.moveaxis(blocks.reshape(-1, h // DCT_H, w // DCT_W, DCT_H, DCT_W), -3, -2).reshape(*prev_shape, h, w)
+
 def masking(tiles: np.ndarray, tiles_dct: np.ndarray) -> np.ndarray:
     qh = DCT_H // 2
     qw = DCT_W // 2
 
     acs = tiles_dct.reshape(*tiles_dct.shape[:-2], DCT_H * DCT_W)[..., 1:]
-    mask = np.sum(np.power(acs, 2.0) * MASK_COEFF[1:], axis=-1)
+    mask = np.sum(np.power(acs, 2.0) * MASK_COEFF[1:].astype(acs.dtype), axis=-1)
 
     def vari(a: np.ndarray) -> np.ndarray:
         return np.var(a, axis=(-1, -2), ddof=1) * a.shape[-1] * a.shape[-2]
@@ -50,12 +55,44 @@ def masking(tiles: np.ndarray, tiles_dct: np.ndarray) -> np.ndarray:
     return np.sqrt(mask * var / (qh * qw) / (DCT_H * DCT_W))
 
 
-def hvs_hvsm_mse_tiles(images_a: np.ndarray, images_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def hvs_hvsm_mse_tiles(images_a: np.ndarray, images_b: np.ndarray,
+                       chunk_rows: Optional[int] = None, n_workers: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-tile HVS and HVS-M MSE, (..., n_tiles) each. With chunk_rows, the images are
+    processed in horizontal bands of that many rows (rounded down to a multiple of 8),
+    which bounds the DCT and masking temporaries; tiles are independent and come out
+    in the same order, so the result only differs by summation rounding.
+    With n_workers > 1 the bands (at least one per worker) run on a thread pool; the
+    numpy and scipy.fft kernels release the GIL, so one call scales with the cores.
+    """
+    h = images_a.shape[-2]
+    n_workers = max(1, n_workers or 1)
+    if n_workers > 1:
+        per_worker = -(-(h // DCT_H) // n_workers) * DCT_H
+        chunk_rows = per_worker if chunk_rows is None else min(chunk_rows, per_worker)
+    if chunk_rows is not None and chunk_rows < h:
+        step = max(DCT_H, chunk_rows // DCT_H * DCT_H)
+
+        def band(r0: int) -> Tuple[np.ndarray, np.ndarray]:
+            return hvs_hvsm_mse_tiles(images_a[..., r0:r0 + step, :], images_b[..., r0:r0 + step, :])
+
+        starts = range(0, h, step)
+        if n_workers > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=min(n_workers, len(starts))) as pool:
+                parts = list(pool.map(band, starts))
+        else:
+            parts = [band(r0) for r0 in starts]
+        return (np.concatenate([p[0] for p in parts], axis=-1),
+                np.concatenate([p[1] for p in parts], axis=-1))
+
+    from scipy.fft import dctn # Deferred: scipy.fft is slow to import
+
     tiles_a = to_blocks(images_a)
     tiles_b = to_blocks(images_b)
 
-    mask_coeff = MASK_COEFF.reshape((DCT_H, DCT_W))
-    coeff = CSF_COEFF.reshape((DCT_H, DCT_W))
+    # Tables in the images' precision, so float32 input is not upcast
+    mask_coeff = MASK_COEFF.reshape((DCT_H, DCT_W)).astype(tiles_a.dtype)
+    coeff = CSF_COEFF.reshape((DCT_H, DCT_W)).astype(tiles_a.dtype)
     dct_a = dctn(tiles_a, norm='ortho', axes=(-1, -2))
     dct_b = dctn(tiles_b, norm='ortho', axes=(-1, -2))
 
@@ -80,10 +117,21 @@ def hvs_hvsm_mse_tiles(images_a: np.ndarray, images_b: np.ndarray) -> Tuple[np.n
             weighted_mse / (DCT_H * DCT_W))
 
 
-def psnr_hvs_hvsm(images_a: np.ndarray, images_b: np.ndarray, batch=False) -> Tuple[np.ndarray, np.ndarray]:
-    hvs_tiles, hvsm_tiles = hvs_hvsm_mse_tiles(images_a, images_b)
+def tiles_to_map(tiles: np.ndarray, h: int, w: int) -> np.ndarray:
+    """Per-tile values (..., n_tiles) -> spatial grid (..., h // 8, w // 8), inverse of the to_blocks order."""
+    return tiles.reshape(*tiles.shape[:-1], h // DCT_H, w // DCT_W)
+
+
+def psnr_hvs_hvsm(images_a: np.ndarray, images_b: np.ndarray, batch=False, return_tiles=False,
+                  chunk_rows=None, n_workers=1):
+    hvs_tiles, hvsm_tiles = hvs_hvsm_mse_tiles(images_a, images_b, chunk_rows=chunk_rows, n_workers=n_workers)
 
     if batch or len(hvs_tiles.shape) < 2:
-        return get_psnr(hvs_tiles.mean(axis=-1), 1.0), get_psnr(hvsm_tiles.mean(axis=-1), 1.0)
+        values = get_psnr(hvs_tiles.mean(axis=-1, dtype=np.float64), 1.0), get_psnr(hvsm_tiles.mean(axis=-1, dtype=np.float64), 1.0)
     else:
-        return get_psnr(hvs_tiles.mean(axis=-1), 1.0).mean(axis=0), get_psnr(hvsm_tiles.mean(axis=-1), 1.0).mean(axis=0)
+        values = (get_psnr(hvs_tiles.mean(axis=-1, dtype=np.float64), 1.0).mean(axis=0),
+                  get_psnr(hvsm_tiles.mean(axis=-1, dtype=np.float64), 1.0).mean(axis=0))
+
+    if return_tiles:
+        return (*values, hvs_tiles, hvsm_tiles)
+    return values
@@ -0,0 +1,282 @@
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Rate-distortion modelling from sparse sweeps: a handful of encodes per curve are
+# fitted, the full curve and the OOP are predicted with bootstrap intervals, and the
+# linear and VST paths are compared with Bjontegaard deltas (one number per image).
+
+
+def sparse_q(q_range: Sequence[int], n_points: int = 7) -> List[int]:
+    """n_points Qs of q_range, evenly spread with both ends included."""
+    q_range = sorted(q_range)
+    if n_points >= len(q_range):
+        return [int(q) for q in q_range]
+    idx = np.unique(np.round(np.linspace(0, len(q_range) - 1, max(2, n_points))).astype(int))
+    return [int(q_range[i]) for i in idx]
+
+
+# --- Batched polynomial helpers (leading axes are independent curves) ---
+
+def _design(x: np.ndarray, degree: int) -> np.ndarray:
+    return x[..., None] ** np.arange(degree + 1)
+
+
+def _polyfit(x: np.ndarray, y: np.ndarray, degree: int, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """Weighted least squares over the last axis; coefficients (..., degree + 1), lowest order first."""
+    x, y = np.broadcast_arrays(x, y)
+    w = np.ones(y.shape) if weights is None else np.broadcast_to(weights, y.shape)
+    v = _design(x, degree)
+    vt_w = np.swapaxes(v * w[..., None], -1, -2)
+    a = vt_w @ v + 1e-9 * np.eye(degree + 1) # Tiny ridge: masked-out curves stay solvable
+    return np.linalg.solve(a, (vt_w @ y[..., None]))[..., 0]
+
+
+def _polyval(coeffs: np.ndarray, x: np.ndarray) -> np.ndarray:
+    return (_design(x, coeffs.shape[-1] - 1) @ coeffs[..., None])[..., 0]
+
+
+def _polyint(coeffs: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Integral of the polynomials over [lo, hi] (per curve)."""
+    k = np.arange(1, coeffs.shape[-1] + 1)
+    return np.sum(coeffs / k * (hi[..., None] ** k - lo[..., None] ** k), axis=-1)
+
+
+def _masked_range(x: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return np.where(mask, x, np.inf).min(axis=-1), np.where(mask, x, -np.inf).max(axis=-1)
+
+
+def _bd_delta(x_a, y_a, x_b, y_b, mask_a=None, mask_b=None, degree: int = 3) -> np.ndarray:
+    """
+    Mean of y_b(x) - y_a(x) over the x interval covered by both curves, with y fitted as
+    a polynomial of x per curve (the Bjontegaard integral). NaN where a curve has fewer
+    than degree + 1 points or the curves do not overlap.
+    """
+    x_a, y_a, x_b, y_b = (np.asarray(v, dtype=np.float64) for v in (x_a, y_a, x_b, y_b))
+    mask_a = np.ones(np.broadcast_shapes(x_a.shape, y_a.shape), bool) if mask_a is None else np.asarray(mask_a, bool)
+    mask_b = np.ones(np.broadcast_shapes(x_b.shape, y_b.shape), bool) if mask_b is None else np.asarray(mask_b, bool)
+    x_a, y_a, mask_a = np.broadcast_arrays(x_a, y_a, mask_a)
+    x_b, y_b, mask_b = np.broadcast_arrays(x_b, y_b, mask_b)
+
+    lo_a, hi_a = _masked_range(x_a, mask_a)
+    lo_b, hi_b = _masked_range(x_b, mask_b)
+    lo, hi = np.maximum(lo_a, lo_b), np.minimum(hi_a, hi_b)
+    # Common normalization keeps the cubic well conditioned (PSNR ~ 30 dB -> x^3 ~ 3e4)
+    center = (np.minimum(lo_a, lo_b) + np.maximum(hi_a, hi_b)) / 2
+    scale = np.maximum((np.maximum(hi_a, hi_b) - np.minimum(lo_a, lo_b)) / 2, 1e-12)
+    center = np.where(np.isfinite(center), center, 0.0)
+    scale = np.where(np.isfinite(scale), scale, 1.0)
+
+    def fit(x, y, mask):
+        xn = (x - center[..., None]) / scale[..., None]
+        return _polyfit(np.where(mask, xn, 0.0), np.where(mask, y, 0.0), degree, mask.astype(np.float64))
+
+    lo_n, hi_n = (lo - center) / scale, (hi - center) / scale
+    valid = (hi > lo) & (mask_a.sum(axis=-1) > degree) & (mask_b.sum(axis=-1) > degree)
+    lo_n, hi_n = np.where(valid, lo_n, 0.0), np.where(valid, hi_n, 1.0)
+    diff = (_polyint(fit(x_b, y_b, mask_b), lo_n, hi_n) - _polyint(fit(x_a, y_a, mask_a), lo_n, hi_n)) / (hi_n - lo_n)
+    return np.where(valid, diff, np.nan)
+
+
+def bd_rate(rate_a, quality_a, rate_b, quality_b, mask_a=None, mask_b=None) -> np.ndarray:
+    """
+    Bjontegaard delta-rate (%) of curve b against curve a: the mean bitrate difference at
+    equal quality (negative = b needs fewer bits). Inputs are (..., n_points) arrays;
+    the leading axes are evaluated independently (e.g. bootstrap replicates). Masks
+    select the points to use per curve.
+    """
+    delta = _bd_delta(quality_a, np.log(rate_a), quality_b, np.log(rate_b), mask_a, mask_b)
+    return (np.exp(delta) - 1.0) * 100.0
+
+
+def bd_quality(rate_a, quality_a, rate_b, quality_b, mask_a=None, mask_b=None) -> np.ndarray:
+    """Bjontegaard delta-quality (e.g. BD-PSNR, dB) of curve b against a at equal rate."""
+    return _bd_delta(np.log(rate_a), quality_a, np.log(rate_b), quality_b, mask_a, mask_b)
+
+
+def rising_branch(rate: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    """
+    Mask of the points at or below the rate of the best quality (per curve). With noisy
+    input the quality peaks at the OOP and falls again as the codec starts keeping the
+    noise; only the branch below the OOP is monotone, as the BD integrals assume.
+    """
+    rate, quality = np.broadcast_arrays(np.asarray(rate), np.asarray(quality))
+    best = np.take_along_axis(rate, np.argmax(quality, axis=-1)[..., None], axis=-1)
+    return rate <= best
+
+
+@dataclass
+class RDFit:
+    """
+    Model of one RD curve fitted to a sparse sweep.
+    Rate: log(bpp) over Q, monotone (PCHIP through the sampled points, bpp falls with Q).
+    Quality: polynomial of log(bpp). With noisy input the quality peaks at the OOP, so
+    this part is unimodal rather than monotone. Intervals come from a residual bootstrap
+    of the quality fit.
+    """
+    q: np.ndarray             # Sampled Qs (ascending)
+    bpp: np.ndarray
+    quality: np.ndarray
+    metric: str
+    degree: int
+    center: float             # log(bpp) normalization of the polynomial
+    scale: float
+    coeffs: np.ndarray        # (degree + 1,) lowest order first
+    boot_coeffs: np.ndarray   # (n_boot, degree + 1)
+
+    def _x(self, bpp: np.ndarray) -> np.ndarray:
+        return (np.log(bpp) - self.center) / self.scale
+
+    def predict_bpp(self, q: Sequence[float]) -> np.ndarray:
+        from scipy.interpolate import PchipInterpolator
+        return np.exp(PchipInterpolator(self.q, np.log(self.bpp))(np.asarray(q, dtype=np.float64)))
+
+    def predict(self, q: Sequence[float], bootstrap: bool = False) -> np.ndarray:
+        """Quality at q; (n_boot, len(q)) replicates if bootstrap."""
+        x = self._x(self.predict_bpp(q))
+        return _polyval(self.boot_coeffs if bootstrap else self.coeffs, x)
+
+    def predict_curve(self, q: Sequence[int], confidence: float = 0.95) -> Dict[str, np.ndarray]:
+        """Predicted curve as columns (q, bpp, <metric>, <metric>_lo, <metric>_hi)."""
+        q = np.asarray(q)
+        boot = self.predict(q, bootstrap=True)
+        tail = (1.0 - confidence) / 2 * 100
+        return {'q': q, 'bpp': self.predict_bpp(q), self.metric: self.predict(q),
+                f'{self.metric}_lo': np.percentile(boot, tail, axis=0),
+                f'{self.metric}_hi': np.percentile(boot, 100 - tail, axis=0)}
+
+    def predict_oop(self, q_grid: Sequence[int], confidence: float = 0.95) -> Dict[str, float]:
+        """Predicted OOP on q_grid, with the bootstrap interval of its Q and quality."""
+        q_grid = np.asarray(sorted(q_grid))
+        pred = self.predict(q_grid)
+        best = int(np.argmax(pred))
+        boot = self.predict(q_grid, bootstrap=True)
+        boot_best = np.argmax(boot, axis=-1)
+        tail = (1.0 - confidence) / 2 * 100
+        q_lo, q_hi = np.percentile(q_grid[boot_best], [tail, 100 - tail])
+        v_lo, v_hi = np.percentile(boot[np.arange(len(boot)), boot_best], [tail, 100 - tail])
+        return {'q': int(q_grid[best]), 'q_lo': float(q_lo), 'q_hi': float(q_hi),
+                'bpp': float(self.predict_bpp([q_grid[best]])[0]),
+                self.metric: float(pred[best]), f'{self.metric}_lo': float(v_lo), f'{self.metric}_hi': float(v_hi)}
+
+
+def fit_rd_curve(curve: Dict[str, Any], metric: str = 'psnr', degree: int = 3,
+                 n_boot: int = 200, seed: int = 0) -> RDFit:
+    """
+    Fits an RDFit to a (sparse) curve from RateDistortionRunner.run_curve. Falls back to
+    PSNR if `metric` was not computed. The degree is lowered for very short curves.
+    """
+    if metric not in curve or len(curve[metric]) == 0:
+        metric = 'psnr'
+    order = np.argsort(curve['q'])
+    q = np.asarray(curve['q'], dtype=np.float64)[order]
+    bpp = np.asarray(curve['bpp'], dtype=np.float64)[order]
+    quality = np.asarray(curve[metric], dtype=np.float64)[order]
+    if len(q) < 2:
+        raise ValueError("At least two RD points are required")
+
+    degree = min(degree, len(q) - 1)
+    log_bpp = np.log(bpp)
+    center = float((log_bpp.max() + log_bpp.min()) / 2)
+    scale = float(max((log_bpp.max() - log_bpp.min()) / 2, 1e-12))
+    x = (log_bpp - center) / scale
+    coeffs = _polyfit(x, quality, degree)
+
+    # Residual bootstrap (residuals inflated for the fitted degrees of freedom)
+    fitted = _polyval(coeffs, x)
+    resid = quality - fitted
+    dof = len(q) - degree - 1
+    if dof > 0:
+        resid *= np.sqrt(len(q) / dof)
+    rng = np.random.default_rng(seed)
+    boot_quality = fitted + resid[rng.integers(0, len(q), size=(n_boot, len(q)))]
+    boot_coeffs = _polyfit(x, boot_quality, degree)
+    return RDFit(q, bpp, quality, metric, degree, center, scale, coeffs, boot_coeffs)
+
+
+@dataclass
+class RDComparison:
+    """Sparse-sweep linear vs VST comparison (see compare_fits)."""
+    fits: Dict[str, RDFit]                   # 'linear' / 'vst'
+    q_grid: List[int]
+    oop_points: Dict[str, Dict[str, float]]  # domain -> predicted OOP with intervals
+    bd_rate: float                           # % of VST vs linear (negative = VST saves bits)
+    bd_rate_ci: Tuple[float, float]
+    bd_quality: float                        # metric units (dB) of VST vs linear
+    bd_quality_ci: Tuple[float, float]
+    confidence: float = 0.95
+    encodes: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def metric(self) -> str:
+        return self.fits['linear'].metric
+
+    @property
+    def predicted_curves(self) -> Dict[str, Dict[str, np.ndarray]]:
+        return {d: fit.predict_curve(self.q_grid, self.confidence) for d, fit in self.fits.items()}
+
+    @property
+    def metrics_df(self):
+        """Predicted OOP per domain (with intervals) and the BD deltas of VST vs linear."""
+        import pandas as pd
+        m = self.metric
+        rows = []
+        for domain, label in [('linear', 'Standard space'), ('vst', 'VST space')]:
+            oop = self.oop_points.get(domain, {})
+            rows.append({
+                'Method': label,
+                'Encodes': self.encodes.get(domain, len(self.fits[domain].q)),
+                'Q(OOP)': oop.get('q', -1),
+                'Q CI': f"[{oop.get('q_lo', 0):.0f}, {oop.get('q_hi', 0):.0f}]",
+                f'{m.upper()}(OOP)': oop.get(m, 0.0),
+                f'{m.upper()} CI': f"[{oop.get(f'{m}_lo', 0):.2f}, {oop.get(f'{m}_hi', 0):.2f}]",
+                'bpp(OOP)': oop.get('bpp', 0.0),
+            })
+        df = pd.DataFrame(rows)
+        df['BD-rate (%)'] = ['', f"{self.bd_rate:.2f} [{self.bd_rate_ci[0]:.2f}, {self.bd_rate_ci[1]:.2f}]"]
+        df[f'BD-{m.upper()}'] = ['', f"{self.bd_quality:.3f} [{self.bd_quality_ci[0]:.3f}, {self.bd_quality_ci[1]:.3f}]"]
+        return df
+
+
+def compare_fits(fit_linear: RDFit, fit_vst: RDFit, q_grid: Sequence[int],
+                 confidence: float = 0.95, branch: str = 'rising') -> RDComparison:
+    """
+    Predicts both curves on q_grid and computes BD-rate / BD-quality of VST against
+    linear from the predicted curves; the intervals come from evaluating all bootstrap
+    replicates at once.
+    Args:
+        branch: 'rising' restricts the BD integrals to the points below each curve's OOP
+            (see rising_branch); 'all' uses the whole curves.
+    """
+    if branch not in ('rising', 'all'):
+        raise ValueError(f"Unknown branch '{branch}'. Use 'rising' or 'all'")
+    q_grid = sorted(q_grid)
+    rates = [fit.predict_bpp(q_grid) for fit in (fit_linear, fit_vst)]
+    point = [fit.predict(q_grid) for fit in (fit_linear, fit_vst)]
+    boot = [fit.predict(q_grid, bootstrap=True) for fit in (fit_linear, fit_vst)]
+
+    def deltas(quality_a, quality_b):
+        masks = ([rising_branch(rates[0], quality_a), rising_branch(rates[1], quality_b)]
+                 if branch == 'rising' else [None, None])
+        return (bd_rate(rates[0], quality_a, rates[1], quality_b, *masks),
+                bd_quality(rates[0], quality_a, rates[1], quality_b, *masks))
+
+    rate, quality = deltas(*point)
+    boot_rate, boot_quality = deltas(*boot)
+    tail = (1.0 - confidence) / 2 * 100
+
+    def interval(values):
+        values = values[np.isfinite(values)]
+        if len(values) == 0: return (np.nan, np.nan)
+        lo, hi = np.percentile(values, [tail, 100 - tail])
+        return float(lo), float(hi)
+
+    return RDComparison(
+        fits={'linear': fit_linear, 'vst': fit_vst},
+        q_grid=list(q_grid),
+        oop_points={'linear': fit_linear.predict_oop(q_grid, confidence),
+                    'vst': fit_vst.predict_oop(q_grid, confidence)},
+        bd_rate=float(rate), bd_rate_ci=interval(boot_rate),
+        bd_quality=float(quality), bd_quality_ci=interval(boot_quality),
+        confidence=confidence,
+    )
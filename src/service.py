@@ -0,0 +1,487 @@
+import io
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .app_logic import AnalysisController, AnalysisResult
+from .cache import ImageCache
+from .codec import BPGCodec
+from .pipeline import Pipeline, fingerprint
+from .storage import StoredImage
+
+# Local HTTP service around AnalysisController, so several notebook kernels share one
+# set of caches instead of each repeating the same encodes. A bounded pool of
+# controllers runs the jobs; all of them share the image cache, the stage graph (its
+# memo and optional disk store) and the codec, so a sweep one client ran is a memo hit
+# for the next. Identical submissions (same parameters, same input files) map to the
+# same job. Stdlib only (http.server / urllib):
+#
+#   GET  /health                  workers, queued / running jobs
+#   GET  /stats                   cache statistics
+#   POST /arrays                  .npy body -> {'id'} (input for source_type 'array')
+#   POST /jobs                    JSON job -> {'job_id', 'status'}
+#   GET  /jobs/<id>               status, progress, error; curves and OOPs when done
+#   GET  /jobs/<id>/arrays        .npz with the result images and quality maps
+#
+# Start with `python -m src.service --port 8765 --workers 2`; notebooks use
+# AnalysisClient (or AnalysisUI(service_url=...)). Meant for a trusted local network:
+# there is no authentication, and file paths are resolved on the server.
+
+# run_analysis arguments a job may set
+JOB_PARAMS = ('source_type', 'noise_level', 'path_noised', 'path_original', 'vst_a', 'vst_b',
+              'q_start', 'q_end', 'q_step', 'oop_metric', 'early_stop_patience', 'metric_mode',
+              'preview_fraction', 'pre_filter', 'filter_params')
+# Controller settings a job may set
+JOB_SETTINGS = ('precision', 'image_storage', 'gen_shape', 'encoder')
+
+
+def _to_json(value: Any) -> Any:
+    """json.dumps default: numpy scalars and arrays."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def result_to_json(result: AnalysisResult) -> Dict[str, Any]:
+    """Scalar part of a result (curves, OOPs, memory); the arrays go through result_arrays."""
+    return {'curves': result.curves, 'oop_points': result.oop_points, 'file_ext': result.file_ext,
+            'oop_metric': result.oop_metric, 'memory': result.memory}
+
+
+def result_arrays(result: AnalysisResult) -> bytes:
+    """Images (as stored: codes + LUT) and quality maps of a result as .npz bytes."""
+    arrays = {}
+    for name, img in result.images.items():
+        if img is None: continue
+        arrays[f'image/{name}/codes'] = np.asarray(img.codes)
+        if img.lut is not None: arrays[f'image/{name}/lut'] = img.lut
+    for domain, maps in result.quality_maps.items():
+        for metric, m in maps.items():
+            arrays[f'map/{domain}/{metric}'] = m
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def result_from_payload(summary: Dict[str, Any], npz: bytes, spill_dir: Optional[str] = None) -> AnalysisResult:
+    """Inverse of result_to_json + result_arrays."""
+    curves = {d: {k: np.asarray(v, dtype=np.int64 if k == 'q' else np.float64) for k, v in c.items()}
+              for d, c in summary['curves'].items()}
+    images: Dict[str, Optional[StoredImage]] = {}
+    quality_maps: Dict[str, Dict[str, np.ndarray]] = {}
+    with np.load(io.BytesIO(npz), allow_pickle=False) as data:
+        for key in data.files:
+            kind, a, b = key.split('/')
+            if kind == 'map':
+                quality_maps.setdefault(a, {})[b] = data[key]
+            elif b == 'codes':
+                codes, path = data[key], None
+                if spill_dir is not None:
+                    os.makedirs(spill_dir, exist_ok=True)
+                    path = os.path.join(spill_dir, f"{a}_{uuid.uuid4().hex[:8]}.npy")
+                    np.save(path, codes)
+                    codes = np.load(path, mmap_mode='r')
+                lut_key = f'image/{a}/lut'
+                images[a] = StoredImage(codes, data[lut_key] if lut_key in data.files else None, path)
+    for name in ('source', 'ref', 'oop_linear', 'oop_vst'):
+        images.setdefault(name, None)
+    return AnalysisResult(curves=curves, oop_points=summary['oop_points'], file_ext=summary['file_ext'],
+                          oop_metric=summary['oop_metric'], images=images, quality_maps=quality_maps,
+                          memory=summary.get('memory', {}))
+
+
+class Job:
+    __slots__ = ('job_id', 'key', 'request', 'status', 'progress', 'error', 'result',
+                 'submitted', 'started', 'finished')
+
+    def __init__(self, job_id: str, key: str, request: Dict[str, Any]):
+        self.job_id = job_id
+        self.key = key
+        self.request = request
+        self.status = 'queued' # queued -> running -> done | error
+        self.progress: Tuple[int, int] = (0, 0)
+        self.error: Optional[str] = None
+        self.result: Optional[AnalysisResult] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_json(self, with_result: bool = True) -> Dict[str, Any]:
+        out = {'job_id': self.job_id, 'status': self.status, 'progress': list(self.progress),
+               'error': self.error, 'submitted': self.submitted, 'started': self.started,
+               'finished': self.finished}
+        if with_result and self.result is not None:
+            out['result'] = result_to_json(self.result)
+        return out
+
+
+class AnalysisService:
+    """
+    Job queue over a pool of AnalysisControllers sharing their caches. Usable in
+    process (submit / get); serve() exposes it over HTTP. The per-stage memory report
+    of a result is process-wide (src.memory.TRACKER), so it mixes concurrent jobs.
+    """
+
+    def __init__(self, bpg_path: str = 'bpg-0.9.8-win64', n_workers: int = 2, max_queued: int = 32,
+                 cache_max_mb: float = 1024, pipeline_memory_mb: float = 2048,
+                 pipeline_disk_dir: Optional[str] = None, max_jobs: int = 256, max_arrays_mb: float = 1024):
+        """
+        Args:
+            n_workers: Jobs run concurrently (one controller each).
+            max_queued: Submissions beyond this many waiting jobs are rejected.
+            cache_max_mb / pipeline_memory_mb / pipeline_disk_dir: Shared image cache and stage graph.
+            max_jobs: Finished jobs kept for retrieval (oldest dropped first).
+            max_arrays_mb: Byte budget of uploaded arrays (oldest dropped first).
+        """
+        self.image_cache = ImageCache(int(cache_max_mb * 1024 ** 2))
+        self.pipeline = Pipeline(pipeline_memory_mb, pipeline_disk_dir)
+        self.arrays: Dict[str, np.ndarray] = OrderedDict()
+        self.max_arrays_bytes = int(max_arrays_mb * 1024 ** 2)
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, Job] = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self.codec = BPGCodec(bpg_path)
+        self._controllers: queue.Queue = queue.Queue()
+        for _ in range(n_workers):
+            self._controllers.put(self._make_controller(bpg_path))
+        self.n_workers = n_workers
+        self._pool = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='analysis')
+
+    def _make_controller(self, bpg_path: str) -> AnalysisController:
+        ctrl = AnalysisController(bpg_path, cache_max_mb=0, pipeline_memory_mb=0)
+        # Shared state: codec, loaded images, stage memo, uploaded arrays
+        ctrl.codec = ctrl.runner.codec = self.codec
+        ctrl.image_cache = self.image_cache
+        ctrl.pipeline = self.pipeline
+        ctrl.runner.pipeline = self.pipeline
+        ctrl.arrays = self.arrays
+        return ctrl
+
+    # --- Inputs ---
+
+    def put_array(self, array: np.ndarray) -> str:
+        """Stores an uploaded input; the id is its content digest."""
+        array_id = fingerprint(array)
+        with self._lock:
+            if array_id in self.arrays:
+                self.arrays.move_to_end(array_id)
+                return array_id
+            self.arrays[array_id] = array
+            total = sum(a.nbytes for a in self.arrays.values())
+            while total > self.max_arrays_bytes and len(self.arrays) > 1:
+                _, dropped = self.arrays.popitem(last=False)
+                total -= dropped.nbytes
+        return array_id
+
+    # --- Jobs ---
+
+    def _job_key(self, request: Dict[str, Any]) -> str:
+        params = request['params']
+        stamps = []
+        if params.get('source_type') == 'file':
+            # An edited input file is a new job
+            stamps = [ImageCache.file_key(p) for p in (params.get('path_noised', ''), params.get('path_original', ''))
+                      if p and os.path.exists(p)]
+        return fingerprint(request, stamps)
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """
+        Queues a job: {'params': run_analysis arguments (JOB_PARAMS), plus optional
+        'precision', 'image_storage', 'gen_shape' and 'encoder' ({'sweep', 'final'}
+        bpgenc settings)}. An identical queued, running or finished job is returned
+        instead of a new one.
+        """
+        params = request.get('params', {})
+        unknown = sorted(set(params) - set(JOB_PARAMS)) + sorted(set(request) - set(JOB_SETTINGS) - {'params'})
+        if unknown:
+            raise ValueError(f"Unknown job fields: {unknown}")
+        if params.get('source_type') == 'array' and params.get('path_noised') not in self.arrays:
+            raise ValueError("Array input not found; upload it first (POST /arrays)")
+
+        key = self._job_key(request)
+        with self._lock:
+            existing = self.jobs.get(self._by_key.get(key, ''))
+            if existing is not None and existing.status != 'error':
+                return existing
+            if sum(j.status == 'queued' for j in self.jobs.values()) >= self.max_queued:
+                raise RuntimeError("Job queue is full")
+            job = Job(uuid.uuid4().hex[:12], key, request)
+            self.jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+            self._trim_jobs()
+        self._pool.submit(self._run, job)
+        return job
+
+    def _trim_jobs(self):
+        finished = [j for j in self.jobs.values() if j.status in ('done', 'error')]
+        for job in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self.jobs[job.job_id]
+            if self._by_key.get(job.key) == job.job_id: del self._by_key[job.key]
+
+    def _run(self, job: Job):
+        ctrl = self._controllers.get()
+        try:
+            job.status, job.started = 'running', time.time()
+            req = job.request
+            ctrl.precision = req.get('precision', 'float64')
+            ctrl.image_storage = req.get('image_storage', 'float32')
+            ctrl.gen_shape = tuple(req.get('gen_shape', (400, 400)))
+            encoder = req.get('encoder') or {}
+            ctrl.set_encoder(encoder.get('sweep'), encoder.get('final'))
+
+            def on_progress(done, total):
+                job.progress = (done, total)
+
+            job.result = ctrl.run_analysis(**req['params'], progress_callback=on_progress)
+            job.status = 'done'
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = 'error'
+        finally:
+            job.finished = time.time()
+            self._controllers.put(ctrl)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            n_arrays = len(self.arrays)
+        return {'jobs': counts, 'workers': self.n_workers, 'arrays': n_arrays,
+                'image_cache': self.image_cache.stats, 'pipeline': self.pipeline.stats}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- HTTP ---
+
+    def make_server(self, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args): # Quiet: one line per error only
+                pass
+
+            def _send(self, code: int, body: bytes, content_type: str = 'application/json'):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, code: int, value: Any):
+                self._send(code, json.dumps(value, default=_to_json).encode())
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def do_GET(self):
+                parts = [p for p in self.path.split('?')[0].split('/') if p]
+                if parts == ['health']:
+                    stats = service.stats
+                    return self._json(200, {'ok': True, 'workers': stats['workers'], 'jobs': stats['jobs']})
+                if parts == ['stats']:
+                    return self._json(200, service.stats)
+                if len(parts) in (2, 3) and parts[0] == 'jobs':
+                    job = service.get(parts[1])
+                    if job is None:
+                        return self._json(404, {'error': f"Unknown job {parts[1]}"})
+                    if len(parts) == 2:
+                        return self._json(200, job.to_json())
+                    if parts[2] == 'arrays':
+                        if job.result is None:
+                            return self._json(409, {'error': f"Job {job.job_id} is {job.status}"})
+                        return self._send(200, result_arrays(job.result), 'application/octet-stream')
+                self._json(404, {'error': f"Unknown path {self.path}"})
+
+            def do_POST(self):
+                parts = [p for p in self.path.split('?')[0].split('/') if p]
+                try:
+                    if parts == ['arrays']:
+                        array = np.load(io.BytesIO(self._body()), allow_pickle=False)
+                        return self._json(200, {'id': service.put_array(array)})
+                    if parts == ['jobs']:
+                        job = service.submit(json.loads(self._body() or b'{}'))
+                        return self._json(200, {'job_id': job.job_id, 'status': job.status})
+                except ValueError as e:
+                    return self._json(400, {'error': str(e)})
+                except RuntimeError as e:
+                    return self._json(503, {'error': str(e)})
+                self._json(404, {'error': f"Unknown path {self.path}"})
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8765):
+        """Serves until interrupted."""
+        server = self.make_server(host, port)
+        print(f"Analysis service on http://{host}:{server.server_port} ({self.n_workers} workers)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.shutdown()
+
+
+class AnalysisClient:
+    """
+    Client of an AnalysisService with the parts of the AnalysisController interface
+    that AnalysisUI uses (run_analysis, reselect_oop, last_result, set_encoder,
+    precision / image_storage / spill_dir, save_*), so the UI can run against it.
+    Live per-record callbacks are not available remotely; progress is polled.
+    """
+
+    def __init__(self, url: str = 'http://127.0.0.1:8765', poll_s: float = 0.5, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self.poll_s = poll_s
+        self.timeout = timeout
+        self.precision = 'float64'
+        self.image_storage = 'float32'
+        self.spill_dir: Optional[str] = None
+        self.gen_shape: Tuple[int, int] = (400, 400)
+        self.encoder: Dict[str, Optional[Dict[str, Any]]] = {'sweep': None, 'final': None}
+        self.last_result: Optional[AnalysisResult] = None
+        self._last_params: Optional[Dict[str, Any]] = None
+
+    # Result-only helpers work the same on a remote result
+    save_oop_image = AnalysisController.save_oop_image
+    save_results_csv = AnalysisController.save_results_csv
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 content_type: str = 'application/json') -> bytes:
+        req = urllib.request.Request(f"{self.url}{path}", data=body, method=method,
+                                     headers={'Content-Type': content_type} if body is not None else {})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise RuntimeError(f"Service error {e.code}: {message}") from None
+
+    def _get_json(self, path: str) -> Dict[str, Any]:
+        return json.loads(self._request('GET', path))
+
+    def health(self) -> Dict[str, Any]:
+        return self._get_json('/health')
+
+    def stats(self) -> Dict[str, Any]:
+        return self._get_json('/stats')
+
+    def upload(self, array: np.ndarray) -> str:
+        """Sends an input image; use the id as path_noised / path_original with source_type 'array'."""
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(array), allow_pickle=False)
+        return json.loads(self._request('POST', '/arrays', buf.getvalue(), 'application/octet-stream'))['id']
+
+    def set_encoder(self, sweep: Optional[Dict[str, Any]] = None, final: Optional[Dict[str, Any]] = None):
+        self.encoder = {'sweep': sweep, 'final': final}
+
+    def submit(self, **params) -> str:
+        """Queues run_analysis(**params) with this client's settings. Returns the job id."""
+        request = {'params': params, 'precision': self.precision, 'image_storage': self.image_storage,
+                   'gen_shape': list(self.gen_shape), 'encoder': self.encoder}
+        body = json.dumps(request, default=_to_json).encode()
+        return json.loads(self._request('POST', '/jobs', body))['job_id']
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        return self._get_json(f'/jobs/{job_id}')
+
+    def wait(self, job_id: str, progress_callback: Optional[Callable[[int, int], None]] = None,
+             timeout: Optional[float] = None) -> AnalysisResult:
+        """Polls until the job is done; raises RuntimeError if it failed."""
+        start = time.time()
+        while True:
+            status = self.status(job_id)
+            done, total = status['progress']
+            if progress_callback and total: progress_callback(done, total)
+            if status['status'] == 'done':
+                npz = self._request('GET', f'/jobs/{job_id}/arrays')
+                return result_from_payload(status['result'], npz, self.spill_dir)
+            if status['status'] == 'error':
+                raise RuntimeError(f"Job {job_id} failed: {status['error']}")
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError(f"Job {job_id} still {status['status']} after {timeout} s")
+            time.sleep(self.poll_s)
+
+    def run_analysis(self, source_type: str, noise_level: float, path_noised: str, path_original: str,
+                     vst_a: float, vst_b: float, q_start: int, q_end: int, q_step: int,
+                     oop_metric: str = 'psnr', early_stop_patience: int = 0,
+                     record_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                     progress_callback: Optional[Callable[[int, int], None]] = None,
+                     metric_mode: str = 'full', preview_fraction: float = 0.1,
+                     pre_filter: Optional[str] = None,
+                     filter_params: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+        """AnalysisController.run_analysis on the service (record_callback is not supported)."""
+        params = dict(source_type=source_type, noise_level=noise_level, path_noised=path_noised,
+                      path_original=path_original, vst_a=vst_a, vst_b=vst_b, q_start=q_start, q_end=q_end,
+                      q_step=q_step, oop_metric=oop_metric, early_stop_patience=early_stop_patience,
+                      metric_mode=metric_mode, preview_fraction=preview_fraction, pre_filter=pre_filter,
+                      filter_params=filter_params)
+        self._last_params = params
+        self.last_result = self.wait(self.submit(**params), progress_callback)
+        return self.last_result
+
+    def reselect_oop(self, oop_metric: str) -> AnalysisResult:
+        """Re-runs the last analysis for another OOP metric (the sweeps are memo hits on the service)."""
+        if self._last_params is None:
+            raise ValueError("No analysis to re-select from; call run_analysis first")
+        params = {**self._last_params, 'oop_metric': oop_metric}
+        self.last_result = self.wait(self.submit(**params))
+        return self.last_result
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local HTTP service running analyses with shared caches.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="Concurrent analysis jobs")
+    parser.add_argument('--max-queued', type=int, default=32, help="Waiting jobs before submissions are rejected")
+    parser.add_argument('--bpg-path', default='libbpg', help="Folder with bpgenc / bpgdec")
+    parser.add_argument('--cache-mb', type=float, default=1024, help="Shared image cache")
+    parser.add_argument('--pipeline-mb', type=float, default=2048, help="Shared stage memo")
+    parser.add_argument('--stage-dir', default=None, help="Persist stage outputs under this folder")
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help="Memory budget for the chunked stages (default: 2048)")
+    parser.add_argument('--metric-threads', type=int, default=None,
+                        help="Threads per PSNR-HVS-M call (default: cores / workers)")
+    args = parser.parse_args(argv)
+    if args.memory_budget_mb is not None:
+        from .memory import set_budget
+        set_budget(args.memory_budget_mb)
+    from .psnr_hvsm import set_metric_threads
+    # The worker threads share the cores: split them instead of multiplying
+    set_metric_threads(args.metric_threads or max(1, (os.cpu_count() or 1) // args.workers))
+
+    service = AnalysisService(args.bpg_path, n_workers=args.workers, max_queued=args.max_queued,
+                              cache_max_mb=args.cache_mb, pipeline_memory_mb=args.pipeline_mb,
+                              pipeline_disk_dir=args.stage_dir)
+    service.serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import uuid
+import weakref
+import numpy as np
+from typing import Optional
+
+# Storage modes for result images
+STORAGE_MODES = ('float64', 'float32', 'uint8')
+
+
+def _remove_spill(path: str):
+    try:
+        os.remove(path)
+    except OSError: # Already gone, or still mapped elsewhere (Windows)
+        pass
+
+
+class StoredImage:
+    """
+    Compact holder for a result image.
+    Pixels are kept as float32/float64 or as uint8 codes + a float LUT, either in
+    RAM or spilled to a .npy file that is re-opened as a read-only memmap. The spill
+    file is deleted by release(), or else when the image is garbage collected (e.g. a
+    replaced AnalysisResult) or at interpreter exit.
+    """
+
+    def __init__(self, codes: np.ndarray, lut: Optional[np.ndarray] = None, path: Optional[str] = None):
+        self.codes = codes
+        self.lut = lut
+        self.path = path
+        self._cleanup = weakref.finalize(self, _remove_spill, path) if path else None
+
+    @classmethod
+    def pack(cls, image: np.ndarray, mode: str = 'float32',
+             spill_dir: Optional[str] = None, name: str = 'image') -> 'StoredImage':
+        """
+        Args:
+            mode: 'float64' (as is), 'float32', or 'uint8'. 'uint8' is lossless and only
+                used when the image has at most 256 distinct values (e.g. decoded 8-bit
+                codec output, also after the inverse VST); otherwise float32 is kept.
+            spill_dir: If set, the pixels are written to <spill_dir>/<name>_<id>.npy
+                and memory-mapped instead of held in RAM.
+        """
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{mode}'. Use one of {STORAGE_MODES}")
+
+        lut = None
+        if mode == 'float64':
+            codes = image
+        elif mode == 'uint8':
+            values, inverse = np.unique(image, return_inverse=True)
+            if values.size <= 256:
+                lut = values.astype(np.float32)
+                codes = inverse.reshape(image.shape).astype(np.uint8)
+            else:
+                codes = image.astype(np.float32, copy=False)
+        else:
+            codes = image.astype(np.float32, copy=False)
+
+        path = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            path = os.path.join(spill_dir, f"{name}_{uuid.uuid4().hex[:8]}.npy")
+            np.save(path, codes)
+            codes = np.load(path, mmap_mode='r')
+
+        return cls(codes, lut, path)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in RAM (0 for the pixels of a spilled image)."""
+        lut_bytes = self.lut.nbytes if self.lut is not None else 0
+        return lut_bytes if self.path is not None else self.codes.nbytes + lut_bytes
+
+    def load(self) -> np.ndarray:
+        """Returns the pixels as a float array (LUT applied)."""
+        if self.lut is not None:
+            return self.lut[self.codes]
+        return np.asarray(self.codes)
+
+    def release(self):
+        """Drops the pixels and deletes the spill file, if any."""
+        self.path = None
+        self.codes = None
+        if self._cleanup is not None:
+            self._cleanup() # Runs once: the finalizer is then dead
@@ -1,5 +1,6 @@
 import numpy as np
 from .config import VSTConfig
+from .precision import float_dtype
 
 class VarianceStabilizer:
     def __init__(self, config: VSTConfig):
@@ -10,15 +11,18 @@ class VarianceStabilizer:
         Forward Transform: Linear -> Log domain.
         y = a * log_b(image)
         """
-        # Protect against zeros/negatives
-        img_safe = np.maximum(image, self.cfg.epsilon)
+        # Protect against zeros/negatives; computed in place, in the input's precision
+        out = np.maximum(image, self.cfg.epsilon, dtype=float_dtype(image))
+        np.log(out, out=out)
         # log_b(x) = ln(x) / ln(b)
-        return self.cfg.a * (np.log(img_safe) / np.log(self.cfg.b))
+        out /= np.log(self.cfg.b)
+        out *= self.cfg.a
+        return out
 
     def inverse(self, transformed_image: np.ndarray) -> np.ndarray:
         """
         Inverse Transform: Log -> Linear domain.
         x = b ^ (y / a)
         """
-        exponent = transformed_image / self.cfg.a
-        return np.power(self.cfg.b, exponent)
\ No newline at end of file
+        exponent = np.divide(transformed_image, self.cfg.a, dtype=float_dtype(transformed_image))
+        return np.power(self.cfg.b, exponent, out=exponent)
\ No newline at end of file
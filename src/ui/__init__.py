@@ -1 +1,6 @@
-from .main import AnalysisUI
+# AnalysisUI pulls in ipywidgets and matplotlib, so it is resolved on first access.
+def __getattr__(name):
+    if name == 'AnalysisUI':
+        from .main import AnalysisUI
+        return AnalysisUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
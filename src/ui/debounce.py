@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from typing import Any, Callable, Optional
+
+
+class Debouncer:
+    """
+    Coalesces rapid calls (e.g. widget `observe` events while a slider is dragged):
+    `func` runs once, `wait` seconds after the last call, with that call's arguments.
+    Inside a Jupyter kernel the call is scheduled on the kernel's event loop, so it runs
+    on the main thread like a normal widget callback; elsewhere a timer thread is used.
+    """
+
+    def __init__(self, func: Callable[..., Any], wait: float = 0.3):
+        self.func = func
+        self.wait = wait
+        self._handle = None
+        self._pending: Optional[tuple] = None
+
+    def __call__(self, *args, **kwargs):
+        self.cancel()
+        self._pending = (args, kwargs)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._handle = loop.call_later(self.wait, self.flush)
+        else:
+            self._handle = threading.Timer(self.wait, self.flush)
+            self._handle.daemon = True
+            self._handle.start()
+
+    def cancel(self):
+        """Drops the pending call, if any."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending = None
+
+    def flush(self):
+        """Runs the pending call now."""
+        pending, self._pending = self._pending, None
+        self._handle = None
+        if pending is not None:
+            args, kwargs = pending
+            self.func(*args, **kwargs)
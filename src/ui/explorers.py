@@ -0,0 +1,573 @@
+import os
+from typing import Optional, Tuple
+import ipywidgets as widgets
+from IPython.display import display, clear_output
+import matplotlib.pyplot as plt
+import numpy as np
+
+from ..cache import ImageCache
+from ..codec import BPGCodec
+from ..config import VSTConfig
+from ..data_loader import SyntheticGenerator, ImageLoader
+from ..experiments import RateDistortionRunner, _forward_stage, _inverse_stage, _encode_stage, _decode_stage
+from ..metrics import QualityMetrics
+from ..pipeline import Pipeline, StageRef
+from ..transform import VarianceStabilizer
+from ..vst_stats import VSTStats, verify_vst
+from .debounce import Debouncer
+from .plotters import display_factor
+
+# Interactive notebook apps (moved from sample_interactive.ipynb). Every step runs as a
+# node of a Pipeline, so moving one slider only recomputes what depends on it (e.g. a
+# VST change reuses the loaded image). Widget events go through a Debouncer, so a burst
+# of changes is coalesced and only the final state is computed.
+
+# --- Stage functions ---
+
+def _load_stage(path: str, stamp: Tuple) -> np.ndarray:
+    # stamp (mtime, size) only enters the key: an edited file is a new node
+    return ImageLoader.load_file(path)
+
+def _generate_stage(noise_level: float, draw: int) -> Tuple[np.ndarray, np.ndarray]:
+    # draw is bumped by the refresh buttons to get a new realization
+    return SyntheticGenerator.get_data(noise_level=noise_level)
+
+def _pick_stage(pair: Tuple[np.ndarray, np.ndarray], index: int) -> np.ndarray:
+    return pair[index]
+
+def _vst_stats_stage(img_noised: np.ndarray, img_clean: Optional[np.ndarray] = None, *,
+                     vst: VSTConfig) -> VSTStats:
+    return verify_vst(img_noised, vst, img_clean)
+
+def _bpg_metrics_stage(ref: np.ndarray, img_final: np.ndarray,
+                       img_log: np.ndarray, img_log_decoded: np.ndarray) -> dict:
+    return {
+        'psnr': QualityMetrics.compute_psnr(ref, img_final),
+        'ssim': QualityMetrics.compute_ssim(ref, img_final),
+        'log_psnr': QualityMetrics.compute_psnr(img_log, img_log_decoded),
+        'log_mse': np.mean((img_log - img_log_decoded) ** 2),
+    }
+
+
+def _file_node(pipe: Pipeline, path: str) -> Optional[StageRef]:
+    """'load' node for a file, or None if it does not exist."""
+    if not (os.path.exists(path) and os.path.isfile(path)):
+        return None
+    return pipe.stage('load', _load_stage, path=os.path.abspath(path), stamp=ImageCache.file_key(path))
+
+def _generated_nodes(pipe: Pipeline, noise_level: float, draw: int) -> Tuple[StageRef, StageRef]:
+    """(clean, noised) nodes of a synthetic image pair."""
+    pair = pipe.stage('generate', _generate_stage, noise_level=noise_level, draw=draw)
+    return pipe.stage('pick', _pick_stage, pair, index=0), pipe.stage('pick', _pick_stage, pair, index=1)
+
+
+class VSTExplorerApp:
+    def __init__(self, default_noised='data/NOISED.tiff', default_original='data/ORIGINAL.tiff',
+                 pipeline: Optional[Pipeline] = None, debounce_s: float = 0.3):
+        # --- State ---
+        self.default_noised = default_noised
+        self.default_original = default_original
+        self.pipeline = pipeline or Pipeline(max_memory_mb=256)
+        self.draw = 0
+        self.schedule_update = Debouncer(self.update, debounce_s)
+
+        # --- UI Initialization ---
+        self._init_widgets()
+        self._init_layout()
+
+    def _init_widgets(self):
+        style = {'description_width': 'initial'}
+
+        self.w_source = widgets.Dropdown(
+            options=[('Генератор (Simulation)', 'gen'), ('Файл (File)', 'file')],
+            value='gen', description='Джерело:', style=style
+        )
+
+        self.w_path = widgets.Text(
+            value=self.default_noised, placeholder='path/to/image.tiff',
+            description='Шлях:', style=style, layout=widgets.Layout(width='300px')
+        )
+
+        self.w_a = widgets.FloatSlider(value=8.39, min=1.0, max=20.0, step=0.1,
+                                     description='Param a:', style=style, continuous_update=False)
+        self.w_b = widgets.FloatSlider(value=1.2, min=1.05, max=5.0, step=0.05,
+                                     description='Param b:', style=style, continuous_update=False)
+
+        self.w_noise_gen = widgets.FloatSlider(value=0.25, min=0.01, max=1.0, step=0.01,
+                                             description='Gen Noise:', style=style, continuous_update=False)
+
+        # Оновлена кнопка: тепер вона називається "Оновити / Скинути"
+        self.btn_reset = widgets.Button(description='Force Refresh', icon='refresh', button_style='warning')
+        self.btn_reset.on_click(self.reset_params)
+
+        self.out_plot = widgets.Output()
+
+    def _init_layout(self):
+        row_ctrl = widgets.HBox([self.w_source, self.w_noise_gen, self.w_path])
+        row_params = widgets.HBox([self.w_a, self.w_b, self.btn_reset])
+
+        def on_mode_change(change):
+            mode = change['new']
+            if mode == 'gen':
+                self.w_path.layout.display = 'none'
+                self.w_noise_gen.layout.display = 'flex'
+            else:
+                self.w_path.layout.display = 'flex'
+                self.w_noise_gen.layout.display = 'none'
+
+        self.w_source.observe(on_mode_change, names='value')
+        on_mode_change({'new': self.w_source.value})
+
+        for w in [self.w_source, self.w_path, self.w_a, self.w_b, self.w_noise_gen]:
+            w.observe(self.schedule_update, names='value')
+
+        display(widgets.VBox([row_ctrl, row_params, self.out_plot]))
+        self.update()
+
+    def reset_params(self, b):
+        # 1. Скидаємо параметри VST на дефолтні
+        self.w_a.value = 8.39
+        self.w_b.value = 1.2
+
+        # 2. Нова реалізація генератора, файли перечитуються
+        self.draw += 1
+        self.pipeline.clear()
+
+        # 3. Викликаємо оновлення вручну (відкладені від слайдерів не потрібні)
+        self.schedule_update.cancel()
+        self.update()
+
+    def get_data_nodes(self) -> Tuple[Optional[StageRef], Optional[StageRef]]:
+        """(clean, noised) graph nodes for the current source; clean may be None."""
+        pipe = self.pipeline
+        if self.w_source.value == 'gen':
+            return _generated_nodes(pipe, self.w_noise_gen.value, self.draw)
+
+        path_in = self.w_path.value
+        noised = _file_node(pipe, path_in)
+        clean = _file_node(pipe, self.default_original)
+        if clean is None:
+            clean = _file_node(pipe, os.path.join(os.path.dirname(path_in), 'ORIGINAL.tiff'))
+        return clean, noised
+
+    def update(self, change=None):
+        pipe = self.pipeline
+        try:
+            clean, noised = self.get_data_nodes()
+            img_noised = noised.value if noised is not None else None
+            img_clean = clean.value if clean is not None else None
+        except Exception:
+            img_noised = img_clean = None
+
+        with self.out_plot:
+            clear_output(wait=True)
+            if img_noised is None:
+                print(f"File error: {self.w_path.value}")
+                return
+
+            config = VSTConfig(a=self.w_a.value, b=self.w_b.value)
+            # Statistics in one streaming pass over tiles (constant memory); the panels
+            # show a decimated view, which the pointwise transform maps exactly
+            has_ref = img_clean is not None and img_clean.shape == img_noised.shape
+            inputs = (noised, clean) if has_ref else (noised,)
+            stats = pipe.stage('vst_stats', _vst_stats_stage, *inputs, vst=config).value
+            f = display_factor(img_noised.shape)
+            img_view = np.asarray(img_noised[::f, ::f])
+            stab = VarianceStabilizer(config)
+            img_log_noised = stab.forward(img_view)
+            img_restored = stab.inverse(img_log_noised)
+
+            fig = plt.figure(figsize=(14, 8), constrained_layout=True)
+            gs = fig.add_gridspec(2, 2)
+
+            ax_in = fig.add_subplot(gs[0, 0])
+            ax_log = fig.add_subplot(gs[0, 1])
+            ax_out = fig.add_subplot(gs[1, 0])
+            ax_hist = fig.add_subplot(gs[1, 1])
+
+            vmin, vmax = np.percentile(img_view, 1), np.percentile(img_view, 99)
+
+            im0 = ax_in.imshow(img_view, cmap='gray', vmin=vmin, vmax=vmax)
+            ax_in.set_title(f"Input\nMin: {stats.input.min:.2f}, Max: {stats.input.max:.2f}")
+            plt.colorbar(im0, ax=ax_in, fraction=0.046)
+
+            im1 = ax_log.imshow(img_log_noised, cmap='viridis')
+            ax_log.set_title(f"Log Domain\nBlind Sigma: {stats.blind_sigma:.4f}")
+            plt.colorbar(im1, ax=ax_log, fraction=0.046)
+
+            im2 = ax_out.imshow(img_restored, cmap='gray', vmin=vmin, vmax=vmax)
+            ax_out.set_title(f"Restored\nMSE: {stats.restore_mse:.2e}")
+            plt.colorbar(im2, ax=ax_out, fraction=0.046)
+
+            if stats.residual is not None:
+                sigma_exact, fit = stats.exact_sigma, stats.gaussian_fit
+                edges, density = stats.residual_hist.trimmed()
+                ax_hist.stairs(density, edges, fill=True, alpha=0.6, color='dodgerblue', label='Actual')
+                x_axis = np.linspace(edges[0], edges[-1], 200)
+                mean_val = fit['mean']
+                pdf = (1 / (sigma_exact * np.sqrt(2 * np.pi))) * np.exp(-0.5 * ((x_axis - mean_val) / sigma_exact)**2)
+                ax_hist.plot(x_axis, pdf, 'r--', linewidth=2, label=rf'Gauss $\sigma={sigma_exact:.4f}$')
+                ax_hist.set_title(f"Noise Histogram\nskew {fit['skew']:.3f}, kurt {fit['kurtosis']:.3f}, KS {fit['ks']:.4f}")
+                ax_hist.legend()
+            else:
+                ax_hist.text(0.5, 0.5, "No Reference", ha='center')
+                ax_hist.axis('off')
+
+            plt.show()
+
+
+class BPGPipelineApp:
+    def __init__(self, bpg_path='bpg-0.9.8-win64', default_path='data/NOISED.tiff',
+                 pipeline: Optional[Pipeline] = None, debounce_s: float = 0.3):
+
+        # --- Config & State ---
+        self.bpg_path = bpg_path
+        if not os.path.exists(self.bpg_path):
+            print(f"⚠️ WARNING: BPG folder not found at '{self.bpg_path}'. Codec will fail.")
+
+        self.codec = BPGCodec(bpg_path)
+        self.pipeline = pipeline or Pipeline(max_memory_mb=256)
+        self.schedule_update = Debouncer(self.update, debounce_s)
+        self.default_original_path = 'data/ORIGINAL.tiff' # Guess path
+
+        # --- UI Initialization ---
+        self._init_widgets(default_path)
+        self._init_layout()
+
+    def _init_widgets(self, default_path):
+        s = {'description_width': 'initial'}
+
+        # Source Control
+        self.w_source = widgets.Dropdown(options=[('Generator', 'gen'), ('File', 'file')], value='gen', description='Source:', style=s)
+        self.w_path = widgets.Text(value=default_path, placeholder='path/to/image.tiff', layout=widgets.Layout(display='none'))
+        self.w_noise_gen = widgets.FloatSlider(value=0.25, min=0.01, max=1.0, step=0.01, description='Speckle Lvl:', style=s)
+
+        # VST Control
+        self.w_a = widgets.FloatSlider(value=8.39, min=1.0, max=20.0, step=0.1, description='VST a:', style=s)
+        self.w_b = widgets.FloatSlider(value=1.2, min=1.05, max=5.0, step=0.05, description='VST b:', style=s)
+
+        # BPG Control
+        # q=0 is lossless (usually), q=51 is worst
+        self.w_q = widgets.IntSlider(value=25, min=1, max=51, step=1, description='BPG Quantizer (q):', style=s, continuous_update=False)
+
+        self.out_plot = widgets.Output()
+
+    def _init_layout(self):
+        # Top Row: Data Source
+        r1 = widgets.HBox([self.w_source, self.w_noise_gen, self.w_path])
+
+        # Middle Row: Parameters
+        r2 = widgets.HBox([
+            widgets.VBox([widgets.HTML("<b>VST Parameters</b>"), self.w_a, self.w_b], layout=widgets.Layout(border='1px solid #ccc', padding='5px', margin='5px')),
+            widgets.VBox([widgets.HTML("<b>Codec Parameters</b>"), self.w_q], layout=widgets.Layout(border='1px solid #ccc', padding='5px', margin='5px'))
+        ])
+
+        # Events
+        self.w_source.observe(self._on_mode_change, names='value')
+        for w in [self.w_source, self.w_path, self.w_a, self.w_b, self.w_noise_gen, self.w_q]:
+            w.observe(self.schedule_update, names='value')
+
+        display(widgets.VBox([r1, r2, self.out_plot]))
+        self.update()
+
+    def _on_mode_change(self, change):
+        if change['new'] == 'gen':
+            self.w_path.layout.display = 'none'
+            self.w_noise_gen.layout.display = 'flex'
+        else:
+            self.w_path.layout.display = 'flex'
+            self.w_noise_gen.layout.display = 'none'
+
+    def get_data_nodes(self) -> Tuple[Optional[StageRef], Optional[StageRef]]:
+        """(clean, noised) graph nodes for the current source; clean may be None."""
+        if self.w_source.value == 'gen':
+            return _generated_nodes(self.pipeline, self.w_noise_gen.value, 0)
+        return (_file_node(self.pipeline, self.default_original_path),
+                _file_node(self.pipeline, self.w_path.value))
+
+    def update(self, change=None):
+        pipe = self.pipeline
+        try:
+            clean, noised = self.get_data_nodes()
+            img_noised = noised.value if noised is not None else None
+        except Exception:
+            img_noised = None
+
+        with self.out_plot:
+            clear_output(wait=True)
+            if img_noised is None:
+                print("No image data.")
+                return
+
+            q = self.w_q.value
+            # 1. Pipeline: Forward VST
+            cfg = VSTConfig(a=self.w_a.value, b=self.w_b.value)
+            log_node = pipe.stage('transform', _forward_stage, noised, vst=cfg)
+            img_log = log_node.value
+
+            # 2. Pipeline: BPG Compression (of the Log-Domain image!)
+            try:
+                stream = pipe.stage('encode', _encode_stage, log_node, codec=self.codec, q=q)
+                decoded = pipe.stage('decode', _decode_stage, stream, codec=self.codec)
+                img_log_decoded = decoded.value
+                f_size = stream.value.size_bytes
+                bpp = f_size * 8 / img_log.size
+            except Exception as e:
+                print(f"Codec Error: {e}")
+                print(f"Check if '{self.bpg_path}' exists and contains bpgenc.exe")
+                return
+
+            # 3. Pipeline: Inverse VST
+            final = pipe.stage('inverse', _inverse_stage, decoded, vst=cfg)
+            img_final = final.value
+
+            # 4. Metrics Calculation
+            # Calculate PSNR/SSIM relative to the CLEAN image (if available)
+            # or relative to the NOISED image (Input) if no clean ref exists (Reconstruction fidelity)
+            ref = clean if clean is not None else noised
+            ref_name = "Ground Truth" if clean is not None else "Noisy Input"
+            # Log-domain metrics show the pure compression artifacts
+            m = pipe.stage('metrics', _bpg_metrics_stage, ref, final, log_node, decoded).value
+
+            # --- Visualization ---
+            fig = plt.figure(figsize=(16, 6), constrained_layout=True)
+            gs = fig.add_gridspec(2, 4)
+
+            # A. Input (Noisy)
+            ax_in = fig.add_subplot(gs[0, 0])
+            vmin, vmax = np.percentile(img_noised, 1), np.percentile(img_noised, 99)
+            ax_in.imshow(img_noised, cmap='gray', vmin=vmin, vmax=vmax)
+            ax_in.set_title("1. Noisy Input\n(Multiplicative Noise)")
+
+            # B. VST Domain (Before Codec)
+            ax_vst = fig.add_subplot(gs[0, 1])
+            ax_vst.imshow(img_log, cmap='viridis')
+            ax_vst.set_title("2. VST (Log Domain)\nInput to Codec")
+
+            # C. VST Domain (After Codec) - Show Artifacts
+            ax_dec = fig.add_subplot(gs[1, 1])
+            ax_dec.imshow(img_log_decoded, cmap='viridis')
+            ax_dec.set_title(f"3. Decoded (Log)\nBPG q={q}, BPP={bpp:.3f}\nLog-MSE: {m['log_mse']:.4f}")
+
+            # D. Output (Final)
+            ax_out = fig.add_subplot(gs[0:2, 2])
+            ax_out.imshow(img_final, cmap='gray', vmin=vmin, vmax=vmax)
+            ax_out.set_title(f"4. Final Result (Inverse VST)\nComparing to {ref_name}")
+
+            # E. Metrics Panel (Text)
+            ax_txt = fig.add_subplot(gs[0:2, 3])
+            ax_txt.axis('off')
+            info = [
+                f"Codec: BPG (HEVC)",
+                f"Quantizer (q): {q}",
+                f"File Size: {f_size / 1024:.2f} KB",
+                f"Bit Rate: {bpp:.3f} bits/pixel",
+                "-"*20,
+                f"Reference: {ref_name}",
+                f"PSNR: {m['psnr']:.2f} dB",
+                f"SSIM: {m['ssim']:.4f}",
+                "-"*20,
+                f"Compression Quality (Log Domain):",
+                f"Log-PSNR: {m['log_psnr']:.2f} dB"
+            ]
+
+            y_pos = 0.9
+            for line in info:
+                ax_txt.text(0.1, y_pos, line, fontsize=12, fontfamily='monospace')
+                y_pos -= 0.08
+
+            plt.show()
+
+
+class RDAnalysisApp:
+    def __init__(self,
+                 path_noised: str,
+                 path_original: str,
+                 bpg_path: str = 'bpg-0.9.8-win64',
+                 pipeline: Optional[Pipeline] = None):
+
+        self.bpg_path = bpg_path
+        self.codec = BPGCodec(bpg_path)
+        self.pipeline = pipeline or Pipeline(max_memory_mb=512)
+        self.runner = RateDistortionRunner(self.codec)
+        self.runner.pipeline = self.pipeline
+
+        # Store default paths
+        self.default_noised = path_noised
+        self.default_original = path_original
+
+        self._init_ui()
+
+    def _init_ui(self):
+        s = {'description_width': 'initial'}
+
+        # --- 1. Data Source Controls ---
+        self.w_source = widgets.Dropdown(
+            options=[('Generator', 'gen'), ('Files', 'file')],
+            value='gen', description='Source:', style=s
+        )
+
+        # Generator Controls
+        self.w_noise = widgets.FloatSlider(value=0.25, min=0.01, max=1.0, step=0.01, description='Gen Noise:', style=s)
+
+        # File Controls (Now we have TWO inputs)
+        self.w_path_noised = widgets.Text(
+            value=self.default_noised,
+            placeholder='path/to/noised.png',
+            description='Noised Path:', style=s, layout=widgets.Layout(width='300px')
+        )
+        self.w_path_original = widgets.Text(
+            value=self.default_original,
+            placeholder='path/to/clean.png (Optional)',
+            description='Ref Path:', style=s, layout=widgets.Layout(width='300px')
+        )
+
+        # --- 2. VST Parameters ---
+        self.w_a = widgets.FloatSlider(value=8.39, min=1.0, max=20.0, description='a:', style=s)
+        self.w_b = widgets.FloatSlider(value=1.2, min=1.05, max=5.0, description='b:', style=s)
+
+        # --- 3. Experiment Settings ---
+        self.w_q_start = widgets.IntText(value=1, description='Q Start:', style=s, layout=widgets.Layout(width='120px'))
+        self.w_q_end = widgets.IntText(value=51, description='Q End:', style=s, layout=widgets.Layout(width='120px'))
+        self.w_q_step = widgets.IntText(value=1, description='Step:', style=s, layout=widgets.Layout(width='120px'))
+
+        # --- 4. Execution ---
+        self.btn_run = widgets.Button(description='Run Analysis', button_style='primary', icon='rocket')
+        self.btn_run.on_click(self.run_experiment)
+
+        self.prog_bar = widgets.IntProgress(value=0, min=0, max=100, bar_style='info', layout=widgets.Layout(width='300px'))
+        self.prog_bar.layout.visibility = 'hidden'
+
+        self.out_plot = widgets.Output()
+
+        # --- Layout Logic ---
+
+        # Grouping
+        src_box = widgets.VBox([
+            self.w_source,
+            self.w_noise,
+            widgets.HBox([self.w_path_noised, self.w_path_original])
+        ])
+        src_box.layout.border = '1px solid #ddd'
+        src_box.layout.padding = '10px'
+
+        param_box = widgets.HBox([self.w_a, self.w_b])
+        range_box = widgets.HBox([self.w_q_start, self.w_q_end, self.w_q_step])
+
+        # Visibility Handler
+        def on_src_change(change):
+            if change['new'] == 'gen':
+                self.w_path_noised.layout.display = 'none'
+                self.w_path_original.layout.display = 'none'
+                self.w_noise.layout.display = 'flex'
+            else:
+                self.w_path_noised.layout.display = 'flex'
+                self.w_path_original.layout.display = 'flex'
+                self.w_noise.layout.display = 'none'
+
+        self.w_source.observe(on_src_change, names='value')
+        on_src_change({'new': 'gen'}) # Init state
+
+        # Final Display
+        display(widgets.VBox([
+            widgets.HTML("<h3>BPG Rate-Distortion Pipeline</h3>"),
+            src_box,
+            widgets.Label("VST Params:"), param_box,
+            widgets.Label("Q Range:"), range_box,
+            widgets.HBox([self.btn_run, self.prog_bar]),
+            self.out_plot
+        ]))
+
+    def get_data(self):
+        """
+        Determines source and loads the pair through the 'generate' / 'load' nodes
+        (memoized, so rerunning with other VST or Q settings does not reload).
+        """
+        pipe = self.pipeline
+        if self.w_source.value == 'gen':
+            clean, noised = _generated_nodes(pipe, self.w_noise.value, 0)
+            return clean.value, noised.value
+        else:
+            # FILE MODE
+            try:
+                # 1. Load Noised (Mandatory)
+                noised = _file_node(pipe, self.w_path_noised.value)
+                if noised is None:
+                    raise FileNotFoundError(self.w_path_noised.value)
+                img_noised = noised.value
+
+                # 2. Load Original (Optional)
+                ref = _file_node(pipe, self.w_path_original.value)
+                img_ref = ref.value if ref is not None else None
+
+                return img_ref, img_noised
+            except Exception as e:
+                print(f"Data Load Error: {e}")
+                return None, None
+
+    def run_experiment(self, b):
+        self.btn_run.disabled = True
+        self.prog_bar.layout.visibility = 'visible'
+        self.out_plot.clear_output()
+
+        try:
+            img_ref, img_noised = self.get_data()
+            if img_noised is None: return
+
+            start, end, step = self.w_q_start.value, self.w_q_end.value, self.w_q_step.value
+            q_values = list(range(start, end + 1, step))
+
+            def cb(c, t): self.prog_bar.value = c; self.prog_bar.max = t
+
+            vst_cfg = VSTConfig(a=self.w_a.value, b=self.w_b.value)
+            res = self.runner.run_curve(img_ref, img_noised, vst_cfg, q_values, progress_callback=cb)
+
+            with self.out_plot:
+                fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+
+                # --- Plot 1: Standard Metrics ---
+                ax1 = axes[0]
+                l1, = ax1.plot(res['q'], res['psnr'], 'b-o', label='PSNR')
+                ax1.set_xlabel('Quantizer (q)')
+                ax1.set_ylabel('PSNR (dB)', color='b')
+                ax1.grid(True, alpha=0.3)
+
+                ax1_t = ax1.twinx()
+                l2, = ax1_t.plot(res['q'], res['ssim'], 'k--x', label='SSIM')
+                ax1_t.set_ylabel('SSIM', color='k')
+
+                ax1.set_title("Classic Metrics")
+                lines = [l1, l2]
+                ax1.legend(lines, [l.get_label() for l in lines], loc='upper right')
+
+                # --- Plot 2: HVS Metrics ---
+                ax2 = axes[1]
+                # Порівняння звичайного PSNR та HVS-версій
+                ax2.plot(res['q'], res['psnr'], 'b:', alpha=0.5, label='PSNR')
+                ax2.plot(res['q'], res['psnr_hvs'], 'g-^', label='PSNR-HVS')
+                ax2.plot(res['q'], res['psnr_hvsm'], 'r-s', label='PSNR-HVS-M')
+
+                ax2.set_xlabel('Quantizer (q)')
+                ax2.set_ylabel('dB')
+                ax2.set_title("Human Vision Metrics\n(HVS-M considers masking)")
+                ax2.grid(True, alpha=0.3)
+                ax2.legend()
+
+                # --- Plot 3: RD Curve ---
+                ax3 = axes[2]
+                ax3.plot(res['bpp'], res['psnr_hvsm'], 'r-o', label='PSNR-HVS-M')
+                ax3.plot(res['bpp'], res['psnr'], 'b--', alpha=0.5, label='PSNR')
+                ax3.set_xlabel('Bitrate (bpp)')
+                ax3.set_ylabel('Quality (dB)')
+                ax3.set_title("Rate-Distortion (HVS-M)")
+                ax3.legend()
+                ax3.grid(True, alpha=0.3)
+
+                plt.tight_layout()
+                plt.show()
+
+        except Exception as e:
+            with self.out_plot: print(f"Error: {e}")
+        finally:
+            self.btn_run.disabled = False
+            self.prog_bar.layout.visibility = 'hidden'
@@ -1,19 +1,64 @@
+import os
 from typing import Optional, Dict, Any
 import ipywidgets as widgets
 from IPython.display import display
 from .widgets import InputPanel
 from .plotters import MatplotlibPlotter
-from ..app_logic import AnalysisController
+from ..app_logic import AnalysisController, AnalysisResult
+from ..cache import ImageCache
 from ..config import AppConfig
+from ..memory import TRACKER, set_budget
+from ..psnr_hvsm import set_metric_threads
+from ..pipeline import fingerprint
+
+# Config fields each result depends on. Plots and exports are always redrawn from the
+# last result, so a change elsewhere (plotting, export flags) reuses it as is.
+RESULT_DEPENDENCIES = {
+    # Both Q sweeps (the expensive part)
+    'curves': ('data.source_type', 'data.path_noised', 'data.path_original', 'data.gen_noise_level',
+               'vst', 'experiment.q_start', 'experiment.q_end', 'experiment.q_step',
+               'experiment.early_stop_patience', 'experiment.metric_mode', 'experiment.preview_fraction',
+               'experiment.pre_filter', 'experiment.filter_params', 'experiment.precision',
+               'encoder.presets', 'encoder.sweep_preset'),
+    # OOP selection from the curves, OOP images and their storage
+    'oop': ('experiment.oop_metric', 'encoder.final_preset', 'export.image_storage', 'export.spill_images',
+            'export.results_dir'),
+}
+
+def config_signature(cfg: AppConfig, fields) -> str:
+    """Digest of the given dotted config fields."""
+    values = []
+    for path in fields:
+        value = cfg
+        for part in path.split('.'):
+            value = getattr(value, part)
+        values.append((path, value))
+    return fingerprint(values)
 
 class AnalysisUI:
-    def __init__(self, config: Optional[AppConfig] = None):
+    def __init__(self, config: Optional[AppConfig] = None, service_url: Optional[str] = None):
+        """
+        Args:
+            service_url: Run the analyses on an AnalysisService (src.service) instead of in
+                this kernel; defaults to config.service_url.
+        """
         if config is None:
             self.cfg = AppConfig()
         else:
             self.cfg = config
             
-        self.controller = AnalysisController(bpg_path=self.cfg.bpg_path)
+        service_url = service_url or self.cfg.service_url
+        if service_url:
+            # Same interface; the caches live in the service and are shared between clients
+            from ..service import AnalysisClient
+            self.controller = AnalysisClient(service_url)
+        else:
+            stage_dir = os.path.join(self.cfg.export.results_dir, 'cache', 'stages') if self.cfg.pipeline.disk_cache else None
+            self.controller = AnalysisController(bpg_path=self.cfg.bpg_path, cache_max_mb=self.cfg.data.cache_max_mb,
+                                                 pipeline_memory_mb=self.cfg.pipeline.max_memory_mb,
+                                                 pipeline_disk_dir=stage_dir,
+                                                 memory_budget_mb=self.cfg.memory.budget_mb)
+        self._apply_storage_config()
         self.panel = InputPanel(self.cfg)
         self.plotter = MatplotlibPlotter(self.cfg)
         
@@ -23,9 +68,13 @@ class AnalysisUI:
         # Button for manual plot saving removed as per request (auto-save preferred)
         # self.btn_save_plot = widgets.Button(description='Save Plots', button_style='info', icon='image')
         
+        # Signatures (see RESULT_DEPENDENCIES) of the config behind controller.last_result
+        self._signatures: Dict[str, str] = {}
+
         self.btn_run.on_click(self.on_run)
         self.btn_save_csv.on_click(self.on_save_csv)
-        
+        self.panel.btn_estimate_vst.on_click(self.on_estimate_vst)
+
         self.output = widgets.Output()
         self.prog_bar = widgets.IntProgress(value=0, min=0, max=100, layout=widgets.Layout(width='100%'))
         self.prog_bar.layout.visibility = 'hidden'
@@ -45,24 +94,39 @@ class AnalysisUI:
         
         # Get updated config from panel
         self.cfg = self.panel.get_config_update()
+        self._apply_storage_config()
         
+        def on_progress(done, total):
+            self.prog_bar.max = total
+            self.prog_bar.value = done
+
+        signatures = self._result_signatures(self.cfg)
+        stale = {name for name, sig in signatures.items() if self._signatures.get(name) != sig}
+        if self.controller.last_result is None:
+            stale.add('curves')
+
         try:
             with self.output:
-                res = self.controller.run_analysis(
-                    source_type=self.cfg.data.source_type,
-                    noise_level=self.cfg.data.gen_noise_level,
-                    path_noised=self.cfg.data.path_noised,
-                    path_original=self.cfg.data.path_original,
-                    vst_a=self.cfg.vst.a,
-                    vst_b=self.cfg.vst.b,
-                    q_start=self.cfg.experiment.q_start,
-                    q_end=self.cfg.experiment.q_end,
-                    q_step=self.cfg.experiment.q_step,
-                    oop_metric=self.cfg.experiment.oop_metric
-                )
+                if 'curves' in stale:
+                    res = self._run_sweeps(on_progress)
+                elif 'oop' in stale:
+                    print("Reusing the cached curves (only the OOP selection changed)")
+                    res = self.controller.reselect_oop(self.cfg.experiment.oop_metric)
+                else:
+                    print("Reusing the last result (no analysis parameter changed)")
+                    res = self.controller.last_result
+                self._signatures = signatures
                 
                 # Display DataFrame
-                display(res.metrics_df)
+                display(res.formatted_metrics())
+                if res.memory:
+                    display(res.memory_df.round(1))
+                for domain, oop in res.oop_points.items():
+                    if oop and 'sweep_file_size_kb' in oop:
+                        metric = res.oop_metric
+                        print(f"Final encode at the {domain} OOP: {oop['sweep_file_size_kb']:.2f} -> "
+                              f"{oop['file_size_kb']:.2f} kB, {metric} {oop.get(f'sweep_{metric}', float('nan')):.3f} -> "
+                              f"{oop.get(metric, float('nan')):.3f}")
                 
                 # Auto-Save Results if configured
                 if self.cfg.export.save_csv:
@@ -71,6 +135,7 @@ class AnalysisUI:
                 # Plot (will auto-save if configured)
                 self.plotter.plot_curves(res.curves, res.oop_points)
                 self.plotter.plot_error_maps(res)
+                self.plotter.plot_quality_maps(res)
                 
                 # Auto-Save OOP Image logic
                 if self.cfg.export.save_oop_images:
@@ -78,6 +143,7 @@ class AnalysisUI:
                     self.controller.save_oop_image(res, 'vst', self.cfg.export.results_dir)
         
         except Exception as e:
+            self._signatures = {}
             with self.output:
                 print(f"Error: {e}")
                 import traceback
@@ -86,6 +152,81 @@ class AnalysisUI:
             self.btn_run.disabled = False
             self.prog_bar.layout.visibility = 'hidden'
 
+    def _result_signatures(self, cfg: AppConfig) -> Dict[str, str]:
+        """Current signature per result (see RESULT_DEPENDENCIES)."""
+        signatures = {name: config_signature(cfg, fields) for name, fields in RESULT_DEPENDENCIES.items()}
+        data = cfg.data
+        if data.source_type == 'file':
+            # An edited input file invalidates the curves as well
+            stamps = [ImageCache.file_key(p) for p in (data.path_noised, data.path_original) if os.path.exists(p)]
+            signatures['curves'] = fingerprint(signatures['curves'], stamps)
+        if cfg.experiment.early_stop_patience:
+            # Early stopping brackets the OOP metric, so the curves depend on it too
+            signatures['curves'] = fingerprint(signatures['curves'], cfg.experiment.oop_metric)
+        return signatures
+
+    def _run_sweeps(self, on_progress) -> AnalysisResult:
+        """Full run_analysis with the current config."""
+        # Live curves: lines grow while the sweeps run. Only the in-kernel controller
+        # streams records (not the service client, nor a job queue); the others get the
+        # figure once the result is back.
+        on_record = None
+        streams = isinstance(self.controller, AnalysisController) and self.controller.job_queue is None
+        if self.cfg.plotting.live_plots and streams:
+            self.plotter.start_live_curves()
+            on_record = self.plotter.update_live_curves
+
+        return self.controller.run_analysis(
+            source_type=self.cfg.data.source_type,
+            noise_level=self.cfg.data.gen_noise_level,
+            path_noised=self.cfg.data.path_noised,
+            path_original=self.cfg.data.path_original,
+            vst_a=self.cfg.vst.a,
+            vst_b=self.cfg.vst.b,
+            q_start=self.cfg.experiment.q_start,
+            q_end=self.cfg.experiment.q_end,
+            q_step=self.cfg.experiment.q_step,
+            oop_metric=self.cfg.experiment.oop_metric,
+            early_stop_patience=self.cfg.experiment.early_stop_patience,
+            record_callback=on_record,
+            progress_callback=on_progress,
+            metric_mode=self.cfg.experiment.metric_mode,
+            preview_fraction=self.cfg.experiment.preview_fraction,
+            pre_filter=self.cfg.experiment.pre_filter,
+            filter_params=self.cfg.experiment.filter_params
+        )
+
+    def _apply_storage_config(self):
+        """Result image storage follows the export config; precision, memory budget and encoder presets their configs."""
+        export = self.cfg.export
+        self.controller.precision = self.cfg.experiment.precision
+        self.controller.image_storage = export.image_storage
+        self.controller.spill_dir = os.path.join(export.results_dir, 'cache') if export.spill_images else None
+        set_budget(self.cfg.memory.budget_mb)
+        set_metric_threads(self.cfg.experiment.metric_threads)
+        TRACKER.set_mode(self.cfg.memory.track)
+        enc = self.cfg.encoder
+        self.controller.set_encoder(enc.settings(enc.sweep_preset), enc.settings(enc.final_preset))
+
+    def on_estimate_vst(self, b):
+        """Sets Param a (for the current b) from the speckle statistics of the selected input."""
+        self.output.clear_output()
+        if not hasattr(self.controller, 'estimate_vst'):
+            with self.output: print("VST estimation runs locally only (not available through the service)")
+            return
+        self.cfg = self.panel.get_config_update()
+        self._apply_storage_config()
+        try:
+            est = self.controller.estimate_vst(self.cfg.data.source_type, self.cfg.data.gen_noise_level,
+                                               self.cfg.data.path_noised, self.cfg.data.path_original,
+                                               b=self.cfg.vst.b)
+            w_a = self.panel.w_a
+            w_a.min, w_a.max = min(w_a.min, est.vst.a), max(w_a.max, est.vst.a)
+            w_a.value = est.vst.a
+            with self.output: print(est.summary())
+        except Exception as e:
+            with self.output: print(f"Error: {e}")
+
     def on_save_csv(self, b):
         if self.controller.last_result:
             import os
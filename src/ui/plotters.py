@@ -3,24 +3,45 @@ from typing import Dict, Any, Optional
 import os
 from ..interfaces import PlotterInterface
 from ..config import AppConfig
+from ..memory import get_budget, track
+
+# Global Plotting Configuration (Requested by User)
+# Assuming defaults are around 10-12, we double them
+PLOT_STYLE = {
+    'font.size': 20,
+    'axes.titlesize': 20,
+    'axes.labelsize': 20,
+    'xtick.labelsize': 20,
+    'ytick.labelsize': 20,
+    'legend.fontsize': 20,
+    'figure.titlesize': 20,
+    'font.family': 'serif',
+    'font.serif': ['Times New Roman']
+}
+
+def display_factor(shape) -> int:
+    """
+    Decimation factor for showing an image of `shape`: the error maps and the rendered
+    figure need ~8 float64 buffers per pixel, so images beyond the memory budget are
+    shown (and mapped) at every n-th pixel. 1 = full resolution.
+    """
+    import math
+    n_pixels = int(shape[-2]) * int(shape[-1])
+    max_pixels = max(1, get_budget() // 64)
+    return max(1, math.ceil(math.sqrt(n_pixels / max_pixels)))
+
+
+def apply_plot_style():
+    """Applies the project font settings to matplotlib rcParams."""
+    plt.rcParams.update(PLOT_STYLE)
 
 class MatplotlibPlotter(PlotterInterface):
     def __init__(self, config: AppConfig):
         self.cfg = config
         
         # Increase font size globally for this plotter
-        # Assuming defaults are around 10-12, we double them
-        plt.rcParams.update({
-            'font.size': 20,
-            'axes.titlesize': 20,
-            'axes.labelsize': 20,
-            'xtick.labelsize': 20,
-            'ytick.labelsize': 20,
-            'legend.fontsize': 20,
-            'figure.titlesize': 20,
-            'font.family': 'serif',
-            'font.serif': ['Times New Roman']
-        })
+        apply_plot_style()
+        self._live = None
         
     def _save_plot(self, fig, filename: str):
         """Helper to save plot if enabled."""
@@ -39,9 +60,59 @@ class MatplotlibPlotter(PlotterInterface):
             fig.savefig(path, dpi=self.cfg.plotting.dpi, bbox_inches='tight')
             print(f"Saved plot: {path}")
 
+    # Curve panels: (metric key, title) in display order
+    CURVE_PANELS = [('psnr', "PSNR vs Q"), ('psnr_hvsm', "PSNR-HVS-M vs Q"), ('mse_codec', "Codec MSE (Log/Lin Domain)")]
+
+    def start_live_curves(self):
+        """
+        Opens the combined curve figure before the sweep starts.
+        Lines are then updated in place by update_live_curves as records arrive.
+        """
+        from IPython.display import display
+
+        colors = self.cfg.plotting.colors
+        markers = self.cfg.plotting.markers
+        fig, axes = plt.subplots(1, 3, figsize=self.cfg.plotting.figsize)
+
+        lines = {}
+        for ax, (key, title) in zip(axes, self.CURVE_PANELS):
+            for domain, label in [('linear', 'Linear'), ('vst', 'VST')]:
+                line, = ax.plot([], [], color=colors[domain], linestyle=markers[domain], label=label)
+                lines[(domain, key)] = line
+            ax.set_title(title)
+            ax.set_xlabel("Q")
+            ax.grid(True, alpha=0.3)
+            ax.legend()
+        plt.tight_layout()
+
+        self._live = {
+            'fig': fig,
+            'axes': dict(zip([k for k, _ in self.CURVE_PANELS], axes)),
+            'lines': lines,
+            'data': {d: {k: [] for k in ['q'] + [k for k, _ in self.CURVE_PANELS]} for d in ['linear', 'vst']},
+            'handle': display(fig, display_id=True) if self.cfg.plotting.show_plots else None,
+        }
+
+    def update_live_curves(self, domain: str, record: Dict[str, Any]):
+        """Appends one scored Q to the live figure without redrawing the axes."""
+        live = getattr(self, '_live', None)
+        if live is None: return
+
+        data = live['data'][domain]
+        data['q'].append(record['q'])
+        for key, ax in live['axes'].items():
+            data[key].append(record.get(key, float('nan')))
+            live['lines'][(domain, key)].set_data(data['q'], data[key])
+            ax.relim()
+            ax.autoscale_view()
+
+        if live['handle'] is not None:
+            live['handle'].update(live['fig'])
+
     def plot_curves(self, results: Dict[str, Any], oop_points: Dict[str, Any]):
         """
         Visualizes the rate-distortion curves and OOP.
+        If a live figure is open, the OOP markers are added to it in place.
         """
         res_lin = results['linear']
         res_vst = results['vst']
@@ -53,27 +124,26 @@ class MatplotlibPlotter(PlotterInterface):
         markers = self.cfg.plotting.markers
         figsize = self.cfg.plotting.figsize
         
-        # We create a single figure for notebook display
-        fig, axes = plt.subplots(1, 3, figsize=figsize)
-        
         # Helper to plot on axis
         def plot_psnr(ax):
             ax.plot(res_lin['q'], res_lin['psnr'], color=colors['linear'], linestyle=markers['linear'], label='Linear')
             ax.plot(res_vst['q'], res_vst['psnr'], color=colors['vst'], linestyle=markers['vst'], label='VST')
-            ax.scatter(oop_lin['q'], oop_lin['psnr'], s=150, c=colors['linear'], marker='*', label='OOP Linear')
-            ax.scatter(oop_vst['q'], oop_vst['psnr'], s=150, c=colors['vst'], marker='*', label='OOP VST')
+            plot_oop(ax, 'psnr')
             ax.set_title("PSNR vs Q")
             ax.set_xlabel("Q")
             ax.grid(True, alpha=0.3)
             ax.legend()
 
+        def plot_oop(ax, key):
+            if key in oop_lin: ax.scatter(oop_lin['q'], oop_lin[key], s=150, c=colors['linear'], marker='*', label='OOP Linear')
+            if key in oop_vst: ax.scatter(oop_vst['q'], oop_vst[key], s=150, c=colors['vst'], marker='*', label='OOP VST')
+
         def plot_hvsm(ax):
             has_hvsm = 'psnr_hvsm' in res_lin and len(res_lin['psnr_hvsm']) > 0
             if has_hvsm:
                 ax.plot(res_lin['q'], res_lin['psnr_hvsm'], color=colors['linear'], linestyle=markers['linear'], label='Linear')
                 ax.plot(res_vst['q'], res_vst['psnr_hvsm'], color=colors['vst'], linestyle=markers['vst'], label='VST')
-                ax.scatter(oop_lin['q'], oop_lin['psnr_hvsm'], s=150, c=colors['linear'], marker='*', label='OOP Linear')
-                ax.scatter(oop_vst['q'], oop_vst['psnr_hvsm'], s=150, c=colors['vst'], marker='*', label='OOP VST')
+                plot_oop(ax, 'psnr_hvsm')
                 ax.set_title("PSNR-HVS-M vs Q")
                 ax.legend() # Added Legend
             else:
@@ -92,14 +162,36 @@ class MatplotlibPlotter(PlotterInterface):
             ax.grid(True, alpha=0.3)
             ax.legend()
 
-        # 1. PSNR
-        plot_psnr(axes[0])
-        # 2. HVS-M
-        plot_hvsm(axes[1])
-        # 3. MSE Codec
-        plot_mse(axes[2])
-        
-        plt.tight_layout()
+        live = getattr(self, '_live', None)
+        self._live = None
+        if live is not None:
+            # Finalize the live figure: the lines take the final curves (the backend may not
+            # have streamed any records, e.g. a job queue or the service), then the OOPs
+            fig = live['fig']
+            for (domain, key), line in live['lines'].items():
+                res = results[domain]
+                if key in res: line.set_data(res['q'], res[key])
+            for key, ax in live['axes'].items():
+                ax.relim()
+                ax.autoscale_view()
+            for key in ['psnr', 'psnr_hvsm']:
+                ax = live['axes'][key]
+                plot_oop(ax, key)
+                ax.legend()
+            if live['handle'] is not None:
+                live['handle'].update(fig)
+        else:
+            # We create a single figure for notebook display
+            fig, axes = plt.subplots(1, 3, figsize=figsize)
+
+            # 1. PSNR
+            plot_psnr(axes[0])
+            # 2. HVS-M
+            plot_hvsm(axes[1])
+            # 3. MSE Codec
+            plot_mse(axes[2])
+
+            plt.tight_layout()
         
         # Save Combined (optional, but keep for consistency) or skip
         # self._save_plot(fig, "Curves_Combined")
@@ -125,7 +217,9 @@ class MatplotlibPlotter(PlotterInterface):
             self._save_plot(f3, "Plot_MSE")
             plt.close(f3)
 
-        if self.cfg.plotting.show_plots:
+        if live is not None:
+            plt.close(fig) # Already displayed through the live handle
+        elif self.cfg.plotting.show_plots:
             plt.show() # Display the combined one in notebook
         else:
             plt.close(fig)
@@ -145,8 +239,15 @@ class MatplotlibPlotter(PlotterInterface):
             print("OOP Images not available for error map plotting.")
             return
 
-        map_lin = QualityMetrics.compute_relative_error_map(ref, img_lin)
-        map_vst = QualityMetrics.compute_relative_error_map(ref, img_vst)
+        factor = display_factor(ref.shape)
+        if factor > 1:
+            from ..data_loader import decimate
+            print(f"Error maps shown at 1/{factor} resolution (memory budget).")
+            ref, img_lin, img_vst = (decimate(x, factor) for x in (ref, img_lin, img_vst))
+
+        with track('plot_error_maps'):
+            map_lin = QualityMetrics.compute_relative_error_map(ref, img_lin)
+            map_vst = QualityMetrics.compute_relative_error_map(ref, img_vst)
         
         # Notebook Display: Combined
         fig, axes = plt.subplots(1, 2, figsize=(14, 6))
@@ -188,3 +289,115 @@ class MatplotlibPlotter(PlotterInterface):
             plt.show()
         else:
             plt.close(fig)
+
+    def plot_quality_maps(self, result: Any, metric: str = 'psnr_hvsm'):
+        """
+        Plots the per-8x8-tile PSNR-HVS(-M) maps at the OOPs (computed with the metric itself).
+        Low values (dark) mark perceptually degraded blocks.
+        """
+        maps = getattr(result, 'quality_maps', {}) or {}
+        map_lin = maps.get('linear', {}).get(metric)
+        map_vst = maps.get('vst', {}).get(metric)
+
+        if map_lin is None or map_vst is None:
+            print(f"Quality maps ({metric}) not available for plotting.")
+            return
+
+        # Common color scale so the two methods are directly comparable
+        vmin = float(min(map_lin.min(), map_vst.min()))
+        vmax = float(max(map_lin.max(), map_vst.max()))
+        label = metric.upper().replace('_', '-')
+
+        def plot_map(ax, data, title, q):
+            im = ax.imshow(data, cmap='magma', vmin=vmin, vmax=vmax, interpolation='nearest')
+            ax.set_title(f"{title}\nQ={q}\n(per 8x8 block, mean {float(data.mean()):.2f} dB)")
+            ax.axis('off')
+            return im
+
+        fig, axes = plt.subplots(1, 2, figsize=(14, 6))
+        for ax, data, domain, name in [(axes[0], map_lin, 'linear', 'Standard'), (axes[1], map_vst, 'vst', 'VST')]:
+            im = plot_map(ax, data, f"{label} Map ({name})", result.oop_points[domain].get('q', '?'))
+            cb = fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+            cb.set_label(f'{label} (dB)')
+        plt.tight_layout()
+
+        if self.cfg.plotting.save_plots:
+            for data, domain, name, suffix in [(map_lin, 'linear', 'Standard', 'Linear'), (map_vst, 'vst', 'VST', 'VST')]:
+                f, a = plt.subplots(figsize=(8, 8))
+                plot_map(a, data, f"{label} Map ({name})", result.oop_points[domain].get('q', '?'))
+                self._save_plot(f, f"QualityMap_{suffix}")
+                plt.close(f)
+
+        if self.cfg.plotting.show_plots:
+            plt.show()
+        else:
+            plt.close(fig)
+
+    def plot_filter_comparison(self, result: Any, metric: Optional[str] = None):
+        """
+        Plots metric vs Q and metric vs bpp for every pipeline of a filter comparison
+        (plain linear, VST, and filter -> compress), with the OOPs as stars.
+        """
+        metric = metric or result.oop_metric
+        fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+        label = metric.upper().replace('_', '-')
+
+        for name, curve in result.curves.items():
+            if metric not in curve or len(curve[metric]) == 0: continue
+            style = self.cfg.plotting.markers.get(name, '-.')
+            color = self.cfg.plotting.colors.get(name)
+            line, = axes[0].plot(curve['q'], curve[metric], linestyle=style, color=color, label=name)
+            axes[1].plot(curve['bpp'], curve[metric], linestyle=style, color=line.get_color(), label=name)
+            oop = result.oop_points.get(name, {})
+            if metric in oop:
+                axes[0].scatter(oop['q'], oop[metric], s=150, color=line.get_color(), marker='*')
+                axes[1].scatter(oop['bpp'], oop[metric], s=150, color=line.get_color(), marker='*')
+
+        for ax, xlabel in [(axes[0], 'Q'), (axes[1], 'bpp')]:
+            ax.set_title(f"{label} vs {xlabel}")
+            ax.set_xlabel(xlabel)
+            ax.grid(True, alpha=0.3)
+            ax.legend()
+        plt.tight_layout()
+
+        self._save_plot(fig, f"FilterComparison_{metric}")
+        if self.cfg.plotting.show_plots:
+            plt.show()
+        else:
+            plt.close(fig)
+
+    def plot_pyramid_preview(self, result: Any, metric: Optional[str] = None):
+        """
+        Metric vs Q of a pyramid preview: the decimated full-range sweep (thin) and the
+        full-resolution refinement around the predicted OOP (markers), with the
+        confirmed OOPs as stars.
+        """
+        metric = metric or result.oop_metric
+        fig, ax = plt.subplots(figsize=(8, 5))
+        label = metric.upper().replace('_', '-')
+
+        for domain in ['linear', 'vst']:
+            color = self.cfg.plotting.colors.get(domain)
+            preview = result.preview_curves.get(domain, {})
+            refined = result.refined_curves.get(domain, {})
+            if metric in preview and len(preview[metric]):
+                ax.plot(preview['q'], preview[metric], linestyle=':', color=color, alpha=0.6,
+                        label=f"{domain} (1/{result.factor} preview)")
+            if metric in refined and len(refined[metric]):
+                ax.plot(refined['q'], refined[metric], linestyle='-', marker='o', color=color,
+                        label=f"{domain} (full resolution)")
+            oop = result.oop_points.get(domain, {})
+            if metric in oop:
+                ax.scatter(oop['q'], oop[metric], s=150, color=color, marker='*')
+
+        ax.set_title(f"{label} vs Q (pyramid preview)")
+        ax.set_xlabel('Q')
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+        plt.tight_layout()
+
+        self._save_plot(fig, f"PyramidPreview_{metric}")
+        if self.cfg.plotting.show_plots:
+            plt.show()
+        else:
+            plt.close(fig)
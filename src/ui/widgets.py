@@ -33,7 +33,9 @@ class InputPanel:
         # --- Tab 2: VST Params ---
         self.w_a = widgets.FloatSlider(value=config.vst.a, min=1.0, max=20.0, step=0.01, description='Param a:', style=s)
         self.w_b = widgets.FloatSlider(value=config.vst.b, min=1.05, max=5.0, step=0.05, description='Param b:', style=s)
-        self.container_vst = widgets.VBox([self.w_a, self.w_b])
+        self.btn_estimate_vst = widgets.Button(description='Estimate from Data', icon='magic',
+                                               tooltip='Fit a (for the current b) to the speckle statistics of the noised image')
+        self.container_vst = widgets.VBox([self.w_a, self.w_b, self.btn_estimate_vst])
 
         # --- Tab 3: Experiment ---
         self.w_q_start = widgets.IntText(value=config.experiment.q_start, description='Q Start:', style=s, layout=widgets.Layout(width='150px'))
@@ -47,9 +49,49 @@ class InputPanel:
             style=s
         )
         
+        self.w_metric_mode = widgets.Dropdown(
+            options=[('Full', 'full'), ('Preview (subsampled)', 'preview')],
+            value=config.experiment.metric_mode,
+            description='Metrics:',
+            style=s
+        )
+        self.w_precision = widgets.Dropdown(
+            options=[('float64 (reference)', 'float64'), ('float32 (half the memory)', 'float32')],
+            value=config.experiment.precision,
+            description='Precision:',
+            style=s
+        )
+        presets = list(config.encoder.presets)
+        self.w_sweep_preset = widgets.Dropdown(options=presets, value=config.encoder.sweep_preset,
+                                               description='Sweep Encoder:', style=s)
+        self.w_final_preset = widgets.Dropdown(options=presets, value=config.encoder.final_preset,
+                                               description='OOP Encoder:', style=s)
+        self.w_preview_fraction = widgets.FloatSlider(value=config.experiment.preview_fraction, min=0.01, max=1.0, step=0.01, description='Preview Fraction:', style=s)
+        
+        self.w_pre_filter = widgets.Dropdown(
+            options=[('None', 'none'), ('DCT (VST domain)', 'dct'), ('Lee', 'lee'), ('Enhanced Lee', 'enhanced_lee'),
+                     ('Kuan', 'kuan'), ('Frost', 'frost'), ('Non-local means (VST domain)', 'nlm')],
+            value=config.experiment.pre_filter,
+            description='Pre-filter:',
+            style=s
+        )
+        self.w_nlm_preset = widgets.Dropdown(
+            options=[('Fast', 'fast'), ('Balanced', 'balanced'), ('Quality', 'quality')],
+            value=config.experiment.filter_params.get('preset', 'balanced'),
+            description='NLM Preset:',
+            style=s
+        )
+        
+        self.w_early_stop = widgets.IntText(value=config.experiment.early_stop_patience, description='Early Stop (pts, 0=off):', style=s, layout=widgets.Layout(width='250px'))
+        
         self.container_exp = widgets.VBox([
             widgets.HBox([self.w_q_start, self.w_q_end, self.w_q_step]),
-            self.w_oop_metric
+            self.w_oop_metric,
+            widgets.HBox([self.w_metric_mode, self.w_preview_fraction]),
+            widgets.HBox([self.w_pre_filter, self.w_nlm_preset]),
+            self.w_precision,
+            widgets.HBox([self.w_sweep_preset, self.w_final_preset]),
+            self.w_early_stop
         ])
 
         # --- Tab 4: Export ---
@@ -91,6 +133,18 @@ class InputPanel:
         self.cfg.experiment.q_end = self.w_q_end.value
         self.cfg.experiment.q_step = self.w_q_step.value
         self.cfg.experiment.oop_metric = self.w_oop_metric.value
+        self.cfg.experiment.early_stop_patience = max(0, self.w_early_stop.value)
+        self.cfg.experiment.metric_mode = self.w_metric_mode.value
+        self.cfg.experiment.preview_fraction = self.w_preview_fraction.value
+        self.cfg.experiment.precision = self.w_precision.value
+        self.cfg.encoder.sweep_preset = self.w_sweep_preset.value
+        self.cfg.encoder.final_preset = self.w_final_preset.value
+        self.cfg.experiment.pre_filter = self.w_pre_filter.value
+        # Rebuilt every time: 'preset' is an NLM-only argument and must not leak into other filters
+        filter_params = {k: v for k, v in self.cfg.experiment.filter_params.items() if k != 'preset'}
+        if self.w_pre_filter.value == 'nlm':
+            filter_params['preset'] = self.w_nlm_preset.value
+        self.cfg.experiment.filter_params = filter_params
         
         self.cfg.plotting.save_plots = self.w_save_plots.value
         self.cfg.export.save_oop_images = self.w_save_oop_img.value
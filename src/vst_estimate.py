@@ -0,0 +1,130 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .config import VSTConfig
+from .memory import budget_rows
+
+# Noise-model fit for the VST. Speckle is multiplicative: var = k^2 * mean^2 on
+# homogeneous areas (k^2 = 1 / ENL for L-look intensity), which the log transform
+# turns into additive noise of std sqrt(trigamma(L)). The estimator reduces the image
+# to per-tile mean / variance in one vectorized pass, fits the variance-vs-mean power
+# law robustly (binned medians, so edges and texture do not pull it) and derives the
+# VST parameters and the sigma they give.
+#
+# Only c = a / ln(b) matters to the transform; b is kept and a is solved for c. Since
+# the codec normalizes its input to 8 bits by min / max, c is chosen to map
+# [epsilon, image max] onto [0, out_range] (the default a = 8.39, b = 1.2 is exactly
+# this for 8-bit data), or to reach a target stabilized sigma if one is given.
+
+# var ~ mean^p: how far p may be from 2 for the data to count as multiplicative
+EXPONENT_TOLERANCE = 0.35
+
+
+@dataclass
+class VSTEstimate:
+    vst: VSTConfig            # Recommended parameters
+    cv2: float                # k^2 = var / mean^2 on homogeneous tiles
+    looks: float              # Equivalent number of looks, 1 / k^2
+    exponent: float           # p of var ~ mean^p (2 = multiplicative)
+    sigma_log: float          # Expected std of ln(x): sqrt(trigamma(ENL))
+    stabilized_sigma: float   # Expected noise std after the recommended VST
+    n_tiles: int              # Tiles used in the fit
+    tile_mean: np.ndarray     # Per-tile statistics behind the fit (for plotting)
+    tile_var: np.ndarray
+
+    @property
+    def multiplicative(self) -> bool:
+        """Whether the data follow the multiplicative model the log VST assumes."""
+        return abs(self.exponent - 2.0) <= EXPONENT_TOLERANCE
+
+    def summary(self) -> str:
+        note = '' if self.multiplicative else ' (not multiplicative: the log VST may not stabilize it)'
+        return (f"VST a={self.vst.a:.3f}, b={self.vst.b:.3f}: ENL {self.looks:.2f}, var ~ mean^{self.exponent:.2f}{note}, "
+                f"stabilized sigma {self.stabilized_sigma:.3f} ({self.n_tiles} tiles)")
+
+
+def tile_stats(image: np.ndarray, tile: int = 8):
+    """
+    Per-tile mean, unbiased variance and minimum of the full tiles of an (H, W) image,
+    computed in row bands (one reshape + reduction per band, within the memory budget).
+    """
+    h, w = (image.shape[0] // tile) * tile, (image.shape[1] // tile) * tile
+    if h == 0 or w == 0:
+        raise ValueError(f"Image {image.shape} is smaller than one {tile}x{tile} tile")
+    step = budget_rows(w * 8 * 3, align=tile, fraction=0.1)
+    means, variances, minima = [], [], []
+    for r0 in range(0, h, step):
+        band = np.asarray(image[r0:min(h, r0 + step), :w], dtype=np.float64)
+        blocks = band.reshape(band.shape[0] // tile, tile, w // tile, tile)
+        means.append(blocks.mean(axis=(1, 3)).ravel())
+        variances.append(blocks.var(axis=(1, 3), ddof=1).ravel())
+        minima.append(blocks.min(axis=(1, 3)).ravel())
+    return np.concatenate(means), np.concatenate(variances), np.concatenate(minima)
+
+
+def _fit_exponent(mean: np.ndarray, var: np.ndarray, n_bins: int = 16, min_count: int = 8) -> float:
+    """Slope of log var vs log mean through per-bin medians (bins = quantiles of the mean)."""
+    lm, lv = np.log(mean), np.log(var)
+    edges = np.unique(np.quantile(lm, np.linspace(0, 1, n_bins + 1)))
+    if edges.size < 3: return math.nan # No spread of means to fit a slope on
+    idx = np.clip(np.searchsorted(edges, lm, side='right') - 1, 0, edges.size - 2)
+    xs, ys, ws = [], [], []
+    for i in range(edges.size - 1):
+        sel = idx == i
+        if np.count_nonzero(sel) < min_count: continue
+        xs.append(np.median(lm[sel])); ys.append(np.median(lv[sel])); ws.append(np.count_nonzero(sel))
+    if len(xs) < 2: return math.nan
+    return float(np.polyfit(xs, ys, 1, w=np.sqrt(ws))[0])
+
+
+def estimate_vst(image: np.ndarray, tile: int = 8, b: Optional[float] = None,
+                 epsilon: Optional[float] = None, target_sigma: Optional[float] = None,
+                 out_range: float = 255.0) -> VSTEstimate:
+    """
+    Fits the speckle model of a (noised, linear-domain) image and recommends VST parameters.
+    Args:
+        tile: Tile size of the mean / variance statistics.
+        b: Log base to keep (None = VSTConfig default); a is solved for it.
+        epsilon: Floor of the transform (None = VSTConfig default). Tiles touching it
+            are clipped and left out of the fit.
+        target_sigma: If set, a is chosen for this noise std after the VST instead of
+            mapping the data range onto [0, out_range].
+    """
+    from scipy.special import polygamma
+
+    defaults = VSTConfig()
+    b = defaults.b if b is None else b
+    epsilon = defaults.epsilon if epsilon is None else epsilon
+    if image.ndim != 2:
+        raise ValueError(f"Expected a 2-D image, got shape {image.shape}")
+
+    mean, var, tile_min = tile_stats(image, tile)
+    valid = (tile_min > epsilon) & (var > 0) & (mean > 0)
+    if np.count_nonzero(valid) < 16: # Mostly clipped data: use what is positive
+        valid = (var > 0) & (mean > 0)
+    if not np.any(valid):
+        raise ValueError("No tile with positive mean and variance to fit the noise model on")
+    m, v = mean[valid], var[valid]
+
+    # Multiplicative fit: median ratio (robust to textured tiles), corrected for the
+    # median of a chi-square sample variance with tile^2 - 1 degrees of freedom
+    dof = tile * tile - 1
+    cv2 = float(np.median(v / (m * m))) / (1 - 2 / (9 * dof)) ** 3
+    looks = 1.0 / cv2
+    sigma_log = math.sqrt(float(polygamma(1, looks)))
+
+    if target_sigma is not None:
+        c = target_sigma / sigma_log
+    else:
+        hi = float(np.max(image))
+        c = out_range / math.log(max(hi, epsilon * math.e) / epsilon)
+    a = c * math.log(b)
+
+    return VSTEstimate(
+        vst=VSTConfig(a=a, b=b, epsilon=epsilon),
+        cv2=cv2, looks=looks, exponent=_fit_exponent(m, v), sigma_log=sigma_log,
+        stabilized_sigma=c * sigma_log, n_tiles=int(m.size), tile_mean=m, tile_var=v,
+    )
@@ -0,0 +1,263 @@
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import VSTConfig
+from .memory import budget_rows
+from .transform import VarianceStabilizer
+
+# Streaming verification of the VST (the statistics behind the VSTExplorerApp panels).
+# The image is walked once in row tiles; each tile is transformed, restored and reduced
+# to running moments and fixed-bin histograms, so memory stays at a few tiles however
+# large the scene is. Moments are exact (merged in float64); quantities derived from a
+# histogram (blind sigma, KS distance) are exact up to the bin width.
+
+# Same 4-neighbour Laplacian as NoiseEstimator.estimate_blind_sigma; L2 norm sqrt(20)
+LAPLACIAN_NORM = math.sqrt(20.0)
+MAD_TO_SIGMA = 1.4826
+
+
+class RunningMoments:
+    """
+    Count, mean and central moments up to the 4th of a stream of batches, merged with
+    the pairwise update of Chan / Pébay (Welford generalized to batches), plus min / max.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = self.m3 = self.m4 = 0.0 # Sums of centred powers
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values: np.ndarray):
+        x = np.asarray(values).ravel()
+        if x.size == 0: return
+        nb = x.size
+        mb = float(x.mean(dtype=np.float64))
+        d = np.subtract(x, mb, dtype=np.float64)
+        d2 = np.square(d, dtype=np.float64)
+        m2b = float(d2.sum())
+        m3b = float(np.dot(d2, d))
+        m4b = float(np.dot(d2, d2))
+        self._merge(nb, mb, m2b, m3b, m4b)
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+
+    def merge(self, other: 'RunningMoments'):
+        if other.n == 0: return
+        self._merge(other.n, other.mean, other.m2, other.m3, other.m4)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _merge(self, nb: int, mb: float, m2b: float, m3b: float, m4b: float):
+        na = self.n
+        if na == 0:
+            self.n, self.mean, self.m2, self.m3, self.m4 = nb, mb, m2b, m3b, m4b
+            return
+        n = na + nb
+        delta = mb - self.mean
+        d_n = delta / n
+        m2a, m3a = self.m2, self.m3
+        self.m4 = (self.m4 + m4b + delta * d_n ** 3 * na * nb * (na * na - na * nb + nb * nb)
+                   + 6 * d_n ** 2 * (na * na * m2b + nb * nb * m2a) + 4 * d_n * (na * m3b - nb * m3a))
+        self.m3 = m3a + m3b + delta * d_n ** 2 * na * nb * (na - nb) + 3 * d_n * (na * m2b - nb * m2a)
+        self.m2 = m2a + m2b + delta * d_n * na * nb
+        self.mean += d_n * nb
+        self.n = n
+
+    @property
+    def var(self) -> float:
+        """Population variance (as np.var / np.std)."""
+        return self.m2 / self.n if self.n else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    @property
+    def skew(self) -> float:
+        return math.sqrt(self.n) * self.m3 / self.m2 ** 1.5 if self.m2 > 0 else math.nan
+
+    @property
+    def kurtosis(self) -> float:
+        """Excess kurtosis (0 for a Gaussian)."""
+        return self.n * self.m4 / self.m2 ** 2 - 3.0 if self.m2 > 0 else math.nan
+
+
+class StreamingHistogram:
+    """
+    Fixed-bin histogram accumulated with np.bincount. The range is given, or taken from
+    the first batch (median +- `span` robust sigmas); values outside it are counted in
+    underflow / overflow, so the CDF and central quantiles stay exact to the bin width.
+    """
+
+    def __init__(self, n_bins: int = 256, value_range: Optional[Tuple[float, float]] = None,
+                 span: float = 8.0):
+        self.n_bins = n_bins
+        self.span = span
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.lo, self.hi = value_range if value_range is not None else (None, None)
+
+    def _init_range(self, x: np.ndarray):
+        med = float(np.median(x))
+        sigma = MAD_TO_SIGMA * float(np.median(np.abs(x - med)))
+        if sigma > 0:
+            self.lo, self.hi = med - self.span * sigma, med + self.span * sigma
+        else:
+            lo, hi = float(x.min()), float(x.max())
+            pad = 0.5 * (hi - lo) or max(abs(lo), 1.0)
+            self.lo, self.hi = lo - pad, hi + pad
+
+    def add(self, values: np.ndarray):
+        x = np.asarray(values).ravel()
+        if x.size == 0: return
+        if self.lo is None: self._init_range(x)
+        idx = np.floor((x - self.lo) * (self.n_bins / (self.hi - self.lo)))
+        below, above = idx < 0, idx >= self.n_bins
+        self.underflow += int(np.count_nonzero(below))
+        self.overflow += int(np.count_nonzero(above))
+        inside = idx[~(below | above)].astype(np.intp)
+        self.counts += np.bincount(inside, minlength=self.n_bins)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.linspace(self.lo, self.hi, self.n_bins + 1)
+
+    def density(self) -> np.ndarray:
+        """Counts normalized to a pdf over all samples (out-of-range mass included in the total)."""
+        return self.counts / max(1, self.total) / ((self.hi - self.lo) / self.n_bins)
+
+    def cdf(self, x) -> np.ndarray:
+        """Empirical CDF at x, linear within bins."""
+        cum = np.concatenate([[self.underflow], self.underflow + np.cumsum(self.counts)])
+        return np.interp(x, self.edges, cum, left=0.0, right=self.total) / max(1, self.total)
+
+    def quantile(self, q: float) -> float:
+        cum = (self.underflow + np.concatenate([[0], np.cumsum(self.counts)])) / max(1, self.total)
+        return float(np.interp(q, cum, self.edges))
+
+    def mad(self) -> float:
+        """Median absolute deviation from the median, solved on the binned CDF."""
+        med = self.quantile(0.5)
+        lo, hi = 0.0, max(med - self.lo, self.hi - med)
+        for _ in range(60): # Bisection on P(|X - med| <= t) = 0.5
+            t = 0.5 * (lo + hi)
+            if self.cdf(med + t) - self.cdf(med - t) < 0.5: lo = t
+            else: hi = t
+        return 0.5 * (lo + hi)
+
+    def trimmed(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(edges, density) without the empty bins at either end, for plotting."""
+        nz = np.flatnonzero(self.counts)
+        if nz.size == 0: return self.edges, self.density()
+        a, b = nz[0], nz[-1] + 1
+        return self.edges[a:b + 1], self.density()[a:b]
+
+
+def _normal_cdf(x: np.ndarray, mean: float, std: float) -> np.ndarray:
+    return np.array([0.5 * (1.0 + math.erf((v - mean) / (std * math.sqrt(2.0)))) for v in x])
+
+
+@dataclass
+class VSTStats:
+    """Result of verify_vst. The residual fields are None without a clean reference."""
+    shape: Tuple[int, int]
+    input: RunningMoments                      # Linear-domain input
+    log: RunningMoments                        # Transformed image
+    blind_sigma: float                         # MAD estimate from the Laplacian of the log image
+    restore_mse: float                         # mean((input - inverse(forward(input)))^2)
+    residual: Optional[RunningMoments] = None  # log(noised) - log(clean)
+    residual_hist: Optional[StreamingHistogram] = None
+
+    @property
+    def exact_sigma(self) -> float:
+        """std of the log-domain residual (NoiseEstimator.calculate_exact_sigma), 0 without reference."""
+        return self.residual.std if self.residual is not None else 0.0
+
+    @property
+    def ks_distance(self) -> float:
+        """Kolmogorov-Smirnov distance of the residual to the fitted Gaussian (at the bin edges)."""
+        if self.residual is None or not self.residual.std > 0: return math.nan
+        edges = self.residual_hist.edges
+        return float(np.max(np.abs(self.residual_hist.cdf(edges)
+                                   - _normal_cdf(edges, self.residual.mean, self.residual.std))))
+
+    @property
+    def gaussian_fit(self) -> dict:
+        """Residual mean / sigma and deviations from normality (skew, excess kurtosis, KS)."""
+        if self.residual is None: return {}
+        return {'mean': self.residual.mean, 'sigma': self.residual.std, 'skew': self.residual.skew,
+                'kurtosis': self.residual.kurtosis, 'ks': self.ks_distance}
+
+
+def _laplacian(padded: np.ndarray) -> np.ndarray:
+    """4-neighbour Laplacian of the interior of a 1-pixel padded array."""
+    c = padded[1:-1, 1:-1]
+    return 4 * c - padded[:-2, 1:-1] - padded[2:, 1:-1] - padded[1:-1, :-2] - padded[1:-1, 2:]
+
+
+def verify_vst(noised: np.ndarray, vst: VSTConfig, clean: Optional[np.ndarray] = None,
+               tile_rows: Optional[int] = None, n_bins: int = 256, sigma_bins: int = 2048) -> VSTStats:
+    """
+    Statistics of the VST on `noised` in one pass over row tiles (arrays or memmaps).
+    Args:
+        clean: Reference of the same shape; enables the residual moments, histogram and
+            Gaussian fit (skew, kurtosis, KS distance).
+        tile_rows: Rows per tile (None = from the memory budget).
+        n_bins: Bins of the residual histogram.
+        sigma_bins: Bins of the Laplacian histogram behind the blind sigma estimate.
+    """
+    if noised.ndim != 2:
+        raise ValueError(f"Expected a 2-D image, got shape {noised.shape}")
+    if clean is not None and clean.shape != noised.shape:
+        clean = None # Same rule as the dashboard: a mismatched reference is ignored
+    h, w = noised.shape
+    stab = VarianceStabilizer(vst)
+    # ~12 tile-sized float64 temporaries per row (transform, padded halo, Laplacian, residual)
+    tile_rows = tile_rows or budget_rows((w + 2) * 8 * 12, fraction=0.1)
+
+    s_in, s_log = RunningMoments(), RunningMoments()
+    s_res = RunningMoments() if clean is not None else None
+    h_res = StreamingHistogram(n_bins) if clean is not None else None
+    h_hf = StreamingHistogram(sigma_bins)
+    sq_err = 0.0
+
+    for r0 in range(0, h, tile_rows):
+        r1 = min(h, r0 + tile_rows)
+        # One halo row each side for the Laplacian; 'symmetric' padding at the image border
+        # matches convolve2d(boundary='symm')
+        a, b = max(0, r0 - 1), min(h, r1 + 1)
+        log_halo = stab.forward(noised[a:b])
+        pad_top, pad_bottom = 1 - (r0 - a), 1 - (b - r1)
+        padded = np.pad(log_halo, ((pad_top, pad_bottom), (1, 1)), mode='symmetric')
+        h_hf.add(_laplacian(padded))
+
+        x = noised[r0:r1]
+        log_tile = log_halo[r0 - a:r0 - a + (r1 - r0)]
+        s_in.add(x)
+        s_log.add(log_tile)
+        restored = stab.inverse(log_tile)
+        np.subtract(restored, x, out=restored)
+        sq_err += float(np.square(restored, dtype=np.float64).sum())
+
+        if clean is not None:
+            res = stab.forward(clean[r0:r1])
+            np.subtract(log_tile, res, out=res)
+            s_res.add(res)
+            h_res.add(res)
+
+    return VSTStats(
+        shape=(h, w), input=s_in, log=s_log,
+        blind_sigma=MAD_TO_SIGMA * h_hf.mad() / LAPLACIAN_NORM,
+        restore_mse=sq_err / (h * w),
+        residual=s_res, residual_hist=h_res,
+    )